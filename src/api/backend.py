@@ -1,31 +1,54 @@
 """
 Backend module built in FastAPI
 """
+import asyncio
+import json
+import re
 import time
-import io
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import StreamingResponse, FileResponse
-import pandas as pd
-import boto3
-import os
-import subprocess
-from dotenv import load_dotenv
-import shutil
+import uuid
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 
 import sys
 import os
 
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)  # add src to PATH for the pipeline modules
+
+import snapshot
+import stats_store
+from args import DARGS
+from api import storage, streaming
+from api.jobs import DONE, FAILED, JobManager, JobQueueFull
+from api.result_cache import ResultCache, fingerprints
+
 # from ..format import Format
 
 
-# Amazon S3 Connection
-# load_dotenv()
-# access_key = os.getenv("AWS_ACCESS_KEY_ID")
-# secret_key = os.getenv("AWS_SECRET_ACCESS_KEY")
+# Amazon S3 Connection, or a local directory if HOOPTRACKER_STORAGE is set
 
-s3 = boto3.client("s3")
+store = storage.get_storage(DARGS)
+cache = ResultCache(store)
 
 app = FastAPI()
+jobs = JobManager.from_args(DARGS)
+
+
+@app.on_event("shutdown")
+def shutdown():
+    jobs.shutdown()
+
+
+FILE_NAME = re.compile(r"[\w-]+")
+"names /upload gives videos, which name their keys in storage"
+
+
+def check_file_name(file_name: str) -> None:
+    "Raises 400 unless file_name could be a name given by /upload"
+    if not FILE_NAME.fullmatch(file_name):
+        raise HTTPException(status_code=400, detail=f"bad file name {file_name}")
 
 
 # Root
@@ -37,102 +60,264 @@ async def root():
 @app.post("/upload")
 async def upload_file(video_file: UploadFile = File(...)):
     """
-    Upload video file to S3 bucket
+    Upload video file to storage
     """
-    file_name = time.strftime("%Y%m%d-%H%M%S")
+    # unique even for uploads in the same second
+    file_name = time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:8]
     try:
-        s3.upload_fileobj(video_file.file, "hooptracker-ops", file_name + ".mp4")
-        return {"message": file_name, "status": "success"}
+        sha256 = await store.aupload_fileobj(video_file.file, file_name + ".mp4")
+        await run_in_threadpool(cache.set_input, file_name, sha256)
+        return {"message": file_name, "status": "success", "sha256": sha256}
     except Exception as ex:
         raise HTTPException(status_code=500, detail=str(ex))
 
 
-@app.post("/process")
-async def process_file(file_name: str):
+@app.post("/process", status_code=202)
+async def process_file(file_name: str, response: Response):
+    """
+    Queues processing of an uploaded file, returns its job id at once; a
+    finished job if the same video was processed with the same settings
+    """
+    check_file_name(file_name)
+    cache_key = None
+    sha256 = await run_in_threadpool(cache.input_sha256, file_name)
+    if sha256 is not None:
+        _, process_fp = await run_in_threadpool(fingerprints, DARGS)
+        cache_key = f"{sha256}-{process_fp}"
+        outputs = await run_in_threadpool(cache.lookup_result, sha256, process_fp)
+        if outputs is not None:
+            await run_in_threadpool(cache.link, file_name, outputs)
+            job = jobs.complete(file_name, outputs, cache_key)
+            response.status_code = 200
+            return {
+                "message": f"{file_name} was already processed",
+                "status": job.status,
+                "job_id": job.id,
+            }
+    try:
+        job = jobs.submit(file_name, cache_key)
+    except JobQueueFull as ex:
+        raise HTTPException(status_code=503, detail=str(ex))
+    return {
+        "message": f"queued {file_name}",
+        "status": job.status,
+        "job_id": job.id,
+    }
+
+
+@app.get("/jobs")
+async def list_jobs():
+    """
+    Status of every job
+    """
+    return [job.todict() for job in jobs.list()]
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status, stage and progress of a job
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"no job {job_id}")
+    return job.todict()
+
+
+HEARTBEAT_SECONDS = 15
+"seconds between comments keeping an idle event stream open"
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
     """
-    runs main to process file
-    TODO change from local to cloud
+    Server-sent events of a job: the job on every change of its status, stage,
+    progress or outputs, until it is done or failed
     """
+    queue = jobs.watch(job_id)
+    if queue is None:
+        raise HTTPException(status_code=404, detail=f"no job {job_id}")
 
+    async def events():
+        try:
+            while True:
+                try:
+                    job = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+                if job["status"] in (DONE, FAILED):
+                    return
+        finally:
+            jobs.unwatch(job_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/download/{file_name}")
+def download_file(file_name: str):
+    """
+    Zip of the processed video and results of file_name, streamed from
+    storage while it is zipped
+    """
+    check_file_name(file_name)
+    outputs = cache.outputs(file_name)
+    if outputs is None:
+        raise HTTPException(status_code=404, detail=f"no results of {file_name}")
+    members = [
+        ("court_video_reenc-" + file_name + ".mp4", outputs.get("video"), False),
+        ("results-" + file_name + ".txt", outputs.get("results"), True),
+    ]
     try:
-        # create a data directory if it does not exist already
-        os.makedirs("data", exist_ok=True)
-
-        # create a tmp directory if it does not exist already
-        os.makedirs("tmp", exist_ok=True)
-
-        new_path = "data/" + file_name + ".mp4"
-
-        s3.download_file("hooptracker-ops", file_name + ".mp4", new_path)
-        command = ["python", "src/main.py", "--video_file", new_path]
-        subprocess.run(command)
-        results_path = "results-" + file_name + ".txt"
-        court_reenc_path = "court_video_reenc-" + file_name + ".mp4"
-        s3.upload_file("tmp/results.txt", "hooptracker-ops", results_path)
-        s3.upload_file("tmp/processed.mp4", "hooptracker-ops", court_reenc_path)
-        return {"message": f"successfully processed {file_name}", "status": "success"}
+        bodies = [(name, store.open(key), compress) for name, key, compress in members]
     except Exception as ex:
-        raise HTTPException(status_code=500, detail=str(ex))
+        raise HTTPException(status_code=404, detail=str(ex))
+    entries = (
+        (name, streaming.read_chunks(body), compress) for name, body, compress in bodies
+    )
+    return StreamingResponse(
+        streaming.zip_stream(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{file_name}.zip"'},
+    )
 
 
-@app.get("/download/{file_name}")
-async def download_file(file_name: str):
+def video_response(request: Request, size: int, open_range):
     """
-    Download video with file_name to download_path
+    Streamed mp4 answering the Range header of request
+    @param size, bytes of the video
+    @param open_range, (start, end) -> chunks of those bytes of the video
     """
     try:
-        print(file_name)
-        os.makedirs("tmp", exist_ok=True)
-        download_path_video = "tmp/court_video_reenc-" + file_name + ".mp4"
-        download_path_txt = "tmp/results-" + file_name + ".txt"
-
-        s3.download_file(
-            "hooptracker-ops",
-            "court_video_reenc-" + file_name + ".mp4",
-            download_path_video,
-        )
-        s3.download_file(
-            "hooptracker-ops", "results-" + file_name + ".txt", download_path_txt
+        byte_range = streaming.parse_range(request.headers.get("range"), size)
+    except ValueError as ex:
+        raise HTTPException(
+            status_code=416, detail=str(ex), headers={"Content-Range": f"bytes */{size}"}
         )
+    headers = {"Accept-Ranges": "bytes"}
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        (start, end), status = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        open_range(start, end), status_code=status, media_type="video/mp4", headers=headers
+    )
+
+
+def local_output(file_name: str, kind: str) -> str:
+    "Local copy of the output kind of file_name, downloaded once"
+    check_file_name(file_name)
+    key = (cache.outputs(file_name) or {}).get(kind)
+    if key is None:
+        raise HTTPException(status_code=404, detail=f"no {kind} of {file_name}")
+    # keys are content addressed, so a downloaded copy never goes stale
+    path = os.path.join(DARGS["api_job_dir"], "outputs", key.replace("/", "_"))
+    if not os.path.isfile(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}"
+        store.download_file(key, tmp)
+        os.replace(tmp, path)
+    return path
+
+
+def stats_response(path: str, player: str, start: float, end: float):
+    "Stats of the stats_store at path, filtered by player and time in seconds"
+    if start is not None and end is not None and end < start:
+        raise HTTPException(status_code=400, detail="end is before start")
+    return stats_store.query(path, player, start, end)
+
+
+@app.get("/results")
+def get_formatted_results(player: str = None, start: float = None, end: float = None):
+    """
+    Stats of the last local run
+    """
+    if not os.path.isfile(DARGS["stats_file"]):
+        raise HTTPException(status_code=404, detail=f"no {DARGS['stats_file']}")
+    return stats_response(DARGS["stats_file"], player, start, end)
 
-        temp_dir = "temporary"
-        os.makedirs(temp_dir, exist_ok=True)
 
-        print("downloaded files")
+@app.get("/results/{file_name}")
+def get_results(file_name: str, player: str = None, start: float = None, end: float = None):
+    """
+    Player, team, shot and possession stats of file_name, filtered by player
+    and by time in seconds
+    """
+    return stats_response(local_output(file_name, "stats"), player, start, end)
 
-        # # copy all the files to the temp directory
-        shutil.copy(download_path_video, temp_dir)
-        shutil.copy(download_path_txt, temp_dir)
 
-        # # zip the files
-        zip_path = "files.zip"
-        shutil.make_archive("files", "zip", temp_dir)
+MAX_FRAMES = 1024
+"frames served by one /frames request"
 
-        # clean up temporary directory
-        shutil.rmtree(temp_dir)
 
-        return FileResponse(
-            zip_path, media_type="application/zip", filename="files.zip"
+@app.get("/frames/{file_name}")
+def get_frames(file_name: str, start: int = 0, end: int = None):
+    """
+    Frames start to end (exclusive) of file_name from its state snapshot, as
+    columns of frames, players, ball candidates and possessions
+    """
+    end = start + MAX_FRAMES if end is None else end
+    if start < 0 or end < start or end - start > MAX_FRAMES:
+        raise HTTPException(
+            status_code=400, detail=f"0 <= start <= end <= start + {MAX_FRAMES}"
         )
-        # return {"message": "successfully downloaded", "status": "success"}
-    except Exception as ex:
-        raise HTTPException(status_code=500, detail=str(ex))
+    with snapshot.Snapshot(local_output(file_name, "snapshot")) as snap:
+        return {"frame_count": len(snap), **snap.todict(start, end)}
 
 
-@app.get("/results")
-async def get_formatted_results():
-    try:
-        return "PLACEHOLDER"
-    except Exception as ex:
-        raise HTTPException(status_code=500, detail=str(ex))
+@app.get("/trajectories/{file_name}")
+def get_trajectories(file_name: str):
+    """
+    Court trajectories of the players and the ball of file_name, as
+    [frameno, x, y] rows in meters
+    """
+    from state import Trajectories
+
+    return Trajectories.load(local_output(file_name, "trajectories")).todict()
 
 
 @app.get("/video")
-async def get_videos():
+def get_videos(request: Request):
     file_path = "tmp/minimap.mp4"
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail=f"no {file_path}")
+    return video_response(
+        request,
+        os.path.getsize(file_path),
+        lambda start, end: streaming.file_range(file_path, start, end),
+    )
+
+
+VIDEO_KEYS = {"processed": "video", "minimap": "minimap"}
+"kind of the outputs of a processed file of each video"
+
+
+@app.get("/video/{file_name}")
+def get_stored_video(request: Request, file_name: str, kind: str = "processed"):
+    """
+    Processed or minimap video of file_name from storage, with range support
+    """
+    check_file_name(file_name)
+    if kind not in VIDEO_KEYS:
+        raise HTTPException(status_code=400, detail=f"kind is one of {list(VIDEO_KEYS)}")
+    key = (cache.outputs(file_name) or {}).get(VIDEO_KEYS[kind])
+    try:
+        if key is None:
+            raise FileNotFoundError(f"no {kind} video of {file_name}")
+        size = store.size(key)
+    except Exception as ex:
+        raise HTTPException(status_code=404, detail=str(ex))
 
-    def iterfile():
-        with open(file_path, mode="rb") as file_like:
-            yield from file_like
+    def open_range(start, end):
+        if end < start:
+            return iter(())
+        return streaming.read_chunks(store.open(key, start, end))
 
-    return StreamingResponse(iterfile(), media_type="video/mp4")
+    return video_response(request, size, open_range)
@@ -0,0 +1,336 @@
+"""
+Job queue of the backend.
+
+/process submits a job and returns its id at once. A bounded pool of worker
+processes runs the pipelines: a job downloads its video from storage, runs
+main.main in its own output directory and uploads the results to the
+api.result_cache, reusing cached model outputs when only processing settings
+changed. Workers live as long as the server and keep a warm
+modelserver.ModelServer, so models are loaded once per worker instead of once
+per job. Workers send
+stage and frame progress through a queue, which a thread of the server applies
+to the jobs, so status requests never wait on a pipeline. Outputs finished
+before the rest, stats after the "stats" stage and the minimap after the
+"minimap" stage, are uploaded at once and listed in the outputs of the running
+job. watch follows changes of a job from an event loop, e.g. for /jobs/{id}/events.
+"""
+import asyncio
+import copy
+import multiprocessing as mp
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from api import storage
+from api.result_cache import RESULT_FILES, ResultCache, fingerprints
+from progress import fraction
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+PARTIAL_OUTPUTS = {"stats": ("stats", "snapshot"), "minimap": ("minimap",)}
+"outputs uploaded while the job runs, by the stage completing them"
+
+_WORKER = {}
+"progress queue, cores and warm models of the worker process, set by _init_worker"
+
+
+def _init_worker(events, job_cpus: int, warm: bool):
+    """
+    Process pool initializer, limits the threads of the worker to its cores
+    and loads the models if warm
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(job_cpus)
+    _WORKER.update(events=events, job_cpus=job_cpus, models=None)
+    if not warm:
+        return
+    try:
+        from modelserver import ModelServer
+
+        models = ModelServer()
+        models.warm()
+        _WORKER["models"] = models
+    except Exception as ex:
+        # jobs load their own models and report the error
+        print(f"Could not warm models: {type(ex).__name__}: {ex}")
+
+
+def _run_job(job_id: str, file_name: str, job_dir: str):
+    "Runs the pipeline of a job in a worker process, returns its result keys"
+    from args import DARGS, setup_args
+    from progress import Progress
+
+    events = _WORKER["events"]
+    events.put((job_id, RUNNING, None))
+
+    def report(stage, done, total):
+        events.put((job_id, "stage", (stage, done, total)))
+
+    os.makedirs(job_dir, exist_ok=True)
+    args = copy.deepcopy(DARGS)
+    store = storage.get_storage(args)
+    cache = ResultCache(store)
+    partial_outputs = {}
+
+    def upload_partial(stage):
+        "Uploads the outputs complete after stage, ahead of the cached result"
+        for kind in PARTIAL_OUTPUTS.get(stage, ()):
+            arg, name = RESULT_FILES[kind]
+            if os.path.isfile(args[arg]):
+                partial_outputs[kind] = f"jobs/{job_id}/{name}"
+                store.upload_file(args[arg], partial_outputs[kind])
+        if stage in PARTIAL_OUTPUTS:
+            cache.link(file_name, partial_outputs)
+            events.put((job_id, "outputs", dict(partial_outputs)))
+
+    try:
+        video_path = os.path.join(job_dir, file_name + ".mp4")
+        store.download_file(file_name + ".mp4", video_path)
+        sha256 = cache.input_sha256(file_name) or storage.file_sha256(video_path)
+        model_fp, process_fp = fingerprints(args)
+
+        # another job of the same video may have finished while this one waited
+        outputs = cache.lookup_result(sha256, process_fp)
+        if outputs is None:
+            from main import main
+
+            args.update(
+                video_file=video_path, output=job_dir, video_workers=_WORKER["job_cpus"]
+            )
+            setup_args(args)
+            cached_model = cache.fetch_model(sha256, model_fp, args)
+            args["skip_model"] = cached_model
+            main(args, Progress(report, upload_partial), models=_WORKER["models"])
+            if not cached_model:
+                cache.store_model(sha256, model_fp, args)
+            outputs = cache.store_result(sha256, process_fp, args)
+        cache.link(file_name, outputs)
+        return outputs
+    finally:
+        # everything worth keeping is in storage by now
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+class JobQueueFull(RuntimeError):
+    "Raised when too many jobs are waiting for a worker"
+
+
+class Job:
+    "Pipeline run of an uploaded video"
+
+    def __init__(self, file_name: str, cache_key: str = None) -> None:
+        self.id: str = uuid.uuid4().hex
+        self.file_name: str = file_name
+        "name of the uploaded video, without extension"
+        self.cache_key: str = cache_key
+        "video hash and settings fingerprint of the outputs, if known"
+        self.status: str = QUEUED
+        "queued, running, done or failed"
+        self.stage: str = None
+        "pipeline stage running, see progress.STAGE_WEIGHTS"
+        self.progress: float = 0.0
+        "fraction of the pipeline complete"
+        self.error: str = None
+        self.outputs: dict = {}
+        "storage keys of results, processed video, minimap and trajectories, as they finish"
+        self.created: float = time.time()
+        self.started: float = None
+        self.finished: float = None
+
+    def todict(self) -> dict:
+        return dict(self.__dict__)
+
+
+class JobManager:
+    """
+    Runs jobs in a pool of worker processes, at most workers at once
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        job_cpus: int = 1,
+        max_queued: int = 16,
+        job_root: str = os.path.join("tmp", "jobs"),
+        warm: bool = True,
+    ) -> None:
+        """
+        @param workers, pipelines run at once
+        @param job_cpus, cores of every pipeline
+        @param max_queued, jobs waiting for a worker before submit refuses more
+        @param job_root, directory of the output directory of every job
+        @param warm, whether workers keep models loaded between jobs
+        """
+        if os.getenv("HOOPTRACKER_STORAGE") == "memory://":
+            # every worker process would see an empty store of its own
+            raise ValueError(
+                "memory:// storage is per process, jobs need a directory or S3"
+            )
+        self.workers = workers
+        self.job_cpus = job_cpus
+        self.warm = warm
+        self.max_queued = max_queued
+        self.job_root = job_root
+        self._jobs: dict[str, Job] = {}
+        self._futures: dict = {}
+        "future of every queued or running job, by job id"
+        self._watchers: dict[str, list] = {}
+        "(event loop, asyncio.Queue) of every watch of a job"
+        self._lock = threading.Lock()
+        # models spawn their own processes and torch is not fork safe
+        self._context = mp.get_context("spawn")
+        self._events = self._context.Queue()
+        self._pool = self._new_pool()
+        self._pool_broken = False
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self._events, self.job_cpus, self.warm),
+        )
+
+    @staticmethod
+    def from_args(args: dict):
+        "JobManager splitting args['api_cpu_budget'] cores into pipelines of args['api_job_cpus']"
+        cpus = args["api_cpu_budget"] or os.cpu_count() or 1
+        job_cpus = min(args["api_job_cpus"] or cpus, cpus)
+        return JobManager(
+            workers=max(1, cpus // job_cpus),
+            job_cpus=job_cpus,
+            max_queued=args["api_max_queued"],
+            job_root=args["api_job_dir"],
+            warm=args["api_warm_models"],
+        )
+
+    def submit(self, file_name: str, cache_key: str = None) -> Job:
+        """
+        Queues the pipeline of uploaded video file_name, raises JobQueueFull
+        @param cache_key, if a queued or running job of file_name has the same,
+        it is returned instead, e.g. when /process is retried
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                retried = job.file_name == file_name and job.cache_key == cache_key
+                if cache_key and retried and job.status in (QUEUED, RUNNING):
+                    return job
+            queued = sum(job.status == QUEUED for job in self._jobs.values())
+            if queued >= self.max_queued:
+                raise JobQueueFull(f"{queued} jobs are already waiting")
+            job = Job(file_name, cache_key)
+            self._jobs[job.id] = job
+            if self._pool_broken:
+                # a worker died, e.g. out of memory, which fails the whole pool
+                self._pool.shutdown(wait=False)
+                self._pool, self._pool_broken = self._new_pool(), False
+        future = self._pool.submit(
+            _run_job, job.id, file_name, os.path.join(self.job_root, job.id)
+        )
+        with self._lock:
+            self._futures[job.id] = future
+        future.add_done_callback(partial(self._finish, job))
+        return job
+
+    def complete(self, file_name: str, outputs: dict, cache_key: str = None) -> Job:
+        "Records a job of file_name answered from the result cache"
+        job = Job(file_name, cache_key)
+        job.status, job.stage, job.progress, job.outputs = DONE, None, 1.0, outputs
+        job.started = job.finished = job.created
+        with self._lock:
+            self._jobs[job.id] = job
+            self._notify(job)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        "Job of job_id, or None"
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        "All jobs, oldest first"
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created)
+
+    def watch(self, job_id: str) -> asyncio.Queue:
+        """
+        Queue of the running event loop receiving job_id as a dict, now and
+        after every change, or None if there is no such job; see unwatch
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            self._watchers.setdefault(job_id, []).append((loop, queue))
+            queue.put_nowait(job.todict())
+        return queue
+
+    def unwatch(self, job_id: str, queue: asyncio.Queue) -> None:
+        "Stops sending changes of job_id to queue"
+        with self._lock:
+            watchers = self._watchers.get(job_id, [])
+            watchers[:] = [(loop, q) for loop, q in watchers if q is not queue]
+            if not watchers:
+                self._watchers.pop(job_id, None)
+
+    def _notify(self, job: Job) -> None:
+        "Sends job to its watchers, with the lock held"
+        for loop, queue in self._watchers.get(job.id, ()):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(queue.put_nowait, job.todict())
+
+    def shutdown(self) -> None:
+        "Stops taking jobs, cancels queued ones and waits for running ones"
+        with self._lock:
+            futures = list(self._futures.values())
+        # shutdown(cancel_futures=True) needs Python 3.9
+        for future in futures:
+            future.cancel()
+        self._pool.shutdown(wait=True)
+        self._events.put(None)
+        self._listener.join()
+
+    def _finish(self, job: Job, future) -> None:
+        with self._lock:
+            self._futures.pop(job.id, None)
+            job.finished = time.time()
+            if future.cancelled():
+                job.status, job.error = FAILED, "cancelled"
+            elif future.exception() is not None:
+                error = future.exception()
+                job.status, job.error = FAILED, f"{type(error).__name__}: {error}"
+                self._pool_broken |= isinstance(error, BrokenProcessPool)
+            else:
+                job.status, job.progress, job.outputs = DONE, 1.0, future.result()
+            self._notify(job)
+
+    def _listen(self) -> None:
+        "Applies progress events of the workers until a None event"
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            job_id, kind, payload = event
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job.status in (DONE, FAILED):
+                    continue
+                if kind == RUNNING:
+                    job.status, job.started = RUNNING, time.time()
+                elif kind == "outputs":
+                    job.outputs = payload
+                else:
+                    stage, done, total = payload
+                    # parts of a stage add to its total as they start, never go back
+                    progress = max(job.progress, fraction(stage, done, total))
+                    job.stage, job.progress = stage, progress
+                self._notify(job)
@@ -0,0 +1,189 @@
+"""
+Content-addressed cache of pipeline outputs in storage.
+
+Entries are keyed by the SHA-256 of the uploaded video, hashed while it is
+uploaded, and a fingerprint of everything else that shapes the outputs, at
+two levels so a change of processing settings still reuses the model outputs:
+
+    cache/model/<video>-<model fingerprint>/      people.txt ball.txt pose.txt
+    cache/result/<video>-<process fingerprint>/   results.txt processed.mp4
+                                                  minimap.mp4 trajectories.npz
+                                                  stats.db state.snap
+
+The model fingerprint covers the weights and detection settings, the process
+fingerprint covers the model fingerprint and every other setting. manifest.json
+is written last in every entry, so only complete entries are ever found.
+outputs/<file name>.json points an upload to the result entry it resolved to.
+"""
+import hashlib
+import io
+import json
+import os
+
+from api.storage import Storage, file_sha256
+
+CACHE_VERSION = 5
+
+MODEL_KEYS = (
+    "frame_reduction_factor",
+    "skip_motion",
+    "quantize",
+    "player_thres",
+    "pose_thres",
+    "skip_big",
+    "cls",
+)
+"settings of the models besides their weights"
+WEIGHT_KEYS = ("player_weights", "ball_weights", "pose_weights", "reid_weights")
+IGNORED_KEYS = (
+    "default_config",
+    "video_file",
+    "output",
+    "basename",
+    "people_file",
+    "ball_file",
+    "pose_file",
+    "minimap_file",
+    "processed_file",
+    "results_file",
+    "trajectory_file",
+    "stats_file",
+    "snapshot_file",
+    "model_videos",
+    "verbose",
+    "show_vid",
+    "save_vid",
+    "reid_cache",
+    "from_detections",
+    "court_cache",
+    "skip_model",
+    "video_workers",
+)
+"settings that name files or change speed only, left out of fingerprints"
+
+MODEL_FILES = {"people": "people_file", "ball": "ball_file", "pose": "pose_file"}
+"model outputs cached, by args key of their path"
+RESULT_FILES = {
+    "results": ("results_file", "results.txt"),
+    "video": ("processed_file", "processed.mp4"),
+    "minimap": ("minimap_file", "minimap.mp4"),
+    "trajectories": ("trajectory_file", "trajectories.npz"),
+    "stats": ("stats_file", "stats.db"),
+    "snapshot": ("snapshot_file", "state.snap"),
+}
+"processed outputs cached, by args key of their path and name in an entry"
+
+_DIGESTS = {}
+"sha256 of weight files by (path, size, mtime), weights are hashed once"
+
+
+def _weights_digest(path: str) -> str:
+    "sha256 of a weights file, or of its name if it does not exist"
+    if not os.path.isfile(path):
+        return hashlib.sha256(os.path.basename(path).encode()).hexdigest()
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _DIGESTS:
+        _DIGESTS[key] = file_sha256(path)
+    return _DIGESTS[key]
+
+
+def _digest(payload) -> str:
+    blob = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(blob).hexdigest()[:32]
+
+
+def fingerprints(args: dict):
+    """
+    Fingerprints of the settings of a run
+    @returns (model fingerprint, process fingerprint)
+    """
+    model = _digest(
+        {
+            "version": CACHE_VERSION,
+            "weights": {k: _weights_digest(str(args[k])) for k in WEIGHT_KEYS},
+            "params": {k: args[k] for k in MODEL_KEYS},
+        }
+    )
+    params = {
+        k: v
+        for k, v in args.items()
+        if k not in IGNORED_KEYS
+        and k not in WEIGHT_KEYS
+        and k not in MODEL_KEYS
+        and not k.startswith(("api_", "storage_", "batch_"))
+    }
+    return model, _digest({"model": model, "params": params})
+
+
+class ResultCache:
+    """
+    Model outputs and processed results of videos, in storage
+    """
+
+    def __init__(self, store: Storage) -> None:
+        self.store = store
+
+    def _read_json(self, key: str):
+        "Object key parsed as json, or None if it does not exist"
+        try:
+            body = self.store.open(key)
+        except FileNotFoundError:
+            return None
+        try:
+            return json.loads(body.read())
+        finally:
+            body.close()
+
+    def _write_json(self, key: str, value) -> None:
+        self.store.upload_fileobj(io.BytesIO(json.dumps(value).encode()), key)
+
+    def set_input(self, file_name: str, sha256: str) -> None:
+        "Records the SHA-256 of uploaded video file_name"
+        self._write_json(f"inputs/{file_name}.json", {"sha256": sha256})
+
+    def input_sha256(self, file_name: str) -> str:
+        "SHA-256 of uploaded video file_name, or None if it was not recorded"
+        record = self._read_json(f"inputs/{file_name}.json")
+        return None if record is None else record["sha256"]
+
+    def lookup_result(self, sha256: str, process_fp: str) -> dict:
+        "Storage keys of the cached outputs by kind, or None on a miss"
+        return self._read_json(f"cache/result/{sha256}-{process_fp}/manifest.json")
+
+    def store_result(self, sha256: str, process_fp: str, args: dict) -> dict:
+        "Uploads the outputs of a finished run of args, returns their keys by kind"
+        prefix = f"cache/result/{sha256}-{process_fp}/"
+        outputs = {}
+        for kind, (arg, name) in RESULT_FILES.items():
+            if os.path.isfile(args[arg]):
+                self.store.upload_file(args[arg], prefix + name)
+                outputs[kind] = prefix + name
+        self._write_json(prefix + "manifest.json", outputs)
+        return outputs
+
+    def fetch_model(self, sha256: str, model_fp: str, args: dict) -> bool:
+        "Downloads cached model outputs to the paths of args, returns whether there were any"
+        keys = self._read_json(f"cache/model/{sha256}-{model_fp}/manifest.json")
+        if keys is None:
+            return False
+        for kind, arg in MODEL_FILES.items():
+            self.store.download_file(keys[kind], args[arg])
+        return True
+
+    def store_model(self, sha256: str, model_fp: str, args: dict) -> None:
+        "Uploads the model outputs of a run of args"
+        prefix = f"cache/model/{sha256}-{model_fp}/"
+        keys = {}
+        for kind, arg in MODEL_FILES.items():
+            self.store.upload_file(args[arg], prefix + kind + ".txt")
+            keys[kind] = prefix + kind + ".txt"
+        self._write_json(prefix + "manifest.json", keys)
+
+    def link(self, file_name: str, outputs: dict) -> None:
+        "Points uploaded video file_name to its outputs"
+        self._write_json(f"outputs/{file_name}.json", outputs)
+
+    def outputs(self, file_name: str) -> dict:
+        "Storage keys of the outputs of file_name by kind, or None if it has none"
+        return self._read_json(f"outputs/{file_name}.json")
@@ -0,0 +1,365 @@
+"""
+Object storage of uploaded videos and processing results.
+
+get_storage picks the backend from HOOPTRACKER_STORAGE:
+    unset         S3, bucket HOOPTRACKER_BUCKET (default hooptracker-ops)
+    memory://     in-memory store of one process, for tests; JobManager
+                  refuses it since its workers are other processes
+    <directory>   local directory, to run without AWS
+
+Every upload streams the data through SHA-256 and returns the hex digest.
+S3 transfers go through one pooled client and run large files as concurrent
+multipart transfers, with S3 verifying SHA-256 checksums of every part.
+Local and in-memory stores keep the digest of each object and verify it on
+download. The a* methods run transfers in a thread pool for async handlers.
+"""
+import asyncio
+import hashlib
+import io
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+BUCKET = "hooptracker-ops"
+"default bucket of videos and results"
+CHUNK_SIZE = 1 << 20
+"bytes copied at a time"
+
+
+class ChecksumMismatch(IOError):
+    "Raised when a downloaded object does not match the digest it was stored with"
+
+
+class _HashingReader:
+    "Unseekable file object hashing everything read through it"
+
+    def __init__(self, fileobj) -> None:
+        self._fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+
+    def read(self, amt: int = -1) -> bytes:
+        data = self._fileobj.read(amt)
+        self.sha256.update(data)
+        return data
+
+
+class _RangeReader:
+    "File object reading at most length bytes of a file from start, like a boto3 Body"
+
+    def __init__(self, fileobj, start: int, length: int) -> None:
+        self._file = fileobj
+        self._file.seek(start)
+        self._left = length
+
+    def read(self, amt: int = None) -> bytes:
+        amt = self._left if amt is None or amt < 0 else min(amt, self._left)
+        data = self._file.read(amt)
+        self._left -= len(data)
+        return data
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def file_sha256(filename: str) -> str:
+    "SHA-256 hex digest of a local file"
+    sha256 = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for data in iter(partial(f.read, CHUNK_SIZE), b""):
+            sha256.update(data)
+    return sha256.hexdigest()
+
+
+class Storage:
+    """
+    Object store of videos and results, keyed by name
+    """
+
+    def __init__(self, threads: int = 8) -> None:
+        """
+        @param threads, transfers run at once by the a* methods
+        """
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+
+    def upload_fileobj(self, fileobj, key: str) -> str:
+        "Stores the rest of fileobj as key, returns its SHA-256 hex digest"
+        raise NotImplementedError
+
+    def upload_file(self, filename: str, key: str) -> str:
+        "Stores a local file as key, returns its SHA-256 hex digest"
+        with open(filename, "rb") as f:
+            return self.upload_fileobj(f, key)
+
+    def download_file(self, key: str, filename: str) -> None:
+        "Writes object key to a local file, raises FileNotFoundError"
+        raise NotImplementedError
+
+    def size(self, key: str) -> int:
+        "Bytes of object key, raises FileNotFoundError"
+        raise NotImplementedError
+
+    def open(self, key: str, start: int = 0, end: int = None):
+        """
+        Bytes start to end inclusive of object key, as a file object with
+        read(amt) and close(); raises FileNotFoundError
+        """
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.size(key)
+            return True
+        except FileNotFoundError:
+            return False
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(fn, *args)
+        )
+
+    async def aupload_fileobj(self, fileobj, key: str) -> str:
+        return await self._run(self.upload_fileobj, fileobj, key)
+
+    async def aupload_file(self, filename: str, key: str) -> str:
+        return await self._run(self.upload_file, filename, key)
+
+    async def adownload_file(self, key: str, filename: str) -> None:
+        return await self._run(self.download_file, key, filename)
+
+    async def asize(self, key: str) -> int:
+        return await self._run(self.size, key)
+
+
+class S3Storage(Storage):
+    """
+    Objects in an S3 bucket
+    """
+
+    def __init__(
+        self,
+        bucket: str = BUCKET,
+        threads: int = 8,
+        pool_connections: int = 32,
+        multipart_threshold: int = 64 << 20,
+        multipart_chunksize: int = 16 << 20,
+        max_concurrency: int = 10,
+    ) -> None:
+        """
+        @param bucket, name of the bucket
+        @param pool_connections, HTTP connections kept open by the client
+        @param multipart_threshold, bytes above which files go in parts
+        @param multipart_chunksize, bytes of every part
+        @param max_concurrency, parts of a file transferred at once
+        """
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        super().__init__(threads)
+        self.bucket = bucket
+        # clients are thread safe, one shares its connection pool across transfers
+        self._client = boto3.session.Session().client(
+            "s3",
+            config=Config(
+                max_pool_connections=pool_connections,
+                retries={"max_attempts": 5, "mode": "adaptive"},
+            ),
+        )
+        self._transfer = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True,
+        )
+
+    def upload_fileobj(self, fileobj, key: str) -> str:
+        reader = _HashingReader(fileobj)
+        self._client.upload_fileobj(
+            reader,
+            self.bucket,
+            key,
+            ExtraArgs={"ChecksumAlgorithm": "SHA256"},
+            Config=self._transfer,
+        )
+        return reader.sha256.hexdigest()
+
+    def upload_file(self, filename: str, key: str) -> str:
+        # parts of a file on disk are read concurrently, unlike a stream
+        self._client.upload_file(
+            filename,
+            self.bucket,
+            key,
+            ExtraArgs={"ChecksumAlgorithm": "SHA256"},
+            Config=self._transfer,
+        )
+        return file_sha256(filename)
+
+    def download_file(self, key: str, filename: str) -> None:
+        self.size(key)  # FileNotFoundError before the transfer starts
+        self._client.download_file(
+            self.bucket,
+            key,
+            filename,
+            ExtraArgs={"ChecksumMode": "ENABLED"},
+            Config=self._transfer,
+        )
+
+    def size(self, key: str) -> int:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self._client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except ClientError as ex:
+            if ex.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                raise FileNotFoundError(f"no object {key} in {self.bucket}")
+            raise
+
+    def open(self, key: str, start: int = 0, end: int = None):
+        from botocore.exceptions import ClientError
+
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        try:
+            return self._client.get_object(Bucket=self.bucket, Key=key, Range=byte_range)[
+                "Body"
+            ]
+        except ClientError as ex:
+            if ex.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                raise FileNotFoundError(f"no object {key} in {self.bucket}")
+            raise
+
+
+class LocalStorage(Storage):
+    """
+    Objects as files under a directory, with a .sha256 file next to each
+    """
+
+    def __init__(self, root: str, threads: int = 8) -> None:
+        super().__init__(threads)
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        "Path of key, raises ValueError if it leads outside of root"
+        root = os.path.realpath(self.root)
+        path = os.path.realpath(os.path.join(root, key))
+        if os.path.commonpath([root, path]) != root or path == root:
+            raise ValueError(f"key {key} is outside of {self.root}")
+        return path
+
+    def _existing(self, key: str) -> str:
+        path = self._path(key)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"no object {key} in {self.root}")
+        return path
+
+    def upload_fileobj(self, fileobj, key: str) -> str:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        reader = _HashingReader(fileobj)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(reader, f, CHUNK_SIZE)
+        os.replace(tmp, path)
+        digest = reader.sha256.hexdigest()
+        with open(path + ".sha256", "w") as f:
+            f.write(digest)
+        return digest
+
+    def download_file(self, key: str, filename: str) -> None:
+        path = self._existing(key)
+        shutil.copyfile(path, filename)
+        if os.path.isfile(path + ".sha256"):
+            with open(path + ".sha256", "r") as f:
+                expected = f.read().strip()
+            if file_sha256(filename) != expected:
+                raise ChecksumMismatch(f"{key} does not match its stored checksum")
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self._existing(key))
+
+    def open(self, key: str, start: int = 0, end: int = None):
+        path = self._existing(key)
+        size = os.path.getsize(path)
+        end = size - 1 if end is None else min(end, size - 1)
+        return _RangeReader(open(path, "rb"), start, max(end - start + 1, 0))
+
+
+class MemoryStorage(Storage):
+    """
+    Objects in a dictionary of this process
+    """
+
+    def __init__(self, threads: int = 8) -> None:
+        super().__init__(threads)
+        self._objects: dict[str, bytes] = {}
+        self._digests: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _existing(self, key: str) -> bytes:
+        with self._lock:
+            if key not in self._objects:
+                raise FileNotFoundError(f"no object {key} in memory")
+            return self._objects[key]
+
+    def upload_fileobj(self, fileobj, key: str) -> str:
+        reader = _HashingReader(fileobj)
+        data = b"".join(iter(partial(reader.read, CHUNK_SIZE), b""))
+        digest = reader.sha256.hexdigest()
+        with self._lock:
+            self._objects[key], self._digests[key] = data, digest
+        return digest
+
+    def download_file(self, key: str, filename: str) -> None:
+        data = self._existing(key)
+        if hashlib.sha256(data).hexdigest() != self._digests[key]:
+            raise ChecksumMismatch(f"{key} does not match its stored checksum")
+        with open(filename, "wb") as f:
+            f.write(data)
+
+    def size(self, key: str) -> int:
+        return len(self._existing(key))
+
+    def open(self, key: str, start: int = 0, end: int = None):
+        data = self._existing(key)
+        end = len(data) - 1 if end is None else min(end, len(data) - 1)
+        return _RangeReader(io.BytesIO(data), start, max(end - start + 1, 0))
+
+
+_STORAGE = {}
+"storage of this process by HOOPTRACKER_STORAGE, see get_storage"
+_STORAGE_LOCK = threading.Lock()
+
+
+def get_storage(args: dict = None) -> Storage:
+    """
+    Storage of this process from HOOPTRACKER_STORAGE, created once
+    @param args, storage_* transfer settings, config.yaml defaults if None
+    """
+    root = os.getenv("HOOPTRACKER_STORAGE", "")
+    with _STORAGE_LOCK:
+        if root not in _STORAGE:
+            _STORAGE[root] = _new_storage(root, args)
+        return _STORAGE[root]
+
+
+def _new_storage(root: str, args: dict) -> Storage:
+    if args is None:
+        from args import DARGS
+
+        args = DARGS
+    threads = args["storage_threads"]
+    if not root:
+        storage = S3Storage(
+            os.getenv("HOOPTRACKER_BUCKET", BUCKET),
+            threads=threads,
+            pool_connections=args["storage_pool_connections"],
+            multipart_threshold=args["storage_multipart_threshold_mb"] << 20,
+            multipart_chunksize=args["storage_multipart_chunk_mb"] << 20,
+            max_concurrency=args["storage_max_concurrency"],
+        )
+    elif root == "memory://":
+        storage = MemoryStorage(threads)
+    else:
+        storage = LocalStorage(root, threads)
+    return storage
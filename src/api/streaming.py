@@ -0,0 +1,98 @@
+"""
+Streaming responses of the backend.
+
+Zips are built while they are sent and videos are served in byte ranges, so
+outputs are never copied on disk or held whole in memory.
+"""
+import io
+import re
+import zipfile
+
+CHUNK_SIZE = 1 << 20
+"bytes read from storage at a time"
+
+
+class _ChunkSink(io.RawIOBase):
+    "Unseekable stream collecting what zipfile writes until it is taken"
+
+    def __init__(self) -> None:
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def read_chunks(body, chunk_size: int = CHUNK_SIZE):
+    "Bytes of a file object with read(amt), chunk by chunk, closing it at the end"
+    try:
+        while True:
+            data = body.read(chunk_size)
+            if not data:
+                return
+            yield data
+    finally:
+        body.close()
+
+
+def zip_stream(entries):
+    """
+    Zip file of entries, generated chunk by chunk
+    @param entries, (name, chunks, compress) of every member: chunks an iterable
+    of its bytes, and compress whether to deflate it (not worth it for videos)
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w") as zf:
+        for name, chunks, compress in entries:
+            info = zipfile.ZipInfo(name)
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            with zf.open(info, "w", force_zip64=True) as member:
+                for data in chunks:
+                    member.write(data)
+                    yield sink.take()
+    yield sink.take()
+
+
+def parse_range(header: str, size: int):
+    """
+    First byte range of an HTTP Range header
+    @returns (start, end) inclusive, None without a header, or raises ValueError
+    if the range can't be satisfied
+    """
+    if not header:
+        return None
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*(,.*)?", header)
+    if match is None:
+        raise ValueError(f"bad range {header}")
+    first, last = match.group(1), match.group(2)
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:  # suffix range, the last bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        raise ValueError(f"bad range {header}")
+    if start >= size or start > end:
+        raise ValueError(f"range {header} outside of {size} bytes")
+    return start, end
+
+
+def file_range(path: str, start: int, end: int, chunk_size: int = CHUNK_SIZE):
+    "Bytes start to end inclusive of a local file, chunk by chunk"
+    with open(path, "rb") as f:
+        f.seek(start)
+        left = end - start + 1
+        while left > 0:
+            data = f.read(min(chunk_size, left))
+            if not data:
+                return
+            left -= len(data)
+            yield data
@@ -13,15 +13,19 @@ def _set_filepaths(args):
     args["minimap_file"] = os.path.join(
         args["output"], args["basename"] + "minimap.mp4"
     )
-    args["minimap_temp_file"] = os.path.join(
-        args["output"], args["basename"] + "minimap_temp.mp4"
-    )
     args["processed_file"] = os.path.join(
         args["output"], args["basename"] + "processed.mp4"
     )
     args["results_file"] = os.path.join(
         args["output"], args["basename"] + "results.txt"
     )
+    args["stats_file"] = os.path.join(args["output"], args["basename"] + "stats.db")
+    args["snapshot_file"] = os.path.join(
+        args["output"], args["basename"] + "state.snap"
+    )
+    args["trajectory_file"] = os.path.join(
+        args["output"], args["basename"] + "trajectories.npz"
+    )
 
 
 def setup_args(args) -> None:
@@ -0,0 +1,324 @@
+"""
+Batch processing module
+
+Runs the pipeline over every video of a directory or a manifest (a text file
+with one video path per line, # starts a comment) in a pool of worker
+processes. Workers keep a warm modelserver.ModelServer between videos, so
+models load once per worker instead of once per video.
+
+Every video gets an output directory under --output, with a checkpoint.json
+recording the stages it finished. A rerun of an interrupted batch skips
+finished videos and reuses the model outputs of videos stopped while
+processing; either is redone if the video or the settings it depends on
+changed. batch_report.json in the output directory sums up the throughput.
+
+    python src/batch.py --input data/season --output tmp/season --workers 2
+"""
+import argparse
+import copy
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+from api.result_cache import fingerprints
+from args import DARGS, setup_args
+from progress import STAGE_WEIGHTS, Progress
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".wmv", ".avi", ".flv", ".mkv")
+CHECKPOINT = "checkpoint.json"
+"stages a video finished, in its output directory"
+REPORT = "batch_report.json"
+"throughput of a batch, in the output directory"
+
+_WORKER = {}
+"warm models of the worker process, set by _init_worker"
+
+
+def find_videos(source: str) -> list:
+    "Videos in directory source and its subdirectories, or listed in manifest file source"
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in names
+            if name.lower().endswith(VIDEO_EXTENSIONS)
+        )
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, "r") as f:
+        lines = [line.split("#", 1)[0].strip() for line in f]
+    return [os.path.join(base, line) for line in lines if line]
+
+
+def output_dirs(videos: list, root: str) -> list:
+    "Output directory of every video, named after its path below their common folder"
+    if not videos:
+        return []
+    paths = [os.path.abspath(video) for video in videos]
+    common = os.path.dirname(paths[0]) if len(paths) == 1 else os.path.commonpath(paths)
+    # extensions stay in the names, game.mp4 and game.mov are different videos
+    names = [os.path.relpath(path, common).replace(os.sep, "_") for path in paths]
+    # flattened paths can collide, a/b_c.mp4 and a_b/c.mp4 are both a_b_c.mp4
+    taken = set()
+    for i, name in enumerate(names):
+        n = 1
+        while names[i] in taken:
+            n += 1
+            names[i] = f"{name}_{n}"
+        taken.add(names[i])
+    return [os.path.join(root, name) for name in names]
+
+
+def _load_checkpoint(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_checkpoint(path: str, checkpoint: dict) -> None:
+    "Writes checkpoint to path, atomically so an interrupted write keeps the last one"
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _init_worker(job_cpus: int, warm: bool):
+    """
+    Process pool initializer, limits the threads of the worker to its cores
+    and loads the models if warm
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(job_cpus)
+    _WORKER.update(job_cpus=job_cpus, models=None)
+    if not warm:
+        return
+    try:
+        from modelserver import ModelServer
+
+        models = ModelServer()
+        models.warm()
+        _WORKER["models"] = models
+    except Exception as ex:
+        # videos load their own models and report the error
+        print(f"Could not warm models: {type(ex).__name__}: {ex}")
+
+
+def _process(video: str, output: str, args: dict) -> dict:
+    """
+    Runs the pipeline of video into output in a worker process, resuming
+    from its checkpoint
+    @returns report of the video: status, frames, seconds and seconds per stage
+    """
+    args = copy.deepcopy(args)
+    args.update(video_file=video, output=output, video_workers=_WORKER["job_cpus"])
+    setup_args(args)
+    os.makedirs(output, exist_ok=True)
+
+    model_fp, process_fp = fingerprints(args)
+    stat = os.stat(video)
+    identity = {
+        "video": os.path.abspath(video),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+    }
+    path = os.path.join(output, CHECKPOINT)
+    last = _load_checkpoint(path)
+    same_video = all(last.get(k) == v for k, v in identity.items())
+    report = {"video": video, "output": output, "frames": _frame_count(video)}
+    if same_video and last.get("process") == process_fp and last.get("done"):
+        return {**report, "status": "skipped", "seconds": 0.0, "stages": {}}
+
+    resume = (
+        same_video and last.get("model") == model_fp and "model" in last.get("stages", ())
+    )
+    checkpoint = {
+        **identity,
+        "model": model_fp,
+        "process": process_fp,
+        "stages": ["model"] if resume else [],
+        "done": False,
+    }
+    _save_checkpoint(path, checkpoint)
+
+    started, seconds = {}, {}
+
+    def update(stage, done, total):
+        started.setdefault(stage, time.time())
+
+    def finish(stage):
+        seconds[stage] = time.time() - started.get(stage, time.time())
+        checkpoint["stages"].append(stage)
+        _save_checkpoint(path, checkpoint)
+
+    from main import main  # only once there is something to process
+
+    args["skip_model"] = args["skip_model"] or resume
+    start = time.time()
+    main(args, Progress(update, finish), models=_WORKER["models"])
+    checkpoint["done"] = True
+    _save_checkpoint(path, checkpoint)
+    return {
+        **report,
+        "status": "resumed" if resume else "done",
+        "seconds": round(time.time() - start, 3),
+        "stages": {k: round(v, 3) for k, v in seconds.items()},
+    }
+
+
+def _frame_count(video: str) -> int:
+    cap = cv2.VideoCapture(video)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return frames
+
+
+def run_batch(
+    videos: list,
+    output: str,
+    args: dict = DARGS,
+    workers: int = 1,
+    job_cpus: int = 0,
+    warm: bool = True,
+) -> dict:
+    """
+    Processes videos in workers processes, each in its own directory under output
+    @param job_cpus, cores of every worker, 0 splits all cores between workers
+    @param warm, whether workers keep models loaded between videos
+    @returns throughput report, also written to output/batch_report.json
+    """
+    job_cpus = job_cpus or max(1, (os.cpu_count() or 1) // workers)
+    os.makedirs(output, exist_ok=True)
+    start = time.time()
+    reports = []
+    # models spawn their own processes and torch is not fork safe
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(job_cpus, warm),
+    ) as pool:
+        futures = {
+            pool.submit(_process, video, out, args): (video, out)
+            for video, out in zip(videos, output_dirs(videos, output))
+        }
+        for future in as_completed(futures):
+            video, out = futures[future]
+            try:
+                report = future.result()
+            except Exception as ex:
+                # finished stages stay in the checkpoint for the next run
+                report = {
+                    "video": video,
+                    "output": out,
+                    "status": "failed",
+                    "error": f"{type(ex).__name__}: {ex}",
+                }
+            reports.append(report)
+            print(f"[{len(reports)}/{len(videos)}] {_report_line(report)}")
+
+    report = summarize(reports, time.time() - start)
+    report.update(workers=workers, job_cpus=job_cpus)
+    with open(os.path.join(output, REPORT), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def _report_line(report: dict) -> str:
+    if report["status"] == "failed":
+        return f"{report['video']} failed: {report['error']}"
+    if report["status"] == "skipped":
+        return f"{report['video']} already processed"
+    fps = report["frames"] / report["seconds"] if report["seconds"] else 0.0
+    return (
+        f"{report['video']} {report['status']} in {report['seconds']:.1f}s, "
+        f"{fps:.1f} frames/s"
+    )
+
+
+def summarize(reports: list, wall_seconds: float) -> dict:
+    "Throughput of a batch from the reports of its videos"
+    processed = [r for r in reports if r["status"] in ("done", "resumed")]
+    frames = sum(r["frames"] for r in processed)
+    stages = {
+        stage: round(sum(r["stages"].get(stage, 0.0) for r in processed), 3)
+        for stage in STAGE_WEIGHTS
+    }
+    wall_seconds = max(wall_seconds, 1e-9)
+    return {
+        "videos": len(reports),
+        **{
+            status: sum(r["status"] == status for r in reports)
+            for status in ("done", "resumed", "skipped", "failed")
+        },
+        "frames": frames,
+        "wall_seconds": round(wall_seconds, 3),
+        "frames_per_second": round(frames / wall_seconds, 3),
+        "videos_per_hour": round(3600 * len(processed) / wall_seconds, 3),
+        "stage_seconds": {stage: s for stage, s in stages.items() if s},
+        "reports": sorted(reports, key=lambda r: r["video"]),
+    }
+
+
+def print_report(report: dict) -> None:
+    print("==============Batch complete!======================")
+    print(
+        f"              {report['videos']} videos: {report['done']} done, "
+        f"{report['resumed']} resumed, {report['skipped']} skipped, "
+        f"{report['failed']} failed"
+    )
+    print(
+        f"              {report['frames']} frames in {report['wall_seconds'] / 60:.2f} minutes "
+        f"on {report['workers']} workers of {report['job_cpus']} cores"
+    )
+    print(
+        f"              {report['frames_per_second']} frames/s, "
+        f"{report['videos_per_hour']} videos/hour"
+    )
+    total = sum(report["stage_seconds"].values())
+    for stage, seconds in report["stage_seconds"].items():
+        print(f"              {stage}: {seconds:.1f}s ({seconds / total:.0%})")
+    for r in report["reports"]:
+        if r["status"] == "failed":
+            print(f"              failed {r['video']}: {r['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the backend loop over many videos")
+    parser.add_argument(
+        "--input", required=True, help="directory of videos, or manifest of video paths"
+    )
+    parser.add_argument("--output", help="directory of the outputs of every video")
+    parser.add_argument("--workers", type=int, help="videos processed at once")
+    parser.add_argument(
+        "--job_cpus", type=int, help="cores of each worker, 0 splits all cores"
+    )
+    parser.add_argument(
+        "--cold", action="store_true", help="loads models for every video instead"
+    )
+    parser.add_argument(
+        "--skip_court", action="store_true", help="skips court and minimap processing"
+    )
+    parser.add_argument(
+        "--skip_video", action="store_true", help="skips processed video rendering"
+    )
+
+    opts = parser.parse_args()
+    args = DARGS.copy()
+    for k in ("skip_court", "skip_video"):
+        args[k] = args[k] or getattr(opts, k)
+    videos = find_videos(opts.input)
+    report = run_batch(
+        videos,
+        opts.output or args["batch_output"],
+        args,
+        workers=opts.workers or args["batch_workers"],
+        job_cpus=args["batch_job_cpus"] if opts.job_cpus is None else opts.job_cpus,
+        warm=not opts.cold,
+    )
+    print_report(report)
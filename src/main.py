@@ -5,15 +5,18 @@ from modelrunner import ModelRunner
 from processrunner import ProcessRunner
 import argparse
 from args import DARGS, setup_args
+from progress import Progress
 
 
-def main(args=DARGS) -> None:
+def main(args=DARGS, progress: Progress = None, models=None) -> None:
     """
     Sequentially initialises and runs model running and processing tasks.
     Input:
         args: dict of arguments, as specified in config.yaml
+        progress: receives stage progress of the run
+        models: warm modelserver.ModelServer, else models load their weights
     Side Effect:
-        Writes to args['results_file']
+        Writes to args['results_file'], args['stats_file'] and args['snapshot_file']
     """
     print(
         "==============Starting backend loop with following inputs!======================"
@@ -24,11 +27,11 @@ def main(args=DARGS) -> None:
         "================================================================================"
     )
 
-    modelrunner = ModelRunner(args=args)
+    modelrunner = ModelRunner(args=args, progress=progress, models=models)
     if not args["skip_model"]:
         modelrunner.run()
 
-    processrunner = ProcessRunner(args=args)
+    processrunner = ProcessRunner(args=args, progress=progress)
     if not args["skip_process"]:
         processrunner.run()
 
@@ -48,6 +51,7 @@ def main(args=DARGS) -> None:
         print(f"              results file stored in {args['results_file']}")
         if not args["skip_court"]:
             print(f"              minimap stored in {args['minimap_file']}")
+            print(f"              court trajectories stored in {args['trajectory_file']}")
 
 
 if __name__ == "__main__":
@@ -61,9 +65,27 @@ if __name__ == "__main__":
     parser.add_argument(
         "--skip_court", action="store_true", help="skips court and minimap processing"
     )
+    parser.add_argument(
+        "--court_check_interval",
+        type=int,
+        help="frames between court drift checks, 0 uses one homography",
+    )
+    parser.add_argument(
+        "--court_drift_threshold",
+        type=float,
+        help="fraction of keyframe goodness below which the court is re-detected",
+    )
+    parser.add_argument(
+        "--court_cache", help="dir caching court homographies of fixed cameras"
+    )
     parser.add_argument(
         "--skip_video", action="store_true", help="skips court and minimap processing"
     )
+    parser.add_argument(
+        "--video_workers",
+        type=int,
+        help="processes of court detection and video rendering, 0 uses all cores",
+    )
     parser.add_argument(
         "--skip_player_filter", action="store_true", help="skips player filters"
     )
@@ -76,6 +98,26 @@ if __name__ == "__main__":
     )
     parser.add_argument("--ball_weights", help="path to ball weights for yolov5")
     parser.add_argument("--pose_weights", help="path to pose weights for yolov8-pose")
+    parser.add_argument(
+        "--frame_reduction_factor", type=int, help="run the detector every N frames"
+    )
+    parser.add_argument(
+        "--skip_motion", type=float, help="frame change that forces detection early"
+    )
+    parser.add_argument(
+        "--reid_weights", help="path to ReID weights (.pt, .onnx or _openvino_model)"
+    )
+    parser.add_argument(
+        "--quantize", help="'dynamic' or 'static' runs INT8 exports of the weights"
+    )
+    parser.add_argument(
+        "--reid_cache", help="dir caching detections + ReID features for replays"
+    )
+    parser.add_argument(
+        "--from_detections",
+        action="store_true",
+        help="only re-runs tracking from reid_cache, skipping decoding and inference",
+    )
 
     args = parser.parse_args()
     args = vars(args)
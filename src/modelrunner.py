@@ -5,11 +5,14 @@ import cv2
 from ultralytics import YOLO
 from pathlib import Path
 import multiprocessing as mp
+import threading
 from pose_estimation import pose_estimate
 import time
 from args import DARGS
+from progress import Progress
 
 from strongsort.yolov5 import detect as track
+from strongsort.quantize import int8_weights
 
 
 class ModelRunner:
@@ -18,37 +21,32 @@ class ModelRunner:
     Returns 2 output files on player and ball detections
     """
 
-    def __init__(self, args=DARGS) -> None:
+    def __init__(self, args=DARGS, progress: Progress = None, models=None) -> None:
         self.args = args
+        self.progress = progress or Progress()
+        self.models = models
+        "warm modelserver.ModelServer, or None to load weights in every stage"
 
-    def drop_frames(self) -> str:
+    def weights(self, key: str) -> Path:
         """
-        Alters the input video fps to 1 / reduction_factor. Stores + returns new video in output_path.
+        Path to the weights under args[key], or to their INT8 export if args["quantize"] is set.
         """
-        output_path = self.args["video_file"]
-        video = cv2.VideoCapture(self.args["video_file"])
-        nframes = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
-        output_video = cv2.VideoWriter(
-            output_path,
-            cv2.VideoWriter_fourcc(*"mp4v"),
-            int(video.get(cv2.CAP_PROP_FPS) / 2),
-            (
-                int(video.get(cv2.CAP_PROP_FRAME_WIDTH)),
-                int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)),
-            ),
-        )
-        for i in range(nframes):
-            ret, frame = video.read()
-            if not ret:
-                break
-            if i % self.args["frame_reduction_factor"] == 0:
-                output_video.write(frame)
-
-        video.release()
-        output_video.release()
-        # os.remove(input_path)
-        # os.rename(output_path, input_path)
-        return output_path
+        path = Path(self.args[key])
+        mode = self.args["quantize"]
+        if not mode:
+            return path
+        int8 = int8_weights(path, mode)
+        if not int8.exists():
+            raise FileNotFoundError(
+                f"{int8} not found, build it with src/strongsort/quantize.py --mode {mode}"
+            )
+        return int8
+
+    def detect_models(self, key: str):
+        "Warm detector of the weights under args[key] and ReID extractor, or None"
+        if self.models is None:
+            return None
+        return self.models.detect_models(self.weights(key), self.weights("reid_weights"))
 
     def track_person(self):
         """tracks persons in video and puts data in out_queue"""
@@ -61,13 +59,21 @@ class ModelRunner:
             conf_thres=self.args["player_thres"]["conf_thres"],
             iou_thres=self.args["player_thres"]["iou_thres"],
             classes=[self.args["cls"]["player"], self.args["cls"]["rim"]],
-            yolo_weights=Path(self.args["player_weights"]),
+            yolo_weights=self.weights("player_weights"),
+            strong_sort_weights=self.weights("reid_weights"),
+            models=self.detect_models("player_weights"),
             save_vid=self.args["save_vid"],
+            encoding=self.args["encoding"],
             show_vid=self.args["show_vid"]["player"],
             ret=False,
             save_txt=True,
             write_to=self.args["people_file"],
+            skips=self.args["frame_reduction_factor"],
+            skip_motion=self.args["skip_motion"],
+            reid_cache=self.args["reid_cache"] or None,
+            from_detections=self.args["from_detections"],
             verbose=self.args["verbose"],
+            on_frame=self.progress.counter("model", "players"),
         )
         self.args["model_videos"]["player"] = vid_path
         print("==============Players and Rim tracked!============")
@@ -80,40 +86,65 @@ class ModelRunner:
         _, bb_vid_path = track.run(
             source=self.args["video_file"],
             logger_name="ball",
-            yolo_weights=Path(self.args["ball_weights"]),
+            yolo_weights=self.weights("ball_weights"),
+            strong_sort_weights=self.weights("reid_weights"),
+            models=self.detect_models("ball_weights"),
             save_vid=self.args["save_vid"],
+            encoding=self.args["encoding"],
             show_vid=self.args["show_vid"]["ball"],
             skip_big=self.args["skip_big"],
             ret=False,
             save_txt=True,
             write_to=self.args["ball_file"],
+            skips=self.args["frame_reduction_factor"],
+            skip_motion=self.args["skip_motion"],
+            reid_cache=self.args["reid_cache"] or None,
+            from_detections=self.args["from_detections"],
             verbose=self.args["verbose"],
+            on_frame=self.progress.counter("model", "ball"),
         )
         self.args["model_videos"]["ball"] = bb_vid_path
         print("==============Basketball tracked!============")
 
     def pose(self):
         print("==============Start pose estimation!============")
-        model = YOLO(self.args["pose_weights"])
+        if self.models is not None:
+            model = self.models.pose_model(self.args["pose_weights"])
+        else:
+            model = YOLO(self.args["pose_weights"])
         results = model(
             source=self.args["video_file"],
             conf=self.args["pose_thres"]["conf"],
             stream=True,  # continuous output to results
             verbose=self.args["verbose"],
         )
-        pose_estimate.write_to(self.args["pose_file"], results)
+        pose_estimate.write_to(self.args["pose_file"], self.counted(results, "pose"))
         print("==============Pose estimated!============")
 
+    def counted(self, results, part: str):
+        "Passes results of every frame through, counting them as progress of part"
+        on_frame = self.progress.counter("model", part)
+        total = self.get_frame_count(self.args["video_file"])
+        for done, result in enumerate(results, 1):
+            yield result
+            on_frame(done, max(total, done))
+
     def run(self):
         """
         Runs both pose estimation and strongSORT simultaneously
-        (2 strongsort passes for players/rim vs ball)
+        (2 strongsort passes for players/rim vs ball), in threads sharing
+        the warm models if given, else in processes loading their own
         """
-        mp.set_start_method("spawn", force=True)  # fix hanging issue of git actions
-
-        p1 = mp.Process(target=self.track_person)
-        p2 = mp.Process(target=self.track_basketball)
-        p3 = mp.Process(target=self.pose)
+        self.progress.start("model")
+        if self.models is not None:
+            p1 = threading.Thread(target=self.track_person)
+            p2 = threading.Thread(target=self.track_basketball)
+            p3 = threading.Thread(target=self.pose)
+        else:
+            mp.set_start_method("spawn", force=True)  # fix hanging issue of git actions
+            p1 = mp.Process(target=self.track_person)
+            p2 = mp.Process(target=self.track_basketball)
+            p3 = mp.Process(target=self.pose)
 
         start = time.time()
 
@@ -126,6 +157,7 @@ class ModelRunner:
         p3.join()
 
         end = time.time()
+        self.progress.finish("model")
         total_frames = self.get_frame_count(self.args["video_file"])
         minutes = round((end - start) / 60, 2)
         ms_per_frame = round(1000 * (end - start) / total_frames, 4)
@@ -0,0 +1,72 @@
+"""
+Warm model server module
+
+Keeps the YOLOv5 player and ball detectors, the StrongSORT ReID extractor and
+the YOLOv8 pose model loaded and warmed up in a long-lived process, so videos
+run through it only pay for inference. The backend's job workers each keep one.
+"""
+import threading
+from pathlib import Path
+
+import numpy as np
+from ultralytics import YOLO
+
+from args import DARGS
+from modelrunner import ModelRunner
+from progress import Progress
+from strongsort.yolov5 import detect as track
+
+
+class ModelServer:
+    """
+    Loaded models of the pipeline by weights path, shared by every run
+    """
+
+    def __init__(self, device: str = "") -> None:
+        """
+        @param device, cuda device, i.e. 0 or 0,1,2,3 or cpu; '' picks one
+        """
+        self.device = device
+        self._detectors: dict = {}
+        self._extractors: dict = {}
+        self._poses: dict = {}
+        self._lock = threading.Lock()
+        "models are loaded once even if runs ask for them at the same time"
+
+    def warm(self, args=DARGS) -> None:
+        "Loads and warms up every model used by runs of args"
+        runner = ModelRunner(args, models=self)
+        runner.detect_models("player_weights")
+        runner.detect_models("ball_weights")
+        self.pose_model(args["pose_weights"])
+
+    def detect_models(self, yolo_weights: Path, reid_weights: Path) -> dict:
+        "Warm detector of yolo_weights and ReID extractor of reid_weights, as detect.run's models"
+        with self._lock:
+            if yolo_weights not in self._detectors:
+                self._detectors[yolo_weights] = track.load_detector(
+                    yolo_weights, self.device
+                )
+            if reid_weights not in self._extractors:
+                self._extractors[reid_weights] = track.load_extractor(
+                    reid_weights, self.device
+                )
+            return {
+                "detector": self._detectors[yolo_weights],
+                "extractor": self._extractors[reid_weights],
+            }
+
+    def pose_model(self, weights: str) -> YOLO:
+        "Warm YOLOv8 pose model of weights"
+        with self._lock:
+            if weights not in self._poses:
+                model = YOLO(weights)
+                model(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)  # warmup
+                self._poses[weights] = model
+            return self._poses[weights]
+
+    def run(self, args, progress: Progress = None) -> None:
+        "Runs main over args in this process with the warm models"
+        from main import main
+
+        main(args, progress, models=self)
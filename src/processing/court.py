@@ -5,6 +5,62 @@ import os
 import cv2 as cv
 import numpy as np
 import random
+from concurrent.futures import ProcessPoolExecutor
+
+_MAX_RELAX_LEVEL = 9
+"Highest relax level of the homography search, relax_factor 0.25 * 9 = 2.25"
+_POOL_MIN_CANDIDATES = 256
+"Fewest candidate homographies worth scoring in a process pool"
+_SCORING = {}
+"Edge and truth maps of the homography search, set in every scoring process"
+
+
+def _warp_goodness(
+    edges: np.ndarray, truth: np.ndarray, pts_src, pts_dst, scale: float = 1
+):
+    """
+    Proportion of the truth map's court lines covered by the warped court edges
+    @param edges, grayscale image of court edges, resized by scale
+    @param truth, inverted truth map (lines are white), resized by scale
+    @param pts_src, four points on the full size court image of box, counterclockwise
+    @param pts_dst, four points on the full size truth map to map to
+    @param scale, factor edges and truth were resized by
+    @returns goodness, proportion of intersection
+    """
+    h, _ = cv.findHomography(np.array(pts_src), np.array(pts_dst))
+    if h is None:
+        return 0
+    if scale != 1:
+        s = np.diag([scale, scale, 1.0])
+        h = s @ h @ np.linalg.inv(s)
+    size = (truth.shape[1], truth.shape[0])
+    mapped = cv.bitwise_and(cv.warpPerspective(edges, h, size), truth)
+    viewport = cv.warpPerspective(np.full_like(edges, 255), h, size)
+    total_max_overlap = np.count_nonzero(cv.bitwise_and(viewport, truth) > 100) + 1
+    return float(np.count_nonzero(mapped > 100)) / total_max_overlap
+
+
+def _init_scoring(edges: np.ndarray, truth: np.ndarray, scale: float):
+    "Process pool initializer, stores the maps candidates are scored on"
+    _SCORING.update(edges=edges, truth=truth, scale=scale)
+
+
+def _score_candidates(candidates: np.ndarray, pts_dst: np.ndarray):
+    "Goodness of every (4, 2) candidate box in candidates, on the maps of _init_scoring"
+    return [
+        _warp_goodness(
+            _SCORING["edges"], _SCORING["truth"], pts, pts_dst, _SCORING["scale"]
+        )
+        for pts in candidates
+    ]
+
+
+def _max_pool(img: np.ndarray, scale: float):
+    "Resizes a binary image by scale, keeping any pixel that had an edge under it"
+    if scale == 1:
+        return img
+    small = cv.resize(img, None, fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+    return np.where(small > 0, 255, 0).astype(np.uint8)
 
 
 class Bin:
@@ -41,16 +97,35 @@ class Render:
     will produce video court visualization of player positions.
     """
 
-    def __init__(self, video_path: str, display_images: bool = False):
+    def __init__(
+        self,
+        video_path: str,
+        display_images: bool = False,
+        binning_downscale: int = 1,
+        scoring: str = "points",
+        frame: np.ndarray = None,
+        detect: bool = True,
+        workers: int = 0,
+    ):
         """
         Runs court detection on video input
         @param video_path is path from project root to video file
         @param display_images determines whether or not to display images for debugging
+        @param binning_downscale bins only every n-th pixel row and column of the court color
+        @param scoring scores homographies by warping court edges ("warp") or by
+        looking up sampled truth map points in a distance transform of them ("points")
+        @param frame is the bgr frame to detect the court on, the first frame of the video if None
+        @param detect is False to skip detection and only score known homographies
+        @param workers, processes scoring candidate homographies, 0 for one per core
         """
+        if scoring not in ("warp", "points"):
+            raise ValueError(f"scoring must be 'warp' or 'points', got {scoring}")
         self._TRUE_PATH = os.path.join("data", "true_map.png")
         self._VIDEO_PATH = video_path
         self._BINNING_THRESHOLD = 0.001
         "Minimum percentage of pixels to be included in list of color bins"
+        self._BINNING_DOWNSCALE = binning_downscale
+        "Stride over pixel rows and columns when binning court colors"
         self._COLOR_SMOOTHING = 5
         "Padding to be added to selected HSV to include more color range"
         self._HALF_COURT_BOUNDS = np.array(
@@ -59,8 +134,11 @@ class Render:
         "Coordinates of four corners of truth map counterclock starting from bottom right"
         self._BOX_BOUNDS = np.array([(639, 398), (639, 17), (402, 17), (402, 398)])
         "Coordinates of four corners of inner box counterclock starting from bottom right"
-        video = cv.VideoCapture(self._VIDEO_PATH)
-        _, self._BGR_COURT = video.read()
+        if frame is None:
+            video = cv.VideoCapture(self._VIDEO_PATH)
+            _, frame = video.read()
+            video.release()
+        self._BGR_COURT = frame
         self._YCRCB_COURT = cv.cvtColor(self._BGR_COURT, cv.COLOR_BGR2YCrCb)
         "User court in YCrCb color space"
         self._HSV_COURT = cv.cvtColor(self._BGR_COURT, cv.COLOR_BGR2HSV)
@@ -69,8 +147,19 @@ class Render:
         "User court in gray scale"
         self._MASK_COURT_EDGES = self._GRAY_COURT.copy()  # temp assignment
         "Final processed image of court edges"
+        self._EDGE_DISTANCE = None
+        "Distance of every pixel to the nearest court edge, see _set_court_edges"
         self._TRUTH_COURT_MAP = cv.imread(self._TRUE_PATH, cv.IMREAD_GRAYSCALE)
         "True court map of half court"
+        self._SCORING = scoring
+        "Whether homographies are scored by warping edges or by sampled points"
+        self._POINT_STRIDE = 2
+        "Keep every n-th line pixel of the truth map when scoring by points"
+        self._POINT_TOLERANCE = 0.0
+        "Distance in pixels from a court edge at which a sampled point still counts"
+        ys, xs = np.nonzero(self._TRUTH_COURT_MAP < 128)
+        self._TRUTH_POINTS = np.stack((xs, ys), axis=1)[:: self._POINT_STRIDE]
+        "(N, 2) sampled points (x,y) on the lines of the truth map"
         self._HSV_BINNING = True  # choose either HSV binning or YCrCb binning
         if self._HSV_BINNING:
             self._index = (0, 1)
@@ -82,9 +171,17 @@ class Render:
             self._one_max = 256.0
             self._two_max = 256.0
             self._COURT_IMG = self._YCRCB_COURT
+        self._COURT_BIN = None
+        "Most frequent color bin of the court, masks court edges"
+        self._SEARCH_STAGES = ((0.125, 64), (0.5, 8))
+        "(scale, number kept) of the stages scoring candidate boxes before full size"
         self._HOMOGRAPHY = None
         "Homography matrix to transform court to minimaped version"
+        self._WORKERS = workers or os.cpu_count() or 1
+        "Processes scoring candidate homographies"
 
+        if not detect:
+            return
         if display_images:
             self._HOMOGRAPHY = self._detect_courtlines_and_display()
         else:
@@ -93,15 +190,52 @@ class Render:
     def get_homography(self):
         return self._HOMOGRAPHY
 
+    def get_court_bin(self):
+        "Color bin of the court, binned from the detected frame on first use"
+        if self._COURT_BIN is None:
+            self._COURT_BIN = self._bin_pixels(
+                self._COURT_IMG,
+                one_bins=18,
+                two_bins=10,
+                downscale=self._BINNING_DOWNSCALE,
+            )[0]
+        return self._COURT_BIN
+
+    def frame_goodness(
+        self, frame: np.ndarray, homography: np.ndarray, court_bin: Bin = None
+    ):
+        """
+        Scores a homography against the court edges of another frame of the video,
+        masked with the court color of the detected frame
+        @param frame, bgr frame of the video, the detected frame if None
+        @param homography, matrix mapping frame onto the truth map
+        @param court_bin, color bin of the court to mask edges with instead
+        @returns goodness, proportion of truth map lines in view on a court edge
+        """
+        if frame is None:
+            frame = self._BGR_COURT
+        if court_bin is None:
+            court_bin = self.get_court_bin()
+        img = cv.cvtColor(
+            frame, cv.COLOR_BGR2HSV if self._HSV_BINNING else cv.COLOR_BGR2YCrCb
+        )
+        _, edges = self._court_edges(frame, img, court_bin)
+        return self._homography_goodness(homography, self._edge_distance(edges))
+
     def _detect_courtlines(self):
         "Finds best homography"
-        bins = self._bin_pixels(self._COURT_IMG, one_bins=18, two_bins=10)
-        mask = self._get_mask(self._COURT_IMG, bins[0])
-        canny_edges = self._get_canny(self._GRAY_COURT)
-        masked_edges = self._apply_mask(canny_edges, mask)
+        bins = self._bin_pixels(
+            self._COURT_IMG,
+            one_bins=18,
+            two_bins=10,
+            downscale=self._BINNING_DOWNSCALE,
+        )
+        self._COURT_BIN = bins[0]
+        masked_edges, thick_masked_edges = self._court_edges(
+            self._BGR_COURT, self._COURT_IMG, self._COURT_BIN
+        )
         hough_lines = self._get_hough(masked_edges, threshold=180)
-        thick_masked_edges = self._thicken_edges(masked_edges, iterations=1)
-        self._MASK_COURT_EDGES = thick_masked_edges.copy()
+        self._set_court_edges(thick_masked_edges)
         best_pts = self._find_best_homography(hough_lines)
         while True:
             if not self._regress_box_boundary(best_pts):
@@ -114,7 +248,13 @@ class Render:
 
     def _detect_courtlines_and_display(self):
         "Finds best homography and displays images of progress"
-        bins = self._bin_pixels(self._COURT_IMG, one_bins=18, two_bins=10)
+        bins = self._bin_pixels(
+            self._COURT_IMG,
+            one_bins=18,
+            two_bins=10,
+            downscale=self._BINNING_DOWNSCALE,
+        )
+        self._COURT_BIN = bins[0]
         mask = self._get_mask(self._COURT_IMG, bins[0])
         canny_edges = self._get_canny(self._GRAY_COURT)
         masked_edges = self._apply_mask(canny_edges, mask)
@@ -122,7 +262,7 @@ class Render:
         hough_lines = self._get_hough(masked_edges, threshold=300)
         hough = self._apply_hough(self._BGR_COURT, hough_lines)
         thick_masked_edges = self._thicken_edges(masked_edges, iterations=1)
-        self._MASK_COURT_EDGES = thick_masked_edges.copy()
+        self._set_court_edges(thick_masked_edges)
         best_pts = self._find_best_homography(hough_lines)
         while self._regress_box_boundary(best_pts):
             print("new goodness", self._evaluate_homography(best_pts, self._BOX_BOUNDS))
@@ -166,35 +306,65 @@ class Render:
 
         return homography
 
-    def _bin_pixels(self, img: np.ndarray, one_bins: int = 16, two_bins: int = 16):
+    def _set_court_edges(self, edges: np.ndarray):
+        """
+        Sets the court edges homographies are scored on, and their distance transform
+        @param edges, grayscale image of court edges
+        """
+        self._MASK_COURT_EDGES = edges.copy()
+        self._EDGE_DISTANCE = self._edge_distance(edges)
+
+    def _edge_distance(self, edges: np.ndarray):
+        """
+        Distance transform of court edges
+        @param edges, grayscale image of court edges
+        @returns distance of every pixel to the nearest edge pixel
+        """
+        background = np.where(edges > 100, 0, 255).astype(np.uint8)
+        return cv.distanceTransform(background, cv.DIST_L2, 3)
+
+    def _court_edges(self, bgr: np.ndarray, img: np.ndarray, court_bin: Bin):
+        """
+        Canny edges of a frame inside the court color
+        @param bgr, bgr frame of court
+        @param img, same frame in the color space of court_bin
+        @param court_bin, color bin of the court
+        @returns masked edges, and the same edges thickened
+        """
+        mask = self._get_mask(img, court_bin)
+        canny_edges = self._get_canny(cv.cvtColor(bgr, cv.COLOR_BGR2GRAY))
+        masked_edges = self._apply_mask(canny_edges, mask)
+        return masked_edges, self._thicken_edges(masked_edges, iterations=1)
+
+    def _bin_pixels(
+        self, img: np.ndarray, one_bins: int = 16, two_bins: int = 16, downscale: int = 1
+    ):
         """
         Returns top bins from YCrCb color space
         @Param: img, image of court, either HSV or YCrCb depending on settings
         @param one_bins, number of bins of first channel
         @param two_bins, number of bins of second channel
+        @param downscale, only every downscale-th row and column of img is binned
         @returns: sorted array of most frequent color bin objects
         """
-        # generate weights
-        weights = np.zeros((img.shape[0], img.shape[1]))
-        for row in range(weights.shape[0]):
-            row_weight = np.full(weights.shape[1], row)
-            weights[row] = row_weight
-        for col in range(weights.shape[1]):
-            col_weight = np.full(weights.shape[0], min(col + 1, weights.shape[1] - col))
-            weights[:, col] = np.minimum(weights[:, col], col_weight)
+        # generate weights, pixels near the bottom and horizontal center count more
+        rows = np.arange(0, img.shape[0], downscale)
+        cols = np.arange(0, img.shape[1], downscale)
+        col_weights = np.minimum(cols + 1, img.shape[1] - cols)
+        weights = np.minimum(rows[:, None], col_weights[None, :]).astype(np.float64)
         weights = weights / np.sum(weights)
 
         # split image pixels into bins
-        bins = np.zeros((one_bins, two_bins))
         one_step = self._one_max / one_bins
         two_step = self._two_max / two_bins
-        for row in range(img.shape[0]):
-            for col in range(img.shape[1]):
-                pix = img[row, col]
-                bins[
-                    int(pix[self._index[0]] / one_step),
-                    int(pix[self._index[1]] / two_step),
-                ] += weights[row, col]
+        pixels = img[::downscale, ::downscale]
+        one = (pixels[..., self._index[0]] / one_step).astype(np.int64)
+        two = (pixels[..., self._index[1]] / two_step).astype(np.int64)
+        bins = np.bincount(
+            (one * two_bins + two).ravel(),
+            weights=weights.ravel(),
+            minlength=one_bins * two_bins,
+        ).reshape(one_bins, two_bins)
 
         # sort bins
         top_bins = []
@@ -297,55 +467,179 @@ class Render:
         ver = np.array(sorted(ver, key=lambda x: x[0][0]))
         return self._iterate_best_homography(hor, ver)
 
-    def _iterate_best_homography(self, hor: list, ver: list, relax_factor=0):
+    def _iterate_best_homography(self, hor: list, ver: list):
         """
-        Iterates until best homography is found
+        Finds the box boundary best matching court edges among all pairs of
+        hor lines and pairs of ver lines. Constraints on box sides are relaxed
+        in steps of 0.25 until some candidate overlaps court edges.
         @param hor, ver, lists of lines grouped into two categories,
         likely to be lines parallel to each other.
-        @param relax_factor, how much to relax constraints on homography points.
         @return four points, or None if no homography is found.
         """
-        max_goodness = 0
-        max_homography = None
-        for i1 in range(0, len(hor)):
-            for i2 in range(i1 + 1, len(hor)):
-                for j1 in range(len(ver)):
-                    for j2 in range(j1 + 1, len(ver)):
-                        pts = self._get_four_intersections(
-                            hor[i2][0],
-                            ver[j1][0],
-                            hor[i1][0],
-                            ver[j2][0],
-                            relax_factor=relax_factor,
-                        )
-                        if pts is None:
-                            continue
-                        goodness = self._evaluate_homography(pts, self._BOX_BOUNDS)
-                        if goodness > max_goodness:
-                            max_goodness = goodness
-                            max_homography = pts
-
-                        pts = self._get_four_intersections(
-                            ver[j2][0],
-                            hor[i2][0],
-                            ver[j1][0],
-                            hor[i1][0],
-                            relax_factor=relax_factor,
-                        )
-                        if pts is None:
-                            continue
-                        goodness = self._evaluate_homography(pts, self._BOX_BOUNDS)
-                        if goodness > max_goodness:
-                            max_goodness = goodness
-                            max_homography = pts
-        if max_homography is None:
-            if relax_factor > 2:
+        if len(hor) < 2 or len(ver) < 2:
+            return None
+        pts = self._line_intersections(hor[:, 0], ver[:, 0])
+        level = 0
+        while True:
+            # candidates of lower levels all scored 0, so only new ones can win
+            boxes, level = self._candidate_boxes(pts, level)
+            if boxes is None:
                 return None
-            return self._iterate_best_homography(
-                hor, ver, relax_factor=relax_factor + 0.25
+            best = self._best_candidate(boxes)
+            if best is not None:
+                return best
+            level += 1
+
+    def _candidate_boxes(self, pts: np.ndarray, min_level: int):
+        """
+        Boxes of line quadruples that first become valid at the lowest relax level
+        at or above min_level, where level k allows relax_factor 0.25 * k
+        @param pts, (len(hor), len(ver), 2) line intersections
+        @param min_level, lowest relax level to consider
+        @returns (N, 4, 2) box corners in search order and their level,
+        or None, None if no quadruple is valid up to relax_factor 2.25
+        """
+        j1, j2 = np.triu_indices(pts.shape[1], 1)
+        level, found, offset = _MAX_RELAX_LEVEL + 1, [], 0
+        for i1 in range(pts.shape[0] - 1):  # one hor line at a time bounds memory
+            i2 = np.arange(i1 + 1, pts.shape[0])
+            i2, jj1, jj2 = np.repeat(i2, len(j1)), np.tile(j1, len(i2)), np.tile(j2, len(i2))
+            quads = np.stack((np.full_like(i2, i1), i2, jj1, jj2), 1)
+            offset += len(quads)
+            first = self._quadruple_boxes(pts, quads, 0)
+            sides = np.linalg.norm(first - np.roll(first, -1, axis=1), axis=2)
+            cross = self._cross_products(first)
+            convex = ~(np.any(cross > 0, axis=1) & np.any(cross < 0, axis=1))
+            # first orientation has sides 1 and 3 long, the second sides 2 and 4;
+            # the second is only valid if the first is
+            levels = np.full((len(quads), 2), _MAX_RELAX_LEVEL + 1)
+            levels[:, 0] = np.where(convex, self._relax_level(sides, (0, 2)), levels[:, 0])
+            levels[:, 1] = np.maximum(levels[:, 0], self._relax_level(sides, (1, 3)))
+            levels[levels < min_level] = _MAX_RELAX_LEVEL + 1
+            low = levels.min(initial=_MAX_RELAX_LEVEL + 1)
+            if low > level:
+                continue
+            if low < level:
+                level, found = low, []
+            for orientation in (0, 1):
+                keep = levels[:, orientation] == level
+                keys = 2 * (offset - len(quads) + np.flatnonzero(keep)) + orientation
+                found.append((keys, self._quadruple_boxes(pts, quads[keep], orientation)))
+        if level > _MAX_RELAX_LEVEL:
+            return None, None
+        keys = np.concatenate([k for k, _ in found])
+        boxes = np.concatenate([b for _, b in found])
+        return boxes[np.argsort(keys, kind="stable")], level
+
+    def _relax_level(self, sides: np.ndarray, long: tuple):
+        """
+        Lowest relax level at which a box has valid sides, see _get_four_intersections
+        @param sides, (N, 4) side lengths of boxes
+        @param long, indices of the two sides that are between 600 and 800 pixels
+        @returns (N,) levels, _MAX_RELAX_LEVEL + 1 where no level is valid
+        """
+        short = [i for i in range(4) if i not in long]
+        relax = np.maximum(
+            np.max(np.maximum(600 - sides[:, long], sides[:, long] - 800), axis=1),
+            np.max(sides[:, short] - 300, axis=1),
+        )
+        levels = np.maximum(np.ceil(relax / 250), 0)
+        levels[np.any(sides[:, short] < 50, axis=1)] = _MAX_RELAX_LEVEL + 1
+        return np.minimum(levels, _MAX_RELAX_LEVEL + 1).astype(np.int64)
+
+    def _quadruple_boxes(self, pts: np.ndarray, quads: np.ndarray, orientation: int):
+        """
+        Box corners of line quadruples, counterclockwise like _get_four_intersections
+        @param pts, (len(hor), len(ver), 2) line intersections
+        @param quads, (N, 4) indices (i1, i2, j1, j2)
+        @param orientation, 0 to start at the free throw line hor[i2], 1 at ver[j2]
+        @returns (N, 4, 2) corners
+        """
+        i1, i2, j1, j2 = quads.T
+        a, b, c, d = pts[i2, j1], pts[i1, j1], pts[i1, j2], pts[i2, j2]
+        box = np.stack((a, b, c, d), 1) if orientation == 0 else np.stack((d, a, b, c), 1)
+        return box.reshape(-1, 4, 2)
+
+    def _line_intersections(self, hor: np.ndarray, ver: np.ndarray):
+        """
+        Intersection of every hor line with every ver line, see _get_line_intersection
+        @param hor, ver, arrays of lines given in form (rho,theta)
+        @returns (len(hor), len(ver), 2) points (x,y), or (0,0) if parallel
+        """
+        rho1, theta1 = hor[:, 0, None], hor[:, 1, None]
+        rho2, theta2 = ver[None, :, 0], ver[None, :, 1]
+        a1, a2 = np.cos(theta1), np.sin(theta1)
+        b1, b2 = np.cos(theta2), np.sin(theta2)
+        d = a1 * b2 - a2 * b1
+        safe = np.where(d == 0, 1, d)
+        x = np.where(d == 0, 0, (rho1 * b2 - rho2 * a2) / safe)
+        y = np.where(d == 0, 0, (-rho1 * b1 + rho2 * a1) / safe)
+        return np.stack((x, y), axis=2)
+
+    def _cross_products(self, boxes: np.ndarray):
+        """
+        Cross products of consecutive corner triples, see _is_not_convex
+        @param boxes, (N, 4, 2) corners given in order
+        @returns (N, 4) cross products
+        """
+        v1 = np.roll(boxes, -1, axis=1) - boxes
+        v2 = np.roll(boxes, -2, axis=1) - boxes
+        return v1[..., 0] * v2[..., 1] - v1[..., 1] * v2[..., 0]
+
+    def _best_candidate(self, candidates: np.ndarray):
+        """
+        Scores candidates on max pooled edges in stages of increasing scale,
+        keeping the best few of each stage, then rescores the rest at full size
+        @param candidates, (N, 4, 2) box corners in search order
+        @returns four points of the best box, or None if no box overlaps court edges
+        """
+        idx = np.arange(len(candidates))
+        truth = self._invert_grayscale(self._TRUTH_COURT_MAP)
+        for scale, keep in self._SEARCH_STAGES:
+            if len(idx) <= keep:
+                continue
+            scores = self._score_candidates(
+                candidates[idx],
+                _max_pool(self._MASK_COURT_EDGES, scale),
+                _max_pool(truth, scale),
+                scale,
             )
+            idx = np.sort(idx[np.argsort(-np.asarray(scores), kind="stable")[:keep]])
+
+        max_goodness = 0
+        max_homography = None
+        for i in idx:
+            pts = tuple((float(x), float(y)) for x, y in candidates[i])
+            goodness = self._evaluate_homography(pts, self._BOX_BOUNDS)
+            if goodness > max_goodness:
+                max_goodness = goodness
+                max_homography = pts
         return max_homography
 
+    def _score_candidates(
+        self, candidates: np.ndarray, edges: np.ndarray, truth: np.ndarray, scale: float
+    ):
+        """
+        Goodness of every candidate box, across a process pool when there are many
+        @param candidates, (N, 4, 2) box corners
+        @param edges, truth, court edges and inverted truth map resized by scale
+        @returns list of goodness, in order of candidates
+        """
+        workers = self._WORKERS
+        if workers == 1 or len(candidates) < _POOL_MIN_CANDIDATES:
+            _init_scoring(edges, truth, scale)
+            return _score_candidates(candidates, self._BOX_BOUNDS)
+        chunks = np.array_split(candidates, workers * 4)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_scoring,
+            initargs=(edges, truth, scale),
+        ) as pool:
+            scores = pool.map(
+                _score_candidates, chunks, [self._BOX_BOUNDS] * len(chunks)
+            )
+            return [score for chunk in scores for score in chunk]
+
     def _evaluate_homography(self, pts_src: list, pts_dst: list):
         """
         Evalues how well a homography performs on court
@@ -354,6 +648,8 @@ class Render:
         @return goodness, proportion of intersection.
         """
         assert(pts_src is not None)
+        if self._SCORING == "points":
+            return self._evaluate_points(pts_src, pts_dst)
         mapped_edge_img = self._apply_gray_homography(self._MASK_COURT_EDGES,pts_src,pts_dst=pts_dst)
         total_max_overlap = self._max_pixel_overlap(self._MASK_COURT_EDGES,pts_src,pts_dst=pts_dst)
         if total_max_overlap != 0:
@@ -363,6 +659,41 @@ class Render:
 
         return goodness
 
+    def _evaluate_points(self, pts_src: list, pts_dst: list):
+        """
+        Evalues how well a homography performs on court by projecting sampled
+        truth map lines onto the court and looking them up in the edge distances
+        @param pts_src, four points on court image of box, counterclockwise
+        @param pts_dst, four points on true image of court to map to
+        @return goodness, proportion of points in view that lie on a court edge
+        """
+        h, _ = cv.findHomography(np.array(pts_src), np.array(pts_dst))
+        return self._homography_goodness(h, self._EDGE_DISTANCE)
+
+    def _homography_goodness(self, h: np.ndarray, edge_distance: np.ndarray):
+        """
+        Proportion of sampled truth map line points, projected onto the court,
+        that lie on a court edge
+        @param h, matrix mapping court image onto truth map
+        @param edge_distance, distance transform of court edges
+        @return goodness, proportion of points in view that lie on a court edge
+        """
+        if h is None:
+            return 0
+        try:
+            h_inv = np.linalg.inv(h)
+        except np.linalg.LinAlgError:
+            return 0
+        # like warpPerspective, points behind the camera are mirrored into view
+        projected = self._TRUTH_POINTS @ h_inv[:, :2].T + h_inv[:, 2]
+        w = np.where(projected[:, 2] == 0, 1e-12, projected[:, 2])
+        x, y = np.round(projected[:, 0] / w), np.round(projected[:, 1] / w)
+        height, width = edge_distance.shape
+        in_view = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        distance = edge_distance[y[in_view].astype(int), x[in_view].astype(int)]
+        covered = np.count_nonzero(distance <= self._POINT_TOLERANCE)
+        return float(covered) / (np.count_nonzero(in_view) + 1)
+
     def _get_four_intersections(
         self, l1: list, l2: list, l3: list, l4: list, relax_factor=0
     ):
@@ -714,6 +1045,170 @@ class Render:
                     )
 
 
+class HomographyTracker:
+    """
+    Court homography of every frame of a video with a moving camera.
+    The court is detected on keyframes and followed between them by
+    tracking camera motion with optical flow. A new keyframe is detected
+    when the tracked court stops matching the edges of the frame.
+    """
+
+    def __init__(
+        self,
+        video_path: str,
+        check_interval: int = 15,
+        drift_threshold: float = 0.8,
+        flow_scale: float = 0.5,
+        flow_stride: int = 3,
+        homography: np.ndarray = None,
+        workers: int = 0,
+    ):
+        """
+        @param video_path is path from project root to video file
+        @param check_interval, frames between checks of the tracked homography
+        @param drift_threshold, re-detects the court when a check scores below this
+        fraction of the goodness of the last keyframe
+        @param flow_scale, factor frames are resized by for optical flow
+        @param flow_stride, camera motion is tracked on every n-th frame and
+        interpolated in between, skipped frames are only grabbed, not decoded to bgr
+        @param homography, known homography of the first frame, detected if None
+        @param workers, processes scoring candidate homographies, 0 for one per core
+        """
+        self._VIDEO_PATH = video_path
+        self._CHECK_INTERVAL = check_interval
+        self._DRIFT_THRESHOLD = drift_threshold
+        self._FLOW_SCALE = flow_scale
+        self._FLOW_STRIDE = max(flow_stride, 1)
+        self._FIRST_HOMOGRAPHY = homography
+        self._WORKERS = workers
+        self._MAX_FEATURES = 400
+        "Most corners tracked between frames"
+        self._MIN_FEATURES = 150
+        "Fewest tracked corners before new ones are found"
+        self._MIN_INLIERS = 20
+        "Fewest corners agreeing on camera motion before the camera is lost"
+        self._STILL_PIXELS = 0.25
+        "Largest displacement of a frame corner still counted as no camera motion"
+        self.keyframes = []
+        "Frame numbers the court was detected on"
+
+    def run(self):
+        """
+        Tracks the court through the video
+        @returns (number of frames, 3, 3) homographies from frame to truth map
+        """
+        video = cv.VideoCapture(self._VIDEO_PATH)
+        ok, frame = video.read()
+        if not ok:
+            raise ValueError(f"could not read video {self._VIDEO_PATH}")
+        if self._FIRST_HOMOGRAPHY is None:
+            render, key_goodness = self._detect(frame, 0)
+            key_homography = render.get_homography()
+        else:
+            render = Render(self._VIDEO_PATH, frame=frame, detect=False)
+            key_homography = self._FIRST_HOMOGRAPHY
+            key_goodness = render.frame_goodness(frame, key_homography)
+        motion = np.eye(3)  # keyframe pixels to current frame pixels
+        prev = self._flow_image(frame)
+        features = self._features(prev)
+        homographies = [key_homography / key_homography[2, 2]]
+        t = last_check = 0
+        while True:
+            skipped = 0
+            while skipped < self._FLOW_STRIDE - 1 and video.grab():
+                skipped += 1
+            ok, frame = video.read()
+            if not ok:
+                homographies += [homographies[-1]] * skipped
+                break
+            t += skipped + 1
+            gray = self._flow_image(frame)
+            step, features = self._camera_motion(prev, gray, features, frame.shape)
+            lost = step is None
+            if not lost:
+                motion = step @ motion
+            homography = key_homography @ np.linalg.inv(motion)
+            checked = self._CHECK_INTERVAL > 0 and t - last_check >= self._CHECK_INTERVAL
+            if lost or checked:
+                last_check = t
+                goodness = render.frame_goodness(frame, homography)
+                if goodness < self._DRIFT_THRESHOLD * key_goodness:
+                    detected, detected_goodness = self._detect(frame, t)
+                    if detected_goodness > goodness:
+                        render, goodness = detected, detected_goodness
+                        homography = detected.get_homography()
+                    key_homography, key_goodness, motion = homography, goodness, np.eye(3)
+            homography = homography / homography[2, 2]
+            previous = homographies[-1]
+            for k in range(1, skipped + 1):  # skipped frames move linearly
+                homographies.append(previous + (homography - previous) * k / (skipped + 1))
+            homographies.append(homography)
+            if len(features) < self._MIN_FEATURES:
+                features = self._features(gray)
+            prev = gray
+        video.release()
+        return np.array(homographies)
+
+    def _detect(self, frame: np.ndarray, frameno: int):
+        """
+        Detects the court on a keyframe
+        @param frame, bgr frame of video
+        @param frameno, frame number of frame
+        @returns Render of frame and goodness of its homography
+        """
+        print(f"Court detection on frame {frameno}.")
+        self.keyframes.append(frameno)
+        render = Render(
+            self._VIDEO_PATH, display_images=False, frame=frame, workers=self._WORKERS
+        )
+        return render, render.frame_goodness(frame, render.get_homography())
+
+    def _flow_image(self, frame: np.ndarray):
+        "Grayscale frame resized for optical flow"
+        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+        if self._FLOW_SCALE == 1:
+            return gray
+        return cv.resize(
+            gray, None, fx=self._FLOW_SCALE, fy=self._FLOW_SCALE, interpolation=cv.INTER_AREA
+        )
+
+    def _features(self, gray: np.ndarray):
+        "Corners of gray to track, (N, 1, 2)"
+        features = cv.goodFeaturesToTrack(
+            gray, maxCorners=self._MAX_FEATURES, qualityLevel=0.01, minDistance=8
+        )
+        return np.empty((0, 1, 2), np.float32) if features is None else features
+
+    def _camera_motion(self, prev: np.ndarray, gray: np.ndarray, features, shape):
+        """
+        Camera motion between consecutive frames from optical flow of corners,
+        with RANSAC rejecting corners on moving players
+        @param prev, gray, flow images of previous and current frame
+        @param features, (N, 1, 2) corners of prev
+        @param shape, shape of full size frames
+        @returns homography from previous to current full size frame pixels,
+        or None if the camera is lost, and the corners tracked into gray
+        """
+        if len(features) < self._MIN_INLIERS:
+            return None, self._features(gray)
+        tracked, status, _ = cv.calcOpticalFlowPyrLK(prev, gray, features, None)
+        found = status.ravel() == 1
+        features, tracked = features[found], tracked[found]
+        if len(tracked) < self._MIN_INLIERS:
+            return None, tracked
+        step, inliers = cv.findHomography(features, tracked, cv.RANSAC, 1.0)
+        if step is None or np.count_nonzero(inliers) < self._MIN_INLIERS:
+            return None, tracked
+        s = np.diag([self._FLOW_SCALE, self._FLOW_SCALE, 1.0])
+        step = np.linalg.inv(s) @ step @ s
+        height, width = shape[:2]
+        corners = np.array([[[0, 0]], [[width, 0]], [[width, height]], [[0, height]]], np.float64)
+        moved = cv.perspectiveTransform(corners, step)
+        if np.abs(moved - corners).max() < self._STILL_PIXELS:
+            step = np.eye(3)
+        return step, tracked[inliers.ravel() == 1]
+
+
 if __name__ == "__main__":
     video_path = os.path.join("data", "training_data.mp4")
     render = Render(video_path=video_path, display_images=True)
@@ -0,0 +1,195 @@
+"""
+Persistent cache of court homographies for fixed cameras.
+
+Games filmed from the same camera see the same court, so its homography is
+detected once and reused. Entries are keyed by the video resolution and a
+perceptual hash of its first frames, and looked up by nearest Hamming distance
+since players, lighting and compression never give the exact same frames.
+A hit is verified on the new video before use: the cached homography has to
+score at least half of what it scored when it was detected, else the court is
+detected again. This catches moved cameras and hash collisions; small errors
+are left to the drift checks of court.HomographyTracker. Edges are masked with
+the better of the cached court color and the one binned from the new video, as
+lighting can change which bin comes out on top.
+
+Runs processing videos at the same time share the cache: writers hold a lock on
+homographies.lock and merge their entry into the index as it is on disk.
+
+    homographies.json    list of entries, see HomographyCache.put
+    homographies.lock    lock of writers, empty
+"""
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+import cv2 as cv
+import numpy as np
+
+from processing.court import Bin, Render
+
+try:
+    import fcntl
+except ImportError:  # Windows, writers only merge without a lock
+    fcntl = None
+
+CACHE_VERSION = 1
+
+
+def first_frames(video_path: str, frames: int = 3, stride: int = 10):
+    """
+    Frames spread over the start of a video
+    @param video_path, path from project root to video file
+    @param frames, number of frames read
+    @param stride, frames between read frames, only grabbed and not decoded to bgr
+    @returns list of bgr frames, empty if the video can't be read
+    """
+    video = cv.VideoCapture(video_path)
+    read = []
+    for i in range(frames * stride):
+        if i % stride:
+            if not video.grab():
+                break
+            continue
+        ok, frame = video.read()
+        if not ok:
+            break
+        read.append(frame)
+    video.release()
+    return read
+
+
+def fingerprint(frames: list):
+    """
+    Resolution and 64 bit difference hash of frames of a video
+    @param frames, bgr frames, their median removes moving players
+    @returns (width, height), hash as int, or None if there are no frames
+    """
+    if not frames:
+        return None
+    grays = [cv.cvtColor(frame, cv.COLOR_BGR2GRAY) for frame in frames]
+    median = np.median(np.stack(grays), axis=0).astype(np.uint8)
+    small = cv.resize(median, (9, 8), interpolation=cv.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    height, width = grays[0].shape
+    return (width, height), int("".join("1" if b else "0" for b in bits), 2)
+
+
+class HomographyCache:
+    """
+    Homographies of previously processed videos, stored in a directory
+    """
+
+    def __init__(self, path, max_distance: int = 10, min_ratio: float = 0.5):
+        """
+        @param path, directory of the cache, created on first write
+        @param max_distance, most differing hash bits of a matching video
+        @param min_ratio, fraction of its cached goodness a homography has to score
+        on the new video to be used
+        """
+        self.path = Path(path)
+        self.max_distance = max_distance
+        self.min_ratio = min_ratio
+
+    def _entries(self):
+        index = self.path / "homographies.json"
+        if not index.is_file():
+            return []
+        with open(index, "r") as f:
+            data = json.load(f)
+        if data.get("version") != CACHE_VERSION:
+            return []
+        return data["entries"]
+
+    @contextmanager
+    def _locked(self):
+        "Holds the lock of writers of the cache directory"
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / "homographies.lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write(self, entries):
+        index = self.path / "homographies.json"
+        tmp = index.with_name(index.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"version": CACHE_VERSION, "entries": entries}, f, indent=1)
+        os.replace(tmp, index)
+
+    def lookup(self, key):
+        """
+        Nearest cached entry of a video by hash distance
+        @param key, fingerprint of the video
+        @returns entry dict, or None if no entry is within max_distance
+        """
+        if key is None:
+            return None
+        resolution, phash = key
+        best, best_distance = None, self.max_distance + 1
+        for entry in self._entries():
+            if tuple(entry["resolution"]) != resolution:
+                continue
+            distance = bin(int(entry["hash"], 16) ^ phash).count("1")
+            if distance < best_distance:
+                best, best_distance = entry, distance
+        return best
+
+    def get(self, video_path: str):
+        """
+        Verified homography of a video of a cached camera
+        @returns 3x3 homography from video to truth map, or None on a miss or
+        if the cached homography does not fit the video
+        """
+        frames = first_frames(video_path)
+        entry = self.lookup(fingerprint(frames))
+        if entry is None:
+            return None
+        homography = np.array(entry["homography"])
+        render = Render(video_path, display_images=False, frame=frames[0], detect=False)
+        goodness = max(
+            render.frame_goodness(None, homography),
+            render.frame_goodness(None, homography, Bin(0, *entry["court_bin"])),
+        )
+        if goodness < self.min_ratio * entry["goodness"]:
+            print(
+                f"Cached court homography rejected, goodness {goodness:.3f} < "
+                f"{self.min_ratio} x {entry['goodness']:.3f}."
+            )
+            return None
+        return homography
+
+    def put(self, video_path: str, homography: np.ndarray):
+        """
+        Caches the homography of a video, replacing the entry of the same camera
+        @param homography, 3x3 homography from first frame of video to truth map
+        """
+        frames = first_frames(video_path)
+        key = fingerprint(frames)
+        if key is None or homography is None:
+            return
+        resolution, phash = key
+        render = Render(video_path, display_images=False, frame=frames[0], detect=False)
+        court_bin = render.get_court_bin()
+        entry = {
+            "resolution": list(resolution),
+            "hash": f"{phash:016x}",
+            "homography": np.asarray(homography, dtype=float).tolist(),
+            "goodness": render.frame_goodness(None, homography),
+            "court_bin": [
+                court_bin.one_lower,
+                court_bin.one_upper,
+                court_bin.two_lower,
+                court_bin.two_upper,
+            ],
+            "video": os.path.basename(video_path),
+        }
+        # read again under the lock, entries put meanwhile by other runs stay
+        with self._locked():
+            previous = self.lookup(key)
+            entries = [e for e in self._entries() if e != previous]
+            self._write(entries + [entry])
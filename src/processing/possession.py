@@ -4,9 +4,15 @@ from state import PlayerState
 
 
 class PossessionComputer:
-    def __init__(self, frames, players):
+    def __init__(self, frames, players, trajectories=None):
         self.players = players
         self.frames = frames
+        # court distances only if the court homography is trustworthy
+        self.trajectories = (
+            trajectories
+            if trajectories is not None and trajectories.reliable()
+            else None
+        )
         self.rolling_scores = []
         self.dominant_possessions = []
         self.possessions = []
@@ -25,7 +31,7 @@ class PossessionComputer:
 
         return self.possessions
 
-    def _compute_frame_rankings(self, DISTANCE_THRESHOLD=100):
+    def _compute_frame_rankings(self, DISTANCE_THRESHOLD=100, DISTANCE_THRESHOLD_METERS=1.0):
         """
         Compute frame-by-frame possession of the ball.
         Players are ranked based on their distance to the ball and the intersection area.
@@ -33,6 +39,8 @@ class PossessionComputer:
         the most likely possessor.
         Only consider players within a distance of X from the ball and who have a non-zero
         intersection area with the ball.
+        With court trajectories, distances are in meters at the court scale of the player's
+        feet, so the threshold does not depend on how far the player is from the camera.
         """
         for index, frame in enumerate(self.frames):
             if frame.ball is None:
@@ -46,9 +54,13 @@ class PossessionComputer:
             for player_id, player in frame.players.items():
                 dist = player.box.distance_between_boxes(ball_box)
                 intersection_area = player.box.area_of_intersection(ball_box)
+                threshold = DISTANCE_THRESHOLD
+                scale = self._court_scale(index, player_id)
+                if scale is not None:
+                    dist, threshold = dist * scale, DISTANCE_THRESHOLD_METERS
 
                 # Check if player is within range X and has intersection area
-                if dist <= DISTANCE_THRESHOLD and intersection_area > 0:
+                if dist <= threshold and intersection_area > 0:
                     distance_ranking.append((player_id, dist))
                     # Negative area for sorting purpose
                     area_ranking.append((player_id, -intersection_area))
@@ -74,6 +86,19 @@ class PossessionComputer:
 
             # print(f"frame {index}: {frame.possessions}")
 
+    def _court_scale(self, index, player_id):
+        """
+        Meters per video pixel at the feet of player in frame index, or None
+        without court trajectories
+        """
+        if self.trajectories is None:
+            return None
+        column = self.trajectories.columns.get(player_id)
+        if column is None:
+            return None
+        scale = self.trajectories.scale[index, column]
+        return None if scale != scale else float(scale)  # NaN if not seen
+
     def _compute_rolling_scores(self):
         """
         Calculate and store the frame-by-frame score for each player based on their possession position.
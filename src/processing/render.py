@@ -1,43 +1,41 @@
 """
-Video Rendering module for courtline detection and video reencoding.
+Video Rendering module for the courtline minimap, encoded to H.264 through ffmpeg.
 """
 import cv2 as cv
 import random
 import os
 import numpy as np
-from ffmpy import FFmpeg
-from state import GameState
+from state import GameState, Trajectories
+from processing import trajectory
+from processing.video_sink import VideoSink
 
 
-# pass in homo matrix +  +
-# implement video reencoding
 class VideoRender:
-    def __init__(self, homography):
+    def __init__(self, homography, encoding: dict = None):
+        """
+        @param homography, 3x3 matrix from video to truth map, or one such matrix
+        per frame of the video stacked into a (frames, 3, 3) array
+        @param encoding, VideoSink options (preset, crf, threads) of the minimap
+        """
         self._TRUE_PATH = os.path.join("data", "true_map.png")
         self._TRUTH_COURT_MAP = cv.imread(self._TRUE_PATH, cv.IMREAD_GRAYSCALE)
         self._HOMOGRAPHY = homography
+        self._ENCODING = encoding or {}
+        self._RADIUS = 10
+        "radius of player dots"
+        self._FONT = cv.FONT_HERSHEY_SIMPLEX
+        self._FONT_SCALE = 1
+        self._THICKNESS = 2
+        "thickness of label text"
 
-    def reencode(self, input_path, output_path):
-        """
-        Re-encodes a MPEG4 video file to H.264 format. Overrides existing output videos if present.
-        Deletes the unprocessed video when complete.
-        """
-
-        ff = FFmpeg(
-            inputs={input_path: "-y"},
-            outputs={output_path: "-c:a copy -c:v libx264"},
-        )
-        ff.run()
-        os.remove(input_path)
-        os.rename(output_path,input_path)
-
-    def render_video(self, state: GameState, filename: str, fps: int = 30):
+    def render_video(self, state: GameState, filename: str, fps: int = 30, on_frame=None):
         """
         Takes into player position data, applied homography,
-        and renders video stored in filename
+        and renders video stored in filename, encoded by VideoSink
             state: GameState with at least bounding boxes on it
             filename: file path from project root where video is saved
             fps: frames per second expected of produced video
+            on_frame: called with (frames written, frames to write) after every frame
         """
         frames = state.frames
         players = list(state.players.keys())
@@ -46,26 +44,27 @@ class VideoRender:
         height, width, _ = background.shape
 
         # Initialize the video writer
-        fourcc = cv.VideoWriter_fourcc(*"mp4v")
-        video_writer = cv.VideoWriter(filename, fourcc, fps, (width, height))
+        video_writer = VideoSink(filename, fps, (width, height), **self._ENCODING)
 
-        # Define initial positions for each player
-        player_state: dict[str, dict] = {}
-        for id in players:
-            player_state.update(
-                {
-                    id: {
-                        "pos": (0, 0),
-                        "detected": False,
-                        "color": (
-                            random.randint(0, 256),
-                            random.randint(0, 256),
-                            random.randint(0, 256),
-                        ),
-                    }
-                }
+        # Define a color and a pre-rendered dot and label for each player
+        sprites = {
+            id: self._sprite(
+                id,
+                (random.randint(0, 256), random.randint(0, 256), random.randint(0, 256)),
             )
+            for id in players
+        }
+
+        # court positions of every player in every frame, transformed at once
+        if state.trajectories is not None:
+            court_points = self._trajectory_points(state.trajectories, players)
+        else:
+            court_points = self._court_points(frames, players)
 
+        # only regions of sprites drawn on the last frame are redrawn
+        frame = background.copy()
+        drawn: list[tuple] = []
+        last_dots = None
         # find duration of video
         dur = frames[-1].frameno
         fi = 0
@@ -73,63 +72,150 @@ class VideoRender:
         for t in range(dur + 1):
             if (t % 100 == 0):
                 print(f"Court render frame {t}/{dur}.")
-            # Create a copy of the background image to draw the points on
-            frame = background.copy()
 
             # Get dictionary of positions at each frame
-            for id in player_state:
-                player_state.get(id).update({"detected": False})  # reset detection
+            detected = {}
             while fi < len(frames) and frames[fi].frameno <= t:
-                f = frames[fi]
-                for id in players:  # update pos for each player
-                    if id in f.players:
-                        b = f.players.get(id).box  # get new player frame
-                        x, y = (b.xmin + b.xmax) / 2.0, b.ymax
-                        x, y = self._transform_point(x, y)
-                        player_state.get(id).update({"pos": (x, y)})
-                        player_state.get(id).update({"detected": True})
+                detected.update(court_points[fi])  # update pos of each player
                 fi += 1
+            dots = [(id, detected[id]) for id in players if id in detected]
 
-            # Loop through each point and draw it on the frame
-            for id in players:
-                if not player_state.get(id).get("detected"):
-                    continue
-                pos = player_state[id]["pos"]
-                pos = (int(pos[0]), int(pos[1]))
-                color = player_state[id]["color"]
-                font = cv.FONT_HERSHEY_SIMPLEX
-                thickness = 2
-                font_scale = 1
-                radius = 10
-                text_width = cv.getTextSize(id, font, font_scale, thickness)[0][0]
-                cv.circle(
-                    img=frame, center=pos, radius=radius, color=color, thickness=-1
-                )
-                cv.putText(
-                    img=frame,
-                    text=id,
-                    org=(pos[0] - (text_width // 2), pos[1] - radius - 10),
-                    fontFace=font,
-                    fontScale=font_scale,
-                    color=color,
-                    thickness=thickness,
-                    lineType=cv.LINE_AA,
-                )
+            if dots != last_dots:
+                for y0, y1, x0, x1 in drawn:
+                    frame[y0:y1, x0:x1] = background[y0:y1, x0:x1]
+                drawn = []
+                for id, pos in dots:
+                    drawn += self._draw_sprite(frame, sprites[id], pos)
+                last_dots = dots
 
             # Write the frame to the video writer
             video_writer.write(frame)
+            if on_frame is not None:
+                on_frame(t + 1, dur + 1)
 
         # Release the video writer
         video_writer.release()
 
-    def _transform_point(self, x: float, y: float):
+    def _sprite(self, id: str, color: tuple):
+        """
+        Dot and label of a player, drawn once and blended onto every frame
+        @param id, label of player
+        @param color, bgr color of player
+        @returns list of parts, dicts of coverage weights, color and offset
+        of the part from the position of the player; dot before label
+        """
+        r = self._RADIUS
+        text_width = cv.getTextSize(id, self._FONT, self._FONT_SCALE, self._THICKNESS)[0][0]
+        size = max(2 * r, text_width) + 8 * self._THICKNESS
+        dot = np.zeros((size, size), dtype=np.uint8)
+        label = np.zeros((size, size), dtype=np.uint8)
+        center = size // 2
+        cv.circle(img=dot, center=(center, center), radius=r, color=255, thickness=-1)
+        # text is drawn with its baseline at the center, offsets are added back below
+        cv.putText(
+            img=label,
+            text=id,
+            org=(center - (text_width // 2), center),
+            fontFace=self._FONT,
+            fontScale=self._FONT_SCALE,
+            color=255,
+            thickness=self._THICKNESS,
+            lineType=cv.LINE_AA,
+        )
+        parts = []
+        for mask, dy in ((dot, 0), (label, -r - 10)):
+            x, y, w, h = cv.boundingRect(mask)
+            weight = mask[y : y + h, x : x + w].astype(np.float32) / 255
+            parts.append(
+                {
+                    "weight": weight,
+                    "background_weight": 1 - weight,
+                    "color": np.full((h, w, 3), np.minimum(color, 255), dtype=np.uint8),
+                    "offset": (x - center, y - center + dy),
+                }
+            )
+        return parts
+
+    def _draw_sprite(self, frame: np.ndarray, sprite: list, pos: tuple):
+        """
+        Blends parts of sprite onto frame at pos, clipped to the frame
+        @returns list of (y0, y1, x0, x1) regions drawn
+        """
+        height, width, _ = frame.shape
+        rects = []
+        for part in sprite:
+            part_height, part_width = part["weight"].shape
+            x = int(pos[0]) + part["offset"][0]
+            y = int(pos[1]) + part["offset"][1]
+            x0, y0 = max(x, 0), max(y, 0)
+            x1, y1 = min(x + part_width, width), min(y + part_height, height)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            crop = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+            frame[y0:y1, x0:x1] = cv.blendLinear(
+                frame[y0:y1, x0:x1],
+                part["color"][crop],
+                part["background_weight"][crop],
+                part["weight"][crop],
+            )
+            rects.append((y0, y1, x0, x1))
+        return rects
+
+    def _court_points(self, frames: list, players: list):
+        """
+        Court positions of the feet (bottom center of box) of players in every frame
+        @param frames, frames of the game
+        @param players, ids of players to transform
+        @returns list with a dict {player id: (x, y)} for every frame
+        """
+        tracked = set(players)
+        ids, owners, framenos, points = [], [], [], []
+        for fi, f in enumerate(frames):
+            for id, player in f.players.items():
+                if id not in tracked:
+                    continue
+                b = player.box
+                ids.append(id)
+                owners.append(fi)
+                framenos.append(f.frameno)
+                points.append(((b.xmin + b.xmax) / 2.0, b.ymax))
+        court_points = [{} for _ in frames]
+        if not points:
+            return court_points
+        transformed = self._transform_points(
+            np.array(points, dtype=np.float32), np.array(framenos)
+        )
+        for id, fi, pos in zip(ids, owners, transformed.tolist()):
+            court_points[fi][id] = tuple(pos)
+        return court_points
+
+    def _trajectory_points(self, trajectories: Trajectories, players: list):
+        """
+        Truth map positions of players from court trajectories
+        @param trajectories, court trajectories of the game
+        @param players, ids of players to draw
+        @returns list with a dict {player id: (x, y)} for every frame
+        """
+        columns = [(id, trajectories.columns[id]) for id in players if id in trajectories.columns]
+        pixels = trajectory.to_map(trajectories.positions).tolist()
+        seen = ~np.isnan(trajectories.positions[..., 0])
+        return [
+            {id: tuple(pixels[fi][c]) for id, c in columns if seen[fi, c]}
+            for fi in range(len(pixels))
+        ]
+
+    def _transform_points(self, points: np.ndarray, framenos: np.ndarray):
         """
-        Applies court homography to single point
-        @param x,y pixel positions of point on court video
-        @returns transformed pixels x,y positions on true court
+        Applies court homography to many points at once
+        @param points, (N, 2) pixel positions of points on court video
+        @param framenos, (N,) frame number of every point, selects per frame homographies
+        @returns (N, 2) transformed pixel positions on true court
         """
-        point = np.array([x, y], dtype=np.float32)
-        point = point.reshape((1, 1, 2))
-        transformed_point = cv.perspectiveTransform(point, self._HOMOGRAPHY)
-        tx, ty = transformed_point[0, 0]
-        return tx, ty
+        if self._HOMOGRAPHY.ndim == 2:
+            return cv.perspectiveTransform(
+                points.reshape(-1, 1, 2), self._HOMOGRAPHY
+            ).reshape(-1, 2)
+        h = self._HOMOGRAPHY[np.minimum(framenos, len(self._HOMOGRAPHY) - 1)]
+        points = np.hstack((points, np.ones((len(points), 1), dtype=points.dtype)))
+        projected = np.einsum("nij,nj->ni", h, points)
+        return projected[:, :2] / projected[:, 2:]
@@ -1,4 +1,5 @@
-from state import GameState, ShotAttempt, Box, Interval
+from state import GameState, ShotAttempt, ShotType, Box, Interval
+from processing import trajectory
 
 class ShotFrame:
     def __init__(self):
@@ -39,9 +40,28 @@ def madeshot(state: GameState, inte: Interval, window: int) -> ShotAttempt:
         if sfs[i].rim:
             r -= 1  # remove from window
 
+    if sa.made:
+        position = release_position(state, sa)
+        if position is not None:
+            sa.type = ShotType.THREE if trajectory.is_three(*position) else ShotType.TWO
     return sa
 
 
+def release_position(state: GameState, sa: ShotAttempt):
+    """
+    Court position in meters of the shooter at the last frame of the attempt
+    they were seen in, or None without reliable court trajectories
+    """
+    trajectories = state.trajectories
+    if trajectories is None or not trajectories.reliable():
+        return None
+    for i in range(sa.end, sa.start - 1, -1):
+        position = trajectories.position(sa.playerid, i)
+        if position is not None:
+            return position
+    return None
+
+
 def shots(state: GameState, window: int):
     """
     Calculate shots throughout game
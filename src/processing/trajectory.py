@@ -0,0 +1,105 @@
+"""
+Court plane trajectories of players and the ball, in meters.
+
+Feet (bottom center of boxes) of every detection are mapped through the court
+homography in one vectorized pass. Court coordinates put the origin at the
+center of the baseline, x along the baseline and y into the court, using the
+geometry of the truth map (data/true_map.png, a 50 x 47 ft half court).
+"""
+import numpy as np
+from state import GameState, Trajectories
+
+PIXELS_PER_METER = (1021 - 18) / 15.24
+"Truth map scale, its sidelines are 50 ft apart"
+MAP_ORIGIN = (519.5, 17.5)
+"Truth map pixel of the center of the baseline"
+HALF_COURT = (7.62, 14.33)
+"Half width and length of the half court in meters"
+HOOP = (0.0, (115.8 - 17.5) / PIXELS_PER_METER)
+"Center of the hoop in meters"
+THREE_POINT_RADIUS = 419.0 / PIXELS_PER_METER
+"Radius of the three point arc around the hoop in meters"
+THREE_POINT_CORNER = 413.6 / PIXELS_PER_METER
+"Distance of the straight corner three point lines from the center line"
+
+
+def compute(state: GameState, homography: np.ndarray) -> Trajectories:
+    """
+    Court trajectories of every player and the ball of state
+    @param homography, 3x3 matrix from video to truth map, or one per frame
+    stacked into a (frames, 3, 3) array
+    """
+    frames = state.frames
+    players = list(state.players.keys())
+    columns = {id: i for i, id in enumerate(players)}
+    rows, cols, points = [], [], []
+    ball_rows, ball_points = [], []
+    for fi, f in enumerate(frames):
+        for id, player in f.players.items():
+            if id in columns:
+                b = player.box
+                rows.append(fi)
+                cols.append(columns[id])
+                points.append(((b.xmin + b.xmax) / 2.0, b.ymax))
+        if f.ball is not None:
+            b = f.ball.box
+            ball_rows.append(fi)
+            ball_points.append(((b.xmin + b.xmax) / 2.0, b.ymax))
+    framenos = np.array([f.frameno for f in frames], dtype=np.int64)
+
+    positions = np.full((len(frames), len(players), 2), np.nan, dtype=np.float32)
+    scale = np.full((len(frames), len(players)), np.nan, dtype=np.float32)
+    if points:
+        rows, cols = np.array(rows), np.array(cols)
+        xy, s = to_court(np.array(points), homography, framenos[rows])
+        positions[rows, cols] = xy
+        scale[rows, cols] = s
+    ball = np.full((len(frames), 2), np.nan, dtype=np.float32)
+    if ball_points:
+        ball_rows = np.array(ball_rows)
+        ball[ball_rows] = to_court(np.array(ball_points), homography, framenos[ball_rows])[0]
+
+    seen = positions[~np.isnan(positions[..., 0])]
+    on_court = float(np.mean(in_half_court(seen))) if len(seen) else 0.0
+    return Trajectories(framenos, players, positions, scale, ball, on_court)
+
+
+def to_court(points: np.ndarray, homography: np.ndarray, framenos: np.ndarray):
+    """
+    Maps video pixels onto the court plane
+    @param points, (N, 2) pixel positions on court video
+    @param homography, 3x3 matrix from video to truth map, or (frames, 3, 3)
+    @param framenos, (N,) frame number of every point, selects per frame homographies
+    @returns (N, 2) positions in meters, and (N,) meters per video pixel around them
+    """
+    if homography.ndim == 2:
+        h = np.broadcast_to(homography, (len(points), 3, 3))
+    else:
+        h = homography[np.minimum(framenos, len(homography) - 1)]
+    w = np.einsum("nj,nj->n", h[:, 2, :2], points) + h[:, 2, 2]
+    mapped = (np.einsum("nij,nj->ni", h[:, :2, :2], points) + h[:, :2, 2]) / w[:, None]
+    # jacobian of the projection gives the local scale of the homography
+    jacobian = (h[:, :2, :2] - mapped[:, :, None] * h[:, 2, None, :2]) / w[:, None, None]
+    scale = np.sqrt(np.abs(np.linalg.det(jacobian))) / PIXELS_PER_METER
+    return (mapped - MAP_ORIGIN) / PIXELS_PER_METER, scale
+
+
+def to_map(positions: np.ndarray) -> np.ndarray:
+    "Truth map pixels of court positions in meters"
+    return positions * PIXELS_PER_METER + MAP_ORIGIN
+
+
+def in_half_court(positions: np.ndarray) -> np.ndarray:
+    "Whether (N, 2) court positions in meters are inside the half court"
+    return (
+        (np.abs(positions[:, 0]) <= HALF_COURT[0])
+        & (positions[:, 1] >= 0)
+        & (positions[:, 1] <= HALF_COURT[1])
+    )
+
+
+def is_three(x: float, y: float) -> bool:
+    "Whether a shot from court position (x, y) in meters is worth three points"
+    if y <= HOOP[1]:
+        return abs(x) >= THREE_POINT_CORNER
+    return np.hypot(x - HOOP[0], y - HOOP[1]) >= THREE_POINT_RADIUS
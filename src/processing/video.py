@@ -1,7 +1,30 @@
 import cv2
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from ffmpy import FFmpeg
 from state import GameState, Keypoint, ShotAttempt, Interval
+from processing.video_sink import VideoSink
 import random
 
+_RENDERING = {}
+"VideoCreator of the worker process, set by _init_rendering"
+
+
+def _init_rendering(creator):
+    "Process pool initializer, stores the VideoCreator segments are rendered by"
+    _RENDERING.update(creator=creator)
+
+
+def _render_segment(start: int, end: int, output_path: str):
+    "Renders frames [start, end) of the video of _init_rendering to output_path"
+    creator = _RENDERING["creator"]
+    cap = cv2.VideoCapture(creator.video_path)
+    return creator.render_range(cap, start, end, output_path)
+
 
 class VideoCreator:
     """Class for creating processed video"""
@@ -17,14 +40,24 @@ class VideoCreator:
     LINE_WIDTH = 2
     LABEL_SIZE = 2
     CIRCLE_RADIUS = 3
+    MIN_SEGMENT_FRAMES = 300  # shorter segments are not worth a worker process
 
     def __init__(
-        self, game_state: GameState, video_path: str, output_path: str
+        self,
+        game_state: GameState,
+        video_path: str,
+        output_path: str,
+        encoding: dict = None,
+        workers: int = 0,
     ) -> None:
-        # Initialize with game state, input video path, and output video path
+        # Initialize with game state, input video path, output video path,
+        # VideoSink options (preset, crf, threads) of the output video,
+        # and processes rendering segments, 0 for one per core
         self.state = game_state
         self.video_path = video_path
         self.output_path = output_path
+        self.encoding = encoding or {}
+        self.workers = workers
         self.shot_attempt_active = False
         self.player_colors = {}
 
@@ -63,11 +96,11 @@ class VideoCreator:
             x, y = kp.x, kp.y
             cv2.circle(frame, (int(x), int(y)), self.CIRCLE_RADIUS, color, -1)
 
-    def vary_color(self, color, delta: int):
+    def vary_color(self, color, delta: int, rng=random):
         "Generates random color within delta var"
 
         def rand():
-            return random.randint(-delta, delta)
+            return rng.randint(-delta, delta)
 
         def bound(x):
             return min(max(0, x), 255)
@@ -83,10 +116,12 @@ class VideoCreator:
 
         if not player_id in self.player_colors:
             c = (255, 255, 255)
+            # seeded by id, so every segment of the video gives the same color
+            rng = random.Random(player_id)
             if player_id in self.state.team1.players:
-                c = self.vary_color(self.TEAM1_COLOR, 50)
+                c = self.vary_color(self.TEAM1_COLOR, 50, rng)
             elif player_id in self.state.team2.players:
-                c = self.vary_color(self.TEAM2_COLOR, 50)
+                c = self.vary_color(self.TEAM2_COLOR, 50, rng)
             self.player_colors.update({player_id: c})
             return c
         else:
@@ -102,26 +137,106 @@ class VideoCreator:
             append += " Poss"
         return label + append  # Return the label after checks
 
-    def run(self):
+    def run(self, on_frame=None):
+        """
+        Renders the processed video, in segments across a process pool when
+        there are enough frames, which are joined without reencoding
+            on_frame: called with (frames rendered, frames of the video), after
+            every frame or, rendering in segments, after every segment
+        """
         # Capture video from the video path
         cap = cv2.VideoCapture(self.video_path)
         if not cap.isOpened():
             print("Error: Could not open video.")
             return
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        workers = self.workers or os.cpu_count() or 1
+        segments = min(workers, total_frames // self.MIN_SEGMENT_FRAMES)
+        if segments <= 1 or shutil.which("ffmpeg") is None:
+            written = self.render_range(cap, 0, None, self.output_path, on_frame)
+        else:
+            cap.release()
+            written = self._render_segments(total_frames, segments, workers, on_frame)
+        if not written:
+            print("Error: Couldn't read the first frame.")
+            return
+        cv2.destroyAllWindows()
+
+        # Print completion message
+        print(f"Video processing complete. Output saved to: {self.output_path}")
+
+    def _render_segments(
+        self, total_frames: int, segments: int, workers: int, on_frame=None
+    ):
+        "Renders segments of the video in a process pool and concatenates them"
+        bounds = np.linspace(0, total_frames, segments + 1).astype(int).tolist()
+        bounds[-1] = None  # frame count is an estimate, last segment reads to the end
+        output_dir = os.path.dirname(os.path.abspath(self.output_path))
+        with tempfile.TemporaryDirectory(dir=output_dir) as tmp:
+            paths = [os.path.join(tmp, f"segment{i}.mp4") for i in range(segments)]
+            # forked workers inherit the threads of torch and cv2 and can deadlock
+            with ProcessPoolExecutor(
+                max_workers=min(workers, segments),
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_rendering,
+                initargs=(self,),
+            ) as pool:
+                futures = [
+                    pool.submit(_render_segment, start, end, path)
+                    for start, end, path in zip(bounds[:-1], bounds[1:], paths)
+                ]
+                done = 0
+                for future in as_completed(futures):
+                    done += future.result()
+                    if on_frame is not None:
+                        on_frame(done, max(total_frames, done))
+                written = [future.result() for future in futures]
+            if not written[0]:
+                return 0
+            paths = [path for path, n in zip(paths, written) if n]
+            segment_list = os.path.join(tmp, "segments.txt")
+            with open(segment_list, "w") as f:
+                # quotes in paths are escaped as '\'' in the concat demuxer
+                f.writelines(
+                    "file '{}'\n".format(path.replace("'", "'\\''")) for path in paths
+                )
+            FFmpeg(
+                global_options="-y -loglevel error",
+                inputs={segment_list: "-f concat -safe 0"},
+                outputs={self.output_path: "-c copy -movflags +faststart"},
+            ).run()
+        return sum(written)
+
+    def render_range(self, cap, start: int, end: int, output_path: str, on_frame=None):
+        """
+        Draws frames [start, end) of the video and encodes them to output_path
+            cap: capture of the video, released when done
+            end: None renders to the end of the video
+            on_frame: called with (frames written, frames to write) after every frame
+        Returns the number of frames written
+        """
+        if start and (
+            not cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+            or int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start
+        ):
+            # inexact seek, decode from the start
+            cap.release()
+            cap = cv2.VideoCapture(self.video_path)
+            for _ in range(start):
+                cap.grab()
 
         # Get video properties
         fps = cap.get(cv2.CAP_PROP_FPS)
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
         # Read the first frame to establish video size
         ret, frame = cap.read()
         if not ret:
-            print("Error: Couldn't read the first frame.")
-            return
+            cap.release()
+            return 0
 
-        # Set up the output video writer with the same size as the input video
         height, width, _ = frame.shape
-        out = cv2.VideoWriter(self.output_path, fourcc, fps, (width, height))
 
         # Read frames from GameState
         frames = self.state.frames
@@ -132,89 +247,94 @@ class VideoCreator:
 
         posses = self.state.possessions
         poss_idx = 0  # for possession list
-        while cap.isOpened():
-            if not ret:
-                break
-            f = int(cap.get(cv2.CAP_PROP_POS_FRAMES))  # cv2 frame
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            if f % 100 == 0:
-                print(f"Processed video render frame {f}/{total_frames}.")
-
-            # catch up state frame
-            while idx < len(frames) and frames[idx].frameno < f:
-                idx += 1
-            game_frame = (
-                frames[idx] if idx < len(frames) and frames[idx].frameno == f else None
-            )
+        f = start + 1  # cv2 frame, position after reading the frame
+        count = (end if end is not None else max(total_frames, 1)) - start
+        # Set up the output video writer with the same size as the input video,
+        # released even if drawing a frame fails
+        with VideoSink(output_path, fps, (width, height), **self.encoding) as out:
+            while ret and (end is None or f <= end):
+                if f % 100 == 0:
+                    print(f"Processed video render frame {f}/{total_frames}.")
+
+                # catch up state frame
+                while idx < len(frames) and frames[idx].frameno < f:
+                    idx += 1
+                game_frame = (
+                    frames[idx]
+                    if idx < len(frames) and frames[idx].frameno == f
+                    else None
+                )
 
-            # catch up shot_attempt
-            while shot_idx < len(shots) and shots[shot_idx].end < f:
-                shot_idx += 1
-            shot = (
-                shots[shot_idx]
-                if shot_idx < len(shots) and shots[shot_idx].start <= f
-                else None
-            )
+                # catch up shot_attempt
+                while shot_idx < len(shots) and shots[shot_idx].end < f:
+                    shot_idx += 1
+                shot = (
+                    shots[shot_idx]
+                    if shot_idx < len(shots) and shots[shot_idx].start <= f
+                    else None
+                )
 
-            # catch up possession interval
-            while poss_idx < len(posses) and posses[poss_idx].end < f:
-                poss_idx += 1
-            poss = (
-                posses[poss_idx]
-                if poss_idx < len(posses) and posses[poss_idx].start <= f
-                else None
-            )
+                # catch up possession interval
+                while poss_idx < len(posses) and posses[poss_idx].end < f:
+                    poss_idx += 1
+                poss = (
+                    posses[poss_idx]
+                    if poss_idx < len(posses) and posses[poss_idx].start <= f
+                    else None
+                )
 
-            # Get the game frame data for the current frame count
-
-            if game_frame:
-                # Draw boxes and labels for players
-                for player_id, player_frame in game_frame.players.items():
-                    player_label = self.get_player_label(
-                        player_id, shot, poss
-                    )  # Determine label
-                    player_color = self.get_player_color(
-                        player_id, shot, poss
-                    )  # Determine color
-                    self.draw_boxes(
-                        frame, [player_frame.box], player_color, label=player_label
-                    )
-                    self.draw_keypoints(frame, player_frame.keypoints, player_color)
-
-                # Draw box for the ball with or without label depending on shot attempt
-                if game_frame.ball:
-                    ball_label = "Ball"
-                    self.draw_boxes(
-                        frame, [game_frame.ball.box], self.BALL_COLOR, label=ball_label
-                    )
-
-                # Draw box for the rim with label
-                if game_frame.rim:
-                    self.draw_boxes(
-                        frame, [game_frame.rim], self.RIM_COLOR, label="Rim"
-                    )
-
-            # Display the current frame count on the frame
-            cv2.putText(
-                frame,
-                f"Frame: {f}",
-                (width - 150, height - 10),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.6,
-                (255, 255, 255),
-                2,
-            )
+                # Get the game frame data for the current frame count
+
+                if game_frame:
+                    # Draw boxes and labels for players
+                    for player_id, player_frame in game_frame.players.items():
+                        player_label = self.get_player_label(
+                            player_id, shot, poss
+                        )  # Determine label
+                        player_color = self.get_player_color(
+                            player_id, shot, poss
+                        )  # Determine color
+                        self.draw_boxes(
+                            frame, [player_frame.box], player_color, label=player_label
+                        )
+                        self.draw_keypoints(frame, player_frame.keypoints, player_color)
+
+                    # Draw box for the ball with or without label depending on shot attempt
+                    if game_frame.ball:
+                        ball_label = "Ball"
+                        self.draw_boxes(
+                            frame,
+                            [game_frame.ball.box],
+                            self.BALL_COLOR,
+                            label=ball_label,
+                        )
+
+                    # Draw box for the rim with label
+                    if game_frame.rim:
+                        self.draw_boxes(
+                            frame, [game_frame.rim], self.RIM_COLOR, label="Rim"
+                        )
+
+                # Display the current frame count on the frame
+                cv2.putText(
+                    frame,
+                    f"Frame: {f}",
+                    (width - 150, height - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.6,
+                    (255, 255, 255),
+                    2,
+                )
 
-            # Write the processed frame to the output video
-            out.write(frame)
+                # Write the processed frame to the output video
+                out.write(frame)
 
-            # Read the next frame from the video
-            ret, frame = cap.read()
+                # Read the next frame from the video
+                ret, frame = cap.read()
+                f += 1
+                if on_frame is not None:
+                    on_frame(f - start - 1, max(count, f - start - 1))
 
         # Release resources
         cap.release()
-        out.release()
-        cv2.destroyAllWindows()
-
-        # Print completion message
-        print(f"Video processing complete. Output saved to: {self.output_path}")
+        return f - start - 1
@@ -0,0 +1,92 @@
+"""
+Video sink encoding frames to H.264 in a single pass.
+
+Raw BGR frames are streamed through stdin into one ffmpeg subprocess running
+libx264, so output videos play in browsers without writing an intermediate
+mp4v file and reencoding it. Without ffmpeg on PATH frames are written with
+cv2.VideoWriter as mp4v instead.
+"""
+import shutil
+import subprocess
+
+import cv2 as cv
+import numpy as np
+
+
+class VideoSink:
+    """
+    Writer with the interface of cv.VideoWriter: write(frame) and release()
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        fps: float,
+        size: tuple,
+        preset: str = "veryfast",
+        crf: int = 23,
+        threads: int = 0,
+    ):
+        """
+        @param filename, path of the video written, overwritten if present
+        @param fps, frames per second of the video
+        @param size, (width, height) of every frame
+        @param preset, x264 preset, slower presets give smaller files
+        @param crf, x264 constant rate factor, lower is higher quality
+        @param threads, encoder threads, 0 lets x264 choose
+        """
+        self.filename = filename
+        self.size = tuple(size)
+        width, height = self.size
+        self._process = None
+        self._writer = None
+        if shutil.which("ffmpeg") is None:
+            print(f"ffmpeg not found, writing {filename} as mp4v.")
+            fourcc = cv.VideoWriter_fourcc(*"mp4v")
+            self._writer = cv.VideoWriter(filename, fourcc, fps, self.size)
+            return
+        # an argument list, not a command line, so paths need no quoting
+        command = ["ffmpeg", "-y", "-loglevel", "error"]
+        command += ["-f", "rawvideo", "-pix_fmt", "bgr24"]
+        command += ["-s", f"{width}x{height}", "-r", str(fps), "-i", "pipe:0"]
+        command += ["-c:v", "libx264", "-preset", preset, "-crf", str(crf)]
+        command += ["-threads", str(threads), "-pix_fmt", "yuv420p"]
+        command += ["-movflags", "+faststart", filename]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame: np.ndarray):
+        "encodes bgr frame of size"
+        height, width = frame.shape[:2]
+        if (width, height) != self.size:
+            raise ValueError(
+                f"frame of size {(width, height)} written to video of size {self.size}"
+            )
+        if self._writer is not None:
+            self._writer.write(frame)
+            return
+        try:
+            self._process.stdin.write(memoryview(np.ascontiguousarray(frame)))
+        except BrokenPipeError:
+            self._process.wait()
+            raise RuntimeError(
+                f"ffmpeg exited with code {self._process.returncode} writing {self.filename}"
+            )
+
+    def release(self):
+        "finishes the video, waiting for the encoder"
+        if self._writer is not None:
+            self._writer.release()
+            return
+        if self._process.stdin.closed:
+            return
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise RuntimeError(
+                f"ffmpeg exited with code {self._process.returncode} writing {self.filename}"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
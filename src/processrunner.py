@@ -1,21 +1,26 @@
 """
 Runner module for processing and statistics
 """
-import state
+import cv2 as cv
+import snapshot
+import stats_store
 from state import GameState
 from processing import (
     parse,
     clean,
     court,
+    homography_cache,
     render,
     shot,
     team,
+    trajectory,
     video,
     trendline,
     action,
     possession,
 )
 from args import DARGS
+from progress import Progress
 
 
 class ProcessRunner:
@@ -25,9 +30,12 @@ class ProcessRunner:
     Effect: updates GameState with statistics and produces courtline video.
     """
 
-    def __init__(self, args=DARGS):
+    def __init__(self, args=DARGS, progress: Progress = None):
         self.args = args
+        self.progress = progress or Progress()
         self.state: GameState = GameState()
+        self.homography = None
+        "court homography, or one per frame, set by run_courtline_detect"
 
     def run_parse(self):
         "Runs parse module over SORT (and pose later) outputs to update GameState"
@@ -51,7 +59,7 @@ class ProcessRunner:
             join_threshold=self.args["join_threshold"],
         )"""
         possession_computer = possession.PossessionComputer(
-            self.state.frames, self.state.players
+            self.state.frames, self.state.players, self.state.trajectories
         )  # Assuming frames is a list of frame objects
         self.state.possessions = possession_computer.compute_possessions()
         self.state.recompute_pass_from_possession()
@@ -65,28 +73,72 @@ class ProcessRunner:
         shot.shots(self.state, window=self.args["shot_window"])
 
     def run_courtline_detect(self):
-        """Runs courtline detection."""
+        """Runs courtline detection and computes court trajectories."""
         if self.args["skip_court"]:
             return
-        c = court.Render(self.args["video_file"], display_images=False)
-        homography = c.get_homography()
-        self.run_video_render(homography)
-
-    def run_video_render(self, homography):
-        """Runs video rendering and reencodes, stores to output_video_path_reenc."""
+        cache, cached = None, None
+        if self.args["court_cache"]:
+            cache = homography_cache.HomographyCache(self.args["court_cache"])
+            cached = cache.get(self.args["video_file"])
+            if cached is not None:
+                print("court homography cache hit!")
+        if self.args["court_check_interval"]:
+            tracker = court.HomographyTracker(
+                self.args["video_file"],
+                check_interval=self.args["court_check_interval"],
+                drift_threshold=self.args["court_drift_threshold"],
+                homography=cached,
+                workers=self.args["video_workers"],
+            )
+            homography = tracker.run()
+            first = homography[0]
+        elif cached is not None:
+            homography = first = cached
+        else:
+            c = court.Render(
+                self.args["video_file"],
+                display_images=False,
+                workers=self.args["video_workers"],
+            )
+            homography = first = c.get_homography()
+        if cache is not None and cached is None:
+            cache.put(self.args["video_file"], first)
+        self.homography = homography
+        self.state.trajectories = trajectory.compute(self.state, homography)
+        self.state.trajectories.save(self.args["trajectory_file"])
+        if not self.state.trajectories.reliable():
+            print(
+                f"only {self.state.trajectories.on_court:.0%} of players are on the court, "
+                "possession and shots fall back to video pixels"
+            )
+
+    def run_video_render(self):
+        """Runs minimap rendering, stores H.264 video to minimap_file."""
         if self.args["skip_court"]:
             return
-        videoRender = render.VideoRender(homography)
-        videoRender.render_video(self.state, self.args["minimap_file"])
-        videoRender.reencode(self.args["minimap_file"], self.args["minimap_temp_file"])
+        videoRender = render.VideoRender(self.homography, self.args["encoding"])
+        videoRender.render_video(
+            self.state,
+            self.args["minimap_file"],
+            on_frame=self.progress.counter("minimap"),
+        )
 
     def run_video_processor(self):
         if self.args["skip_video"]:
             return
         video_creator = video.VideoCreator(
-            self.state, self.args["video_file"], self.args["processed_file"]
+            self.state,
+            self.args["video_file"],
+            self.args["processed_file"],
+            self.args["encoding"],
+            self.args["video_workers"],
         )
-        video_creator.run()
+        video_creator.run(on_frame=self.progress.counter("video"))
+
+    def run_stats(self):
+        "Writes the stats store and the snapshot, read before the videos are done"
+        self.save_stats(self.args["stats_file"])
+        self.save_snapshot(self.args["snapshot_file"])
 
     def run_trendline(self):
         """Runs the LinearTrendline process to track and estimate ball position and velocity."""
@@ -97,28 +149,38 @@ class ProcessRunner:
         """
         Runs all processing and statistics.
         """
-        self.run_parse()
-        print("parsing complete!")
-        self.run_cleaning()
-        print("cleaning complete!")
-        self.run_trendline()
-        print("trendline processing complete!")
-        self.run_possession()
-        print("possession detection complete!")
-        self.run_team_detect()
-        print("team detection complete!")
-        self.run_shot_detect()
-        print("shot detection complete!")
-
-        self.run_courtline_detect()
-        print("court detection and render complete!")
-        self.run_video_processor()
-        print("stats video render complete!")
-
+        stages = [
+            ("parse", self.run_parse, "parsing complete!"),
+            ("clean", self.run_cleaning, "cleaning complete!"),
+            ("trendline", self.run_trendline, "trendline processing complete!"),
+            ("court", self.run_courtline_detect, "court detection complete!"),
+            ("possession", self.run_possession, "possession detection complete!"),
+            ("team", self.run_team_detect, "team detection complete!"),
+            ("shot", self.run_shot_detect, "shot detection complete!"),
+            ("stats", self.run_stats, "stats stored!"),
+            ("minimap", self.run_video_render, "minimap render complete!"),
+            ("video", self.run_video_processor, "stats video render complete!"),
+        ]
+        for stage, run_stage, message in stages:
+            self.progress.start(stage)
+            run_stage()
+            self.progress.finish(stage)
+            print(message)
+
+    def save_stats(self, path: str):
+        "Writes player, team, shot and possession stats to a stats_store at path"
+        cap = cv.VideoCapture(self.args["video_file"])
+        fps = cap.get(cv.CAP_PROP_FPS)
+        cap.release()
+        stats_store.write(self.state, path, fps)
+
+    def save_snapshot(self, path: str):
+        "Writes the GameState, frames included, to a snapshot at path"
+        snapshot.write(self.state, path)
 
     def get_results(self):
         """
-        Returns string of processed statistics.
+        Returns string of processed statistics, frames left to the snapshot.
         """
 
-        return str(state.todict(self.state))
+        return str(snapshot.summary(self.state))
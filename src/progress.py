@@ -0,0 +1,89 @@
+"""
+Progress reporting of pipeline stages
+"""
+import threading
+
+STAGE_WEIGHTS = {
+    "model": 0.55,
+    "parse": 0.01,
+    "clean": 0.01,
+    "trendline": 0.01,
+    "court": 0.1,
+    "possession": 0.01,
+    "team": 0.01,
+    "shot": 0.01,
+    "stats": 0.01,
+    "minimap": 0.04,
+    "video": 0.25,
+}
+"Share of the run time of a whole pipeline spent in each stage, in run order"
+
+
+class Progress:
+    """
+    Forwards counters of pipeline stages to callback(stage, done, total) and
+    completed stages to on_finish(stage); without callbacks reporting does
+    nothing. Callbacks stay in the process the Progress was made in.
+    """
+
+    def __init__(self, callback=None, on_finish=None) -> None:
+        self.callback = callback
+        self.on_finish = on_finish
+        self._parts: dict = {}
+        "(done, total) of every part of every stage, see counter"
+        self._reported: dict = {}
+        "done last reported of every stage"
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        return {}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__()
+
+    def start(self, stage: str, total: int = 1) -> None:
+        "stage began, with total units of work"
+        self.update(stage, 0, total)
+
+    def update(self, stage: str, done: int, total: int) -> None:
+        "done of total units of work of stage are complete"
+        if self.callback is not None:
+            self.callback(stage, done, total)
+
+    def finish(self, stage: str) -> None:
+        "stage is complete"
+        self.update(stage, 1, 1)
+        if self.on_finish is not None:
+            self.on_finish(stage)
+
+    def counter(self, stage: str, part: str = "", step: float = 0.01):
+        """
+        Callback(done, total) counting frames of part of stage; parts of a
+        stage running at once add up, and updates are sent every step of it
+        """
+        if self.callback is None:
+            return lambda done, total: None
+
+        def count(done: int, total: int) -> None:
+            with self._lock:
+                parts = self._parts.setdefault(stage, {})
+                parts[part] = (done, total)
+                done = sum(d for d, _ in parts.values())
+                total = sum(t for _, t in parts.values())
+                last = self._reported.get(stage, 0)
+                if done < total and done - last < step * total:
+                    return
+                self._reported[stage] = done
+            self.update(stage, done, total)
+
+        return count
+
+
+def fraction(stage: str, done: int, total: int) -> float:
+    "Fraction of a whole pipeline complete while stage is done / total complete"
+    stages = list(STAGE_WEIGHTS)
+    if stage not in STAGE_WEIGHTS:
+        return 0.0
+    before = sum(STAGE_WEIGHTS[s] for s in stages[: stages.index(stage)])
+    current = STAGE_WEIGHTS[stage] * (min(done, total) / total if total else 1.0)
+    return round((before + current) / sum(STAGE_WEIGHTS.values()), 4)
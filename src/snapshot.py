@@ -0,0 +1,386 @@
+"""
+Binary snapshot of a GameState
+
+Frames are stored as columns: one row per frame, and one row per player,
+ball candidate and possession of every frame. Rows are split into blocks of
+BLOCK_FRAMES frames and every block is zlib compressed on its own, so a reader
+memory-maps the file and only inflates the blocks of the frames it asks for.
+Everything besides frames is kept as json in the footer, read on open.
+
+    magic, version          8 bytes, uint32
+    block 0 .. block n      zlib of the columns of every table, in _tables order
+    footer                  json: summary, names, blocks (offset, length), ...
+    footer offset, length   uint64, uint32
+    magic                   8 bytes
+
+Ids (player_1, ball_3) are stored as indices into the names of the footer,
+-1 for none; missing boxes, keypoints and angles are NaN.
+"""
+import json
+import mmap
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b"HTSNAP\x00\x01"
+SNAPSHOT_VERSION = 2
+BLOCK_FRAMES = 1024
+"frames compressed together, the unit read by Snapshot"
+_HEAD = struct.Struct("<8sI")
+_TAIL = struct.Struct("<QI8s")
+
+
+def _tables(keypoints: int, angles: int) -> dict:
+    "columns of every table as (name, dtype, shape of a row)"
+    return {
+        "frames": [
+            ("frameno", np.int32, ()),
+            ("ball", np.int32, ()),
+            ("ball_box", np.float32, (4,)),
+            ("ball_predicted", np.int8, ()),
+            ("ball_velocity", np.float64, (2,)),
+            ("rim_box", np.float32, (4,)),
+            ("players", np.int32, ()),
+            ("candidates", np.int32, ()),
+            ("possessions", np.int32, ()),
+        ],
+        "players": [
+            ("id", np.int32, ()),
+            ("box", np.float32, (4,)),
+            ("ballid", np.int32, ()),
+            ("type", np.int8, ()),
+            ("keypoints", np.float32, (keypoints, 3)),
+            ("angles", np.float32, (angles,)),
+        ],
+        "candidates": [
+            ("id", np.int32, ()),
+            ("box", np.float32, (4,)),
+            ("predicted", np.int8, ()),
+            ("velocity", np.float64, (2,)),
+        ],
+        "possessions": [("id", np.int32, ())],
+    }
+
+
+_ROW_TABLES = ("players", "candidates", "possessions")
+"tables of rows within frames, counted by the column of the same name of frames"
+
+
+def _json_default(obj):
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=str)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, range):
+        return [obj.start, obj.stop]
+    return str(obj)
+
+
+def summary(state) -> dict:
+    "json-ready dict of everything in state.GameState but frames and trajectories"
+    from state import todict
+
+    fields = {
+        k: v for k, v in state.__dict__.items() if k not in ("frames", "trajectories")
+    }
+    return json.loads(json.dumps(todict(fields), default=_json_default))
+
+
+def _box(box) -> list:
+    if box is None:
+        return [np.nan] * 4
+    return [box.xmin, box.ymin, box.xmax, box.ymax]
+
+
+def _number(value) -> float:
+    return np.nan if value is None else value
+
+
+class _Names:
+    "Index of every id written"
+
+    def __init__(self) -> None:
+        self.list: list = []
+        self._index: dict = {}
+
+    def __call__(self, name) -> int:
+        if name is None or name == -1:
+            return -1
+        name = str(name)
+        if name not in self._index:
+            self._index[name] = len(self.list)
+            self.list.append(name)
+        return self._index[name]
+
+
+def _block(frames, tables: dict, names: _Names, keypoint_names, angle_names) -> bytes:
+    "compressed columns of frames"
+    rows = {table: {name: [] for name, _, _ in columns} for table, columns in tables.items()}
+    f, p, c, s = rows["frames"], rows["players"], rows["candidates"], rows["possessions"]
+    for frame in frames:
+        ball = frame.ball
+        f["frameno"].append(frame.frameno)
+        f["ball"].append(names(None if ball is None else ball.ballid))
+        f["ball_box"].append(_box(None if ball is None else ball.box))
+        f["ball_predicted"].append(int(ball is not None and ball.box.predicted))
+        f["ball_velocity"].append(
+            [np.nan] * 2 if ball is None else [_number(ball.vx), _number(ball.vy)]
+        )
+        f["rim_box"].append(_box(frame.rim))
+        f["players"].append(len(frame.players))
+        f["candidates"].append(len(frame.ball_candidates))
+        f["possessions"].append(len(frame.possessions))
+        for id, pf in frame.players.items():
+            p["id"].append(names(id))
+            p["box"].append(_box(pf.box))
+            p["ballid"].append(names(pf.ballid))
+            p["type"].append(-1 if pf.type is None else pf.type.value)
+            keypoints = [[np.nan] * 3] * len(keypoint_names)
+            for i, name in enumerate(keypoint_names):
+                k = pf.keypoints.get(name)
+                if k is not None:
+                    keypoints[i] = [k.x, k.y, k.confidence]
+            p["keypoints"].append(keypoints)
+            p["angles"].append([_number(pf.angles.get(name)) for name in angle_names])
+        for id, bf in frame.ball_candidates.items():
+            c["id"].append(names(id))
+            c["box"].append(_box(bf.box))
+            c["predicted"].append(int(bf.box.predicted))
+            c["velocity"].append([_number(bf.vx), _number(bf.vy)])
+        for id in frame.possessions:
+            s["id"].append(names(id))
+
+    data = []
+    for table, columns in tables.items():
+        for name, dtype, shape in columns:
+            values = np.array(rows[table][name], dtype=dtype)
+            data.append(values.reshape((-1,) + shape).tobytes())
+    return zlib.compress(b"".join(data), 6)
+
+
+def write(state, path: str) -> None:
+    "Writes the snapshot of a state.GameState to path"
+    from pose_estimation.pose_estimate import AngleNames, KeyPointNames
+
+    keypoint_names, angle_names = list(KeyPointNames.list), list(AngleNames.list)
+    tables = _tables(len(keypoint_names), len(angle_names))
+    names = _Names()
+    blocks = []
+    with open(path, "wb") as f:
+        f.write(_HEAD.pack(MAGIC, SNAPSHOT_VERSION))
+        for start in range(0, len(state.frames), BLOCK_FRAMES):
+            block = _block(
+                state.frames[start : start + BLOCK_FRAMES],
+                tables,
+                names,
+                keypoint_names,
+                angle_names,
+            )
+            blocks.append([f.tell(), len(block)])
+            f.write(block)
+        footer = json.dumps(
+            {
+                "version": SNAPSHOT_VERSION,
+                "frames": len(state.frames),
+                "block_frames": BLOCK_FRAMES,
+                "blocks": blocks,
+                "names": names.list,
+                "keypoints": keypoint_names,
+                "angles": angle_names,
+                "summary": summary(state),
+            },
+            default=_json_default,
+        ).encode()
+        offset = f.tell()
+        f.write(footer)
+        f.write(_TAIL.pack(offset, len(footer), MAGIC))
+
+
+class Snapshot:
+    """
+    Reader of a snapshot file, memory-mapped: the summary is read on open and
+    frames are inflated block by block when asked for
+    """
+
+    def __init__(self, path: str, cached_blocks: int = 4) -> None:
+        """
+        @param path, snapshot file written by write
+        @param cached_blocks, inflated blocks kept for further reads
+        """
+        self._cache: dict = {}
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = _HEAD.unpack_from(self._map, 0)
+        offset, length, tail = _TAIL.unpack_from(self._map, len(self._map) - _TAIL.size)
+        if magic != MAGIC or tail != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a snapshot")
+        if version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError(f"{path} is snapshot version {version}, not {SNAPSHOT_VERSION}")
+        footer = json.loads(self._map[offset : offset + length])
+        self.summary: dict = footer["summary"]
+        "GameState without frames, see summary"
+        self.names: list = footer["names"]
+        "ids by index"
+        self.keypoints: list = footer["keypoints"]
+        "keypoint names, in column order"
+        self.angles: list = footer["angles"]
+        "angle names, in column order"
+        self.frame_count: int = footer["frames"]
+        self._block_frames = footer["block_frames"]
+        self._blocks = footer["blocks"]
+        self._tables = _tables(len(self.keypoints), len(self.angles))
+        self._cached_blocks = cached_blocks
+
+    def __len__(self) -> int:
+        return self.frame_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._cache.clear()
+        self._map.close()
+        self._file.close()
+
+    def _block(self, index: int) -> dict:
+        "columns of block index by table"
+        if index in self._cache:
+            return self._cache[index]
+        offset, length = self._blocks[index]
+        data = zlib.decompress(self._map[offset : offset + length])
+        start = index * self._block_frames
+        rows = {"frames": min(self._block_frames, self.frame_count - start)}
+        columns, pos = {}, 0
+        for table, schema in self._tables.items():
+            n = rows[table]
+            columns[table] = {}
+            for name, dtype, shape in schema:
+                count = n * int(np.prod(shape, dtype=int))
+                values = np.frombuffer(data, dtype=dtype, count=count, offset=pos)
+                columns[table][name] = values.reshape((n,) + shape)
+                pos += count * np.dtype(dtype).itemsize
+            if table == "frames":
+                for other in _ROW_TABLES:
+                    rows[other] = int(columns["frames"][other].sum())
+        # index of the frame of every row, in the whole snapshot
+        for table in _ROW_TABLES:
+            columns[table]["frame"] = np.repeat(
+                np.arange(start, start + rows["frames"], dtype=np.int32),
+                columns["frames"][table],
+            )
+        if len(self._cache) >= self._cached_blocks:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[index] = columns
+        return columns
+
+    def arrays(self, start: int = 0, end: int = None) -> dict:
+        """
+        Columns of frames start to end (exclusive) by table; rows of players,
+        candidates and possessions carry the index of their frame in 'frame'
+        """
+        end = self.frame_count if end is None else min(end, self.frame_count)
+        start = max(0, min(start, end))
+        first, last = start // self._block_frames, -(-end // self._block_frames)
+        blocks = [self._block(i) for i in range(first, last)]
+        result = {}
+        for table, schema in self._tables.items():
+            names = [name for name, _, _ in schema]
+            if table != "frames":
+                names.append("frame")
+            result[table] = {}
+            for name in names:
+                if blocks:
+                    values = np.concatenate([b[table][name] for b in blocks])
+                else:
+                    values = np.zeros((0,), dtype=np.int32)
+                result[table][name] = values
+            if table == "frames":
+                lo = start - first * self._block_frames
+                for name in names:
+                    result[table][name] = result[table][name][lo : lo + end - start]
+            elif blocks:
+                keep = (result[table]["frame"] >= start) & (result[table]["frame"] < end)
+                for name in names:
+                    result[table][name] = result[table][name][keep]
+        return result
+
+    def todict(self, start: int = 0, end: int = None) -> dict:
+        "json-ready arrays of frames start to end, with ids as names and NaN as None"
+        names = np.array(self.names + [None], dtype=object)
+        result = {}
+        for table, columns in self.arrays(start, end).items():
+            result[table] = {}
+            for name, values in columns.items():
+                if name in ("id", "ball", "ballid"):
+                    values = names[values]  # -1 picks the None at the end
+                elif values.dtype.kind == "f":
+                    values = np.where(np.isnan(values), None, values.astype(object))
+                result[table][name] = values.tolist()
+        return result
+
+    def frames(self, start: int = 0, end: int = None) -> list:
+        "state.Frame objects of frames start to end"
+        from state import ActionType, BallFrame, Box, Frame, Keypoint, PlayerFrame
+
+        def number(v):
+            v = float(v)
+            return int(v) if v.is_integer() else v
+
+        def box(b):
+            return None if np.isnan(b[0]) else Box(*(number(v) for v in b))
+
+        def name(i):
+            return None if i < 0 else self.names[i]
+
+        columns = self.arrays(start, end)
+        f, p, c, s = (columns[t] for t in ("frames", "players", "candidates", "possessions"))
+        frames = {}
+        for i in range(len(f["frameno"])):
+            frame = Frame(int(f["frameno"][i]))
+            frame.rim = box(f["rim_box"][i])
+            if f["ball"][i] >= 0 or not np.isnan(f["ball_box"][i][0]):
+                ball = BallFrame(*(number(v) for v in f["ball_box"][i]), id=name(f["ball"][i]))
+                ball.box.predicted = bool(f["ball_predicted"][i])
+                vx, vy = f["ball_velocity"][i]
+                ball.vx = None if np.isnan(vx) else float(vx)
+                ball.vy = None if np.isnan(vy) else float(vy)
+                frame.ball = ball
+            frames[start + i] = frame
+        for r in range(len(p["id"])):
+            pf = PlayerFrame(*(number(v) for v in p["box"][r]))
+            ballid = name(p["ballid"][r])
+            pf.ballid = -1 if ballid is None else ballid
+            pf.type = None if p["type"][r] < 0 else ActionType(int(p["type"][r]))
+            for k, (x, y, conf) in zip(self.keypoints, p["keypoints"][r]):
+                if not np.isnan(x):
+                    pf.keypoints[k] = Keypoint(float(x), float(y), number(conf))
+            for a, angle in zip(self.angles, p["angles"][r]):
+                if not np.isnan(angle):
+                    pf.angles[a] = int(angle)
+            frames[int(p["frame"][r])].players[name(p["id"][r])] = pf
+        for r in range(len(c["id"])):
+            id = name(c["id"][r])
+            candidate = BallFrame(*(number(v) for v in c["box"][r]), id=id)
+            candidate.box.predicted = bool(c["predicted"][r])
+            vx, vy = c["velocity"][r]
+            candidate.vx = None if np.isnan(vx) else float(vx)
+            candidate.vy = None if np.isnan(vy) else float(vy)
+            frames[int(c["frame"][r])].ball_candidates[id] = candidate
+        for r in range(len(s["id"])):
+            frames[int(s["frame"][r])].possessions.append(name(s["id"][r]))
+        for frame in frames.values():
+            # the ball is usually one of the candidates, kept as the same object
+            same = frame.ball_candidates.get(frame.ball and frame.ball.ballid)
+            if (
+                same is not None
+                and vars(same.box) == vars(frame.ball.box)
+                and (same.vx, same.vy) == (frame.ball.vx, frame.ball.vy)
+            ):
+                frame.ball = same
+        return [frames[i] for i in sorted(frames)]
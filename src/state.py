@@ -6,6 +6,7 @@ from pose_estimation.pose_estimate import KeyPointNames, AngleNames
 import sys
 import math
 from collections import deque, defaultdict
+import numpy as np
 
 
 def format_results_for_api(self):
@@ -59,6 +60,10 @@ def todict(obj):
         for key, value in obj.items():
             result[key] = todict(value)  # Recursive call for dictionary values
         return result
+    elif isinstance(obj, Enum):
+        return obj.name  # e.g. ShotType.TWO as TWO
+    elif hasattr(obj, "todict"):
+        return obj.todict()  # objects with their own compact form
     elif hasattr(obj, "__dict__"):
         return todict(obj.__dict__)  # Recursive call for objects with __dict__
     elif isinstance(obj, list):
@@ -174,6 +179,8 @@ class ShotAttempt:
             made: whether it was made
             frame: frameno if it was made
             type: MISS, TWO, or THREE
+            assist: player credited with an assist, if any
+            rebound: player credited with the rebound, if any
         """
         # IMMUTABLE
         self.playerid: str = playerid
@@ -189,6 +196,10 @@ class ShotAttempt:
         "frame shot was made, if applicable"
         self.type: ShotType = ShotType.MISS
         "MISSED, TWO, or THREE"
+        self.assist: str = None
+        "player credited with an assist on the shot, if made"
+        self.rebound: str = None
+        "player credited with the rebound of the shot, if missed"
 
     def value(self) -> int:
         "point value of shot attempt"
@@ -545,6 +556,92 @@ class Interval:
         return True
 
 
+class Trajectories:
+    "Court plane positions of players and the ball over the whole game"
+
+    def __init__(
+        self,
+        frames: np.ndarray,
+        players: list,
+        positions: np.ndarray,
+        scale: np.ndarray,
+        ball: np.ndarray,
+        on_court: float,
+    ) -> None:
+        """
+        Trajectories containing
+            frames: (F,) frame number of every row, rows follow GameState.frames
+            players: player ids, in column order of positions
+            positions: float32 (F, P, 2) feet (x, y) in meters, NaN where not seen;
+                x is along the baseline from its center, y from the baseline into the court
+            scale: float32 (F, P) meters per video pixel at the feet, NaN where not seen
+            ball: float32 (F, 2) bottom of ball box in meters, NaN where not seen;
+                only on the court plane when the ball is low
+            on_court: fraction of feet positions inside the half court
+        """
+        # IMMUTABLE
+        self.frames: np.ndarray = frames
+        self.players: list = players
+        self.positions: np.ndarray = positions
+        self.scale: np.ndarray = scale
+        self.ball: np.ndarray = ball
+        self.on_court: float = on_court
+        self.columns: dict = {id: i for i, id in enumerate(players)}
+        "column of every player id"
+
+    def reliable(self, min_on_court: float = 0.5) -> bool:
+        "whether the court homography put most feet on the court"
+        return self.on_court >= min_on_court
+
+    def position(self, playerid: str, index: int):
+        "court (x, y) of player at row index, or None if not seen"
+        column = self.columns.get(playerid)
+        if column is None or np.isnan(self.positions[index, column, 0]):
+            return None
+        x, y = self.positions[index, column]
+        return float(x), float(y)
+
+    def todict(self) -> dict:
+        "compact form for results: [frameno, x, y] in meters of every seen row"
+        frames = self.frames.tolist()
+
+        def rows(xy):
+            seen = np.flatnonzero(~np.isnan(xy[:, 0]))
+            return [[frames[i], round(float(xy[i, 0]), 2), round(float(xy[i, 1]), 2)] for i in seen]
+
+        return {
+            "unit": "m",
+            "on_court": round(self.on_court, 3),
+            "players": {id: rows(self.positions[:, i]) for i, id in enumerate(self.players)},
+            "ball": rows(self.ball),
+        }
+
+    def save(self, path: str) -> None:
+        "writes arrays to an .npz file"
+        np.savez_compressed(
+            path,
+            frames=self.frames,
+            players=np.array(self.players),
+            positions=self.positions,
+            scale=self.scale,
+            ball=self.ball,
+            on_court=self.on_court,
+        )
+
+    @staticmethod
+    def load(path: str):
+        "reads trajectories written by save"
+        with np.load(path) as data:
+            return Trajectories(
+                data["frames"],
+                data["players"].tolist(),
+                data["positions"],
+                data["scale"],
+                data["ball"],
+                float(data["on_court"]),
+            )
+
+
 class GameState:
     """
     State class holding: player positions, ball position, and team scores
@@ -588,6 +685,9 @@ class GameState:
         self.team1: TeamStats = TeamStats()
         self.team2: TeamStats = TeamStats()
 
+        self.trajectories: Trajectories = None
+        "court plane positions of players and ball, None until court detection"
+
     def populate_shot_stats(self):
         """Computes team scores, player assists, and player rebounds"""
         for shot in self.shot_attempts:
@@ -608,10 +708,12 @@ class GameState:
                     player_prior = self.possessions[idx_after - 2].playerid
                     if player_prior in team.players:
                         self.players[player_prior].assists += 1
+                        shot.assist = player_prior
             else:
                 # rebound
                 rebound_player = self.possessions[idx_after].playerid
                 self.players[rebound_player].rebounds += 1
+                shot.rebound = rebound_player
 
         self.team1.compute_field_goal_percentage()
         self.team2.compute_field_goal_percentage()
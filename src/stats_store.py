@@ -0,0 +1,249 @@
+"""
+Structured store of game statistics
+
+The summary of a processed game is written to a small SQLite file, one per
+run, so results can be filtered by player or time without loading frames:
+
+    meta          key, value: version, fps, frames, duration
+    players       totals of every player over the game
+    teams         totals of both teams
+    passes        passes between every pair of players
+    shots         every shot attempt, by frame, with its assist and rebound
+    possessions   every possession interval, by frame
+
+Filtered by time, every total is recounted over the shots and possessions in
+the range, so filtered and unfiltered results have the same columns.
+"""
+import json
+import os
+import sqlite3
+
+STORE_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE players (
+    player_id TEXT PRIMARY KEY, team INTEGER, frames INTEGER,
+    field_goals_attempted INTEGER, field_goals INTEGER, points INTEGER,
+    field_goal_percentage REAL, assists INTEGER, rebounds INTEGER
+);
+CREATE TABLE teams (
+    team INTEGER PRIMARY KEY, players TEXT, shots_attempted INTEGER,
+    shots_made INTEGER, points INTEGER, field_goal_percentage REAL
+);
+CREATE TABLE passes (from_player TEXT, to_player TEXT, count INTEGER);
+CREATE TABLE shots (
+    player_id TEXT, start INTEGER, end INTEGER, made INTEGER,
+    made_frame INTEGER, type TEXT, value INTEGER, assist TEXT, rebound TEXT
+);
+CREATE TABLE possessions (player_id TEXT, start INTEGER, end INTEGER);
+CREATE INDEX shots_player ON shots (player_id, start);
+CREATE INDEX possessions_player ON possessions (player_id, start);
+"""
+
+
+def write(state, path: str, fps: float) -> None:
+    """
+    Writes the summary of state to a new store at path
+    @param state, processed state.GameState
+    @param fps, frames per second of the video, to convert frames to seconds
+    """
+    teams = {1: state.team1, 2: state.team2}
+    team_of = {p: t for t, stats in teams.items() for p in stats.players}
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    db = sqlite3.connect(tmp)
+    try:
+        db.executescript(_SCHEMA)
+        fps = fps or 30.0
+        db.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [
+                ("version", str(STORE_VERSION)),
+                ("fps", str(fps)),
+                ("frames", str(len(state.frames))),
+                ("duration", str(round(len(state.frames) / fps, 3))),
+            ],
+        )
+        db.executemany(
+            "INSERT INTO players VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    id,
+                    team_of.get(id),
+                    p.frames,
+                    p.field_goals_attempted,
+                    p.field_goals,
+                    p.points,
+                    p.field_goal_percentage,
+                    p.assists,
+                    p.rebounds,
+                )
+                for id, p in state.players.items()
+            ],
+        )
+        db.executemany(
+            "INSERT INTO teams VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    t,
+                    json.dumps(sorted(stats.players)),
+                    stats.shots_attempted,
+                    stats.shots_made,
+                    stats.points,
+                    stats.field_goal_percentage,
+                )
+                for t, stats in teams.items()
+            ],
+        )
+        db.executemany(
+            "INSERT INTO passes VALUES (?, ?, ?)",
+            [
+                (p, c, count)
+                for p, to in state.passes.items()
+                for c, count in to.items()
+                if count
+            ],
+        )
+        db.executemany(
+            "INSERT INTO shots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    s.playerid,
+                    s.start,
+                    s.end,
+                    int(s.made),
+                    s.frame,
+                    s.type.name,
+                    s.value(),
+                    s.assist,
+                    s.rebound,
+                )
+                for s in state.shot_attempts
+            ],
+        )
+        db.executemany(
+            "INSERT INTO possessions VALUES (?, ?, ?)",
+            [(i.playerid, i.start, i.end) for i in state.possessions],
+        )
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp, path)
+
+
+def _rows(cursor) -> list:
+    names = [c[0] for c in cursor.description]
+    return [dict(zip(names, row)) for row in cursor]
+
+
+def query(path: str, player: str = None, start: float = None, end: float = None) -> dict:
+    """
+    Statistics of the store at path as json-ready dict, optionally filtered
+    @param player, only this player's stats, shots, possessions and passes
+    @param start, end, only shots and possessions overlapping this time in
+    seconds; player and team totals and passes are then recounted over those
+    events
+    """
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        meta = dict(db.execute("SELECT key, value FROM meta"))
+        fps = float(meta["fps"])
+        first = 0 if start is None else int(start * fps)
+        last = int(meta["frames"]) if end is None else int(end * fps)
+
+        where, params = ["end >= ? AND start <= ?"], [first, last]
+        if player is not None:
+            where.append("player_id = ?")
+            params.append(player)
+        where = " AND ".join(where)
+        shots = _rows(db.execute(f"SELECT * FROM shots WHERE {where} ORDER BY start", params))
+        possessions = _rows(
+            db.execute(f"SELECT * FROM possessions WHERE {where} ORDER BY start", params)
+        )
+        for event in shots + possessions:
+            event["time"] = round(event["start"] / fps, 3)
+
+        if start is None and end is None:
+            sql, params = "SELECT * FROM players", []
+        else:
+            # totals over the events inside the time range
+            sql = """
+                SELECT p.player_id, p.team, p.frames,
+                    COUNT(s.player_id) AS field_goals_attempted,
+                    COALESCE(SUM(s.made), 0) AS field_goals,
+                    COALESCE(SUM(s.made * s.value), 0) AS points,
+                    COALESCE(CAST(SUM(s.made) AS REAL) / COUNT(s.player_id), 0.0)
+                        AS field_goal_percentage,
+                    (SELECT COUNT(*) FROM shots a WHERE a.assist = p.player_id
+                        AND a.end >= ? AND a.start <= ?) AS assists,
+                    (SELECT COUNT(*) FROM shots r WHERE r.rebound = p.player_id
+                        AND r.end >= ? AND r.start <= ?) AS rebounds
+                FROM players p LEFT JOIN shots s
+                    ON s.player_id = p.player_id AND s.end >= ? AND s.start <= ?
+                GROUP BY p.player_id
+            """
+            params = [first, last] * 3
+        if player is not None:
+            sql = f"SELECT * FROM ({sql}) WHERE player_id = ?"
+            params.append(player)
+        players = {row.pop("player_id"): row for row in _rows(db.execute(sql, params))}
+
+        if start is None and end is None:
+            sql, params = "SELECT * FROM passes", []
+        else:
+            # a pass is counted when the receiving possession starts in the range
+            sql = """
+                SELECT from_player, to_player, COUNT(*) AS count FROM (
+                    SELECT LAG(player_id) OVER (ORDER BY start, rowid) AS from_player,
+                        player_id AS to_player, start
+                    FROM possessions
+                )
+                WHERE from_player IS NOT NULL AND start >= ? AND start <= ?
+                GROUP BY from_player, to_player
+            """
+            params = [first, last]
+        involved = "? IS NULL OR from_player = ? OR to_player = ?"
+        sql = f"SELECT * FROM ({sql}) WHERE {involved}"
+        passes = _rows(db.execute(sql, params + [player, player, player]))
+
+        if start is None and end is None:
+            sql, params = "SELECT * FROM teams ORDER BY team", []
+        else:
+            # players not on team 1 count for team 2, as in GameState
+            sql = """
+                SELECT t.team, t.players,
+                    COUNT(s.team) AS shots_attempted,
+                    COALESCE(SUM(s.made), 0) AS shots_made,
+                    COALESCE(SUM(s.made * s.value), 0) AS points,
+                    COALESCE(CAST(SUM(s.made) AS REAL) / COUNT(s.team), 0.0)
+                        AS field_goal_percentage
+                FROM teams t LEFT JOIN (
+                    SELECT CASE WHEN p.team = 1 THEN 1 ELSE 2 END AS team,
+                        s.made, s.value
+                    FROM shots s LEFT JOIN players p ON p.player_id = s.player_id
+                    WHERE s.end >= ? AND s.start <= ?
+                ) s ON s.team = t.team
+                GROUP BY t.team ORDER BY t.team
+            """
+            params = [first, last]
+        teams = {}
+        for row in _rows(db.execute(sql, params)):
+            row["players"] = json.loads(row["players"])
+            teams[f"Team {row.pop('team')}"] = row
+
+        return {
+            "general_stats": {
+                "frames": int(meta["frames"]),
+                "fps": fps,
+                "duration": float(meta["duration"]),
+            },
+            "player_stats": players,
+            "team_stats": teams,
+            "passes": passes,
+            "shots": shots,
+            "possessions": possessions,
+        }
+    finally:
+        db.close()
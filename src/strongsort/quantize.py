@@ -0,0 +1,244 @@
+"""
+INT8 ONNX Runtime quantization of the detector and ReID models for CPU inference.
+
+Usage:
+    $ python quantize.py --yolo-weights weights/best.pt --reid-weights weights/osnet_x0_25_msmt17.pt --mode static
+    $ python quantize.py ... --mode dynamic --report     # + accuracy / speed report
+
+Both models are exported to ONNX (export.py, reid_export.py) and quantized next to
+their weights as <stem>_int8_<mode>.onnx, which DetectMultiBackend and StrongSORT
+load from the suffix. 'dynamic' quantizes weights only; 'static' also quantizes
+activations, calibrated on frames and crops of --source, our own footage.
+
+--report compares the INT8 pipeline with the FP32 one on --source. There are no
+labels for our footage, so FP32 outputs are the reference: mAP@0.5 of the INT8
+detector against FP32 detections, and IDF1 of INT8 tracks against FP32 tracks.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[0]  # yolov5 strongsort root directory
+WEIGHTS = ROOT / "weights"
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+if str(ROOT / "yolov5") not in sys.path:
+    sys.path.append(str(ROOT / "yolov5"))  # add yolov5 ROOT to PATH
+if str(ROOT / "strong_sort") not in sys.path:
+    sys.path.append(str(ROOT / "strong_sort"))  # add strong_sort ROOT to PATH
+
+MODES = ("dynamic", "static")
+
+
+def int8_weights(weights, mode) -> Path:
+    "path of the INT8 [mode] export of [weights]"
+    weights = Path(weights)
+    return weights.with_name(f"{weights.stem}_int8_{mode}.onnx")
+
+
+def sample_frames(source, imgsz=(640, 640), n=32, offset=0):
+    "n letterboxed (1, 3, H, W) float32 frames spread over the video [source]"
+    from utils.augmentations import letterbox
+    from utils.general import cv2
+
+    cap = cv2.VideoCapture(str(source))
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 1
+    frames = []
+    for idx in np.linspace(offset, total - 1, num=min(total, n), dtype=int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(idx))
+        ok, frame = cap.read()
+        if not ok:
+            continue
+        im = letterbox(frame, imgsz, auto=False)[0]
+        im = im.transpose((2, 0, 1))[::-1]  # HWC to CHW, BGR to RGB
+        frames.append(np.ascontiguousarray(im, dtype=np.float32)[None] / 255)
+    cap.release()
+    return frames
+
+
+def _calibration_reader(input_name, batches):
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class Reader(CalibrationDataReader):
+        def __init__(self) -> None:
+            self.batches = iter(batches)
+
+        def get_next(self):
+            batch = next(self.batches, None)
+            return None if batch is None else {input_name: batch}
+
+    return Reader()
+
+
+def quantize_onnx(onnx_file, out, mode, calibration=None):
+    "writes the INT8 quantization of [onnx_file] to [out]; static mode needs calibration batches"
+    from onnxruntime.quantization import (
+        QuantFormat,
+        QuantType,
+        quantize_dynamic,
+        quantize_static,
+    )
+
+    if mode == "dynamic":
+        quantize_dynamic(str(onnx_file), str(out), weight_type=QuantType.QInt8)
+    elif mode == "static":
+        import onnxruntime
+
+        session = onnxruntime.InferenceSession(
+            str(onnx_file), providers=["CPUExecutionProvider"]
+        )
+        reader = _calibration_reader(session.get_inputs()[0].name, calibration)
+        quantize_static(
+            str(onnx_file),
+            str(out),
+            reader,
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+    else:
+        raise ValueError(f"quantization mode must be one of {MODES}, got {mode}")
+    return out
+
+
+def quantize_detector(weights, mode, source, imgsz=(640, 640), calib_frames=32):
+    "INT8 ONNX export of the YOLOv5 [weights]"
+    import export
+
+    onnx_file = export.run(weights=weights, imgsz=imgsz, include=("onnx",))[0]
+    calibration = sample_frames(source, imgsz, calib_frames) if mode == "static" else None
+    return quantize_onnx(onnx_file, int8_weights(weights, mode), mode, calibration)
+
+
+def quantize_reid(weights, mode, source, calib_crops=256, batch=16):
+    "INT8 ONNX export of the ReID [weights]"
+    import reid_export
+    from strong_sort.deep.reid_multibackend import build_preprocess
+
+    onnx_file = reid_export.run(weights=weights, include=("onnx",))[0]
+    calibration = None
+    if mode == "static":
+        preprocess = build_preprocess()
+        crops = reid_export.sample_crops(source, calib_crops)
+        calibration = [
+            torch.stack([preprocess(c) for c in crops[i : i + batch]]).numpy()
+            for i in range(0, len(crops), batch)
+        ]
+    return quantize_onnx(onnx_file, int8_weights(weights, mode), mode, calibration)
+
+
+def detection_map(reference, candidate, frames, conf_thres=0.25, iou_thres=0.45):
+    """
+    mAP@0.5 of the detector [candidate] against detections of [reference] on [frames],
+    and the average inference time per frame of both
+    """
+    from models.common import DetectMultiBackend
+    from utils.general import non_max_suppression
+    from utils.metrics import ap_per_class
+    from val import process_batch
+
+    device = torch.device("cpu")
+    ref, cand = DetectMultiBackend(reference, device), DetectMultiBackend(candidate, device)
+    iouv = torch.tensor([0.5])
+    stats, t_ref, t_cand = [], 0.0, 0.0
+    for im in frames:
+        im = torch.from_numpy(im)
+        t = time.perf_counter()
+        labels = non_max_suppression(ref(im), conf_thres, iou_thres)[0]
+        t_ref += time.perf_counter() - t
+        t = time.perf_counter()
+        preds = non_max_suppression(cand(im), 0.001, iou_thres)[0]
+        t_cand += time.perf_counter() - t
+        labels = torch.cat((labels[:, 5:6], labels[:, :4]), 1)  # class, x1, y1, x2, y2
+        correct = (
+            process_batch(preds, labels, iouv)
+            if len(preds) and len(labels)
+            else torch.zeros(len(preds), 1, dtype=torch.bool)
+        )
+        stats.append((correct.numpy(), preds[:, 4].numpy(), preds[:, 5].numpy(), labels[:, 0].numpy()))
+    tp, conf, pred_cls, target_cls = (np.concatenate(x, 0) for x in zip(*stats))
+    if not len(target_cls):
+        return float("nan"), t_ref / len(frames), t_cand / len(frames)
+    ap = ap_per_class(tp, conf, pred_cls, target_cls, names={})[5]
+    return float(ap[:, 0].mean()), t_ref / len(frames), t_cand / len(frames)
+
+
+def report(yolo_weights, reid_weights, mode, source, classes=None, frames=32):
+    "prints accuracy deltas and speedups of the INT8 [mode] models against FP32"
+    import reid_export
+    from strong_sort.utils.mot_metrics import idf1
+    from yolov5 import detect
+
+    yolo_int8, reid_int8 = int8_weights(yolo_weights, mode), int8_weights(reid_weights, mode)
+    det_map, t_fp32, t_int8 = detection_map(
+        yolo_weights, yolo_int8, sample_frames(source, n=frames, offset=frames // 2)
+    )
+    print(f"\ndetector    mAP@0.5 vs FP32 {det_map:.4f} (delta {det_map - 1:+.4f})"
+          f"    {1e3 * t_fp32:.1f} -> {1e3 * t_int8:.1f} ms/frame ({t_fp32 / t_int8:.2f}x)")
+
+    tracks = {}
+    for name, yolo, reid in (("fp32", yolo_weights, reid_weights), ("int8", yolo_int8, reid_int8)):
+        t = time.perf_counter()
+        rows, _ = detect.run(
+            source=source,
+            yolo_weights=Path(yolo),
+            strong_sort_weights=Path(reid),
+            classes=classes,
+            project=ROOT / "runs/quantize",
+            name=name,
+            exist_ok=True,
+            ret=True,
+        )
+        tracks[name] = (rows, time.perf_counter() - t)
+    score = idf1(tracks["fp32"][0], tracks["int8"][0])
+    t_fp32, t_int8 = tracks["fp32"][1], tracks["int8"][1]
+    print(f"tracking    IDF1 vs FP32    {score:.4f} (delta {score - 1:+.4f})"
+          f"    {t_fp32:.1f} -> {t_int8:.1f} s ({t_fp32 / t_int8:.2f}x)")
+    print("reid")
+    reid_export.check(Path(reid_weights), [reid_int8], source, 16)
+
+
+def run(
+    yolo_weights=WEIGHTS / "best.pt",  # YOLOv5 model.pt path
+    reid_weights=WEIGHTS / "osnet_x0_25_msmt17.pt",  # ReID model.pt path
+    mode="static",  # dynamic or static
+    source=ROOT / "../../data/short_new_1.mp4",  # footage used for calibration and the report
+    imgsz=(640, 640),  # detector inference size (height, width)
+    calib_frames=32,  # frames calibrating the static detector
+    calib_crops=256,  # crops calibrating the static ReID model
+    classes=None,  # class filter of the tracking report
+    report_results=False,  # compare INT8 against FP32 on source
+):
+    torch.set_num_threads(os.cpu_count())
+    if mode not in MODES:
+        raise ValueError(f"quantization mode must be one of {MODES}, got {mode}")
+    quantize_detector(yolo_weights, mode, source, imgsz, calib_frames)
+    quantize_reid(reid_weights, mode, source, calib_crops)
+    if report_results:
+        report(yolo_weights, reid_weights, mode, source, classes)
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--yolo-weights", type=Path, default=WEIGHTS / "best.pt")
+    parser.add_argument("--reid-weights", type=Path, default=WEIGHTS / "osnet_x0_25_msmt17.pt")
+    parser.add_argument("--mode", default="static", choices=MODES)
+    parser.add_argument("--source", type=str, default=ROOT / "../../data/short_new_1.mp4")
+    parser.add_argument("--imgsz", nargs=2, type=int, default=[640, 640], help="h, w")
+    parser.add_argument("--calib-frames", type=int, default=32)
+    parser.add_argument("--calib-crops", type=int, default=256)
+    parser.add_argument("--classes", nargs="+", type=int, help="filter by class: --classes 0, or --classes 0 2 3")
+    parser.add_argument("--report", dest="report_results", action="store_true", help="accuracy + speed vs FP32")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run(**vars(parse_opt()))
@@ -0,0 +1,177 @@
+"""
+Export a StrongSORT ReID model for CPU inference and check it against eager PyTorch.
+
+Usage:
+    $ python reid_export.py --weights weights/osnet_x0_25_msmt17.pt --include onnx openvino
+    $ python reid_export.py --weights weights/osnet_x0_25_msmt17.pt --batch-size 16   # fixed batch
+    $ python reid_export.py --weights weights/osnet_x0_25_msmt17.pt --check --source ../../data/short_new_1.mp4
+
+Exports land next to the weights and are loaded by StrongSORT from their suffix:
+    osnet_x0_25_msmt17.onnx             dynamic batch
+    osnet_x0_25_msmt17_b16.onnx         fixed batch of 16
+    osnet_x0_25_msmt17_openvino_model/  OpenVINO IR of the ONNX export
+--check compares every export with the eager model on crops cut from --source
+(max abs difference and cosine similarity of the features) and reports crops/s.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[0]  # yolov5 strongsort root directory
+WEIGHTS = ROOT / "weights"
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+if str(ROOT / "yolov5") not in sys.path:
+    sys.path.append(str(ROOT / "yolov5"))  # add yolov5 ROOT to PATH
+if str(ROOT / "strong_sort") not in sys.path:
+    sys.path.append(str(ROOT / "strong_sort"))  # add strong_sort ROOT to PATH
+
+from utils.general import LOGGER, check_requirements, colorstr, cv2, file_size
+from strong_sort.deep.reid_model_factory import get_model_name
+from strong_sort.deep.reid_multibackend import ReIDDetectMultiBackend
+from strong_sort.deep.reid.torchreid.utils import FeatureExtractor
+
+
+def export_onnx(model, im, file, opset, dynamic, prefix=colorstr("ONNX:")):
+    # ReID ONNX export, dynamic batch or fixed to im.shape[0]
+    try:
+        check_requirements(("onnx",))
+        import onnx
+
+        LOGGER.info(f"\n{prefix} starting export with onnx {onnx.__version__}...")
+        f = file.with_suffix(".onnx") if dynamic else file.with_name(f"{file.stem}_b{im.shape[0]}.onnx")
+        torch.onnx.export(
+            model.cpu(),
+            im.cpu(),
+            f,
+            verbose=False,
+            opset_version=opset,
+            do_constant_folding=True,
+            input_names=["images"],
+            output_names=["output"],
+            dynamic_axes={"images": {0: "batch"}, "output": {0: "batch"}} if dynamic else None,
+        )
+        onnx.checker.check_model(onnx.load(f))  # check onnx model
+        LOGGER.info(f"{prefix} export success, saved as {f} ({file_size(f):.1f} MB)")
+        return f
+    except Exception as e:
+        LOGGER.info(f"{prefix} export failure: {e}")
+
+
+def export_openvino(onnx_file, half, prefix=colorstr("OpenVINO:")):
+    # ReID OpenVINO export from the ONNX model
+    try:
+        check_requirements(("openvino-dev",))  # requires openvino-dev: https://pypi.org/project/openvino-dev/
+        LOGGER.info(f"\n{prefix} starting export with openvino...")
+        f = onnx_file.with_name(f"{onnx_file.stem}_openvino_model")
+        cmd = f"mo --input_model {onnx_file} --output_dir {f} --data_type {'FP16' if half else 'FP32'}"
+        subprocess.check_output(cmd.split())  # export
+        LOGGER.info(f"{prefix} export success, saved as {f} ({file_size(f):.1f} MB)")
+        return f
+    except Exception as e:
+        LOGGER.info(f"{prefix} export failure: {e}")
+
+
+def sample_crops(source, n=256, seed=0):
+    "n player-sized crops cut at random from frames spread over the video [source]"
+    rng = np.random.default_rng(seed)
+    cap = cv2.VideoCapture(str(source))
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 1
+    crops = []
+    for idx in np.linspace(0, frames - 1, num=min(frames, 16), dtype=int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(idx))
+        ok, frame = cap.read()
+        if not ok:
+            continue
+        h, w = frame.shape[:2]
+        for _ in range(n // 16 + 1):
+            bh = int(rng.integers(h // 8, h // 3))
+            bw = max(bh // 3, 8)
+            y, x = int(rng.integers(0, h - bh)), int(rng.integers(0, w - bw))
+            crops.append(frame[y : y + bh, x : x + bw])
+    cap.release()
+    if not crops:  # unreadable source, fall back to noise
+        crops = [rng.integers(0, 255, (192, 64, 3), dtype=np.uint8) for _ in range(n)]
+    return crops[:n]
+
+
+def benchmark(extractor, crops, batch, repeats=3):
+    "features of every crop, and crops per second at [batch] crops per call"
+    features = torch.cat([extractor(crops[i : i + batch]) for i in range(0, len(crops), batch)])
+    t = time.perf_counter()
+    for _ in range(repeats):
+        for i in range(0, len(crops), batch):
+            extractor(crops[i : i + batch])
+    return features.cpu().numpy(), repeats * len(crops) / (time.perf_counter() - t)
+
+
+def check(weights, exports, source, batch, num_threads=None):
+    "prints parity and throughput of every export against the eager PyTorch model"
+    crops = sample_crops(source)
+    eager = FeatureExtractor(get_model_name(weights), str(weights), device="cpu", verbose=False)
+    ref, ref_speed = benchmark(eager, crops, batch)
+    LOGGER.info(f"\n{'backend':<44}{'max |diff|':>12}{'min cos':>10}{'crops/s':>10}{'speedup':>9}")
+    LOGGER.info(f"{'pytorch (eager)':<44}{0:>12.2e}{1:>10.4f}{ref_speed:>10.1f}{1:>8.2f}x")
+    for f in exports:
+        features, speed = benchmark(ReIDDetectMultiBackend(f, num_threads=num_threads), crops, batch)
+        cos = (features * ref).sum(1) / (
+            np.linalg.norm(features, axis=1) * np.linalg.norm(ref, axis=1) + 1e-12
+        )
+        diff = np.abs(features - ref).max()
+        LOGGER.info(f"{Path(f).name:<44}{diff:>12.2e}{cos.min():>10.4f}{speed:>10.1f}{speed / ref_speed:>8.2f}x")
+
+
+def run(
+    weights=WEIGHTS / "osnet_x0_25_msmt17.pt",  # model.pt path
+    include=("onnx",),  # export formats
+    batch_size=1,  # batch of a fixed-batch export
+    dynamic=True,  # dynamic batch axis, ignored if batch_size > 1
+    opset=12,  # ONNX opset version
+    half=False,  # FP16 OpenVINO IR
+    imgsz=(256, 128),  # ReID input height, width
+    check_exports=False,  # compare exports against eager PyTorch
+    source=ROOT / "../../data/short_new_1.mp4",  # video crops are cut from for --check
+    num_threads=None,  # intra-op threads of the exported runtimes
+):
+    torch.set_num_threads(num_threads or os.cpu_count())
+    weights = Path(weights)
+    dynamic = dynamic and batch_size <= 1
+    model = FeatureExtractor(get_model_name(weights), str(weights), device="cpu", verbose=False).model
+    model.eval()
+    im = torch.zeros(max(batch_size, 1), 3, *imgsz)
+    exports = []
+    f = export_onnx(model, im, weights, opset, dynamic)
+    if f and "onnx" in include:
+        exports.append(f)
+    if f and "openvino" in include:
+        exports.append(export_openvino(f, half))
+    exports = [e for e in exports if e]
+    if check_exports and exports:
+        check(weights, exports, source, max(batch_size, 16), num_threads)
+    return exports
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weights", type=Path, default=WEIGHTS / "osnet_x0_25_msmt17.pt")
+    parser.add_argument("--include", nargs="+", default=["onnx"], help="onnx, openvino")
+    parser.add_argument("--batch-size", type=int, default=1, help="> 1 exports a fixed batch")
+    parser.add_argument("--opset", type=int, default=12)
+    parser.add_argument("--half", action="store_true", help="FP16 OpenVINO IR")
+    parser.add_argument("--imgsz", nargs=2, type=int, default=[256, 128], help="h, w")
+    parser.add_argument("--check", dest="check_exports", action="store_true", help="parity + benchmark vs eager")
+    parser.add_argument("--source", type=str, default=ROOT / "../../data/short_new_1.mp4")
+    parser.add_argument("--num-threads", type=int, default=None)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run(**vars(parse_opt()))
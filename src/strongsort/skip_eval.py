@@ -0,0 +1,83 @@
+"""
+Measure tracking accuracy against speed for detect.run frame skipping.
+
+Usage:
+    $ python skip_eval.py --yolo-weights weights/best.pt --source ../../data/short_new_1.mp4 --skips 2 3 4
+    $ python skip_eval.py ... --skips 2 4 --skip-motion 0 6    # every skips x skip_motion pair
+
+Every setting is tracked over --source and compared with detection on every frame,
+which is the reference since our footage has no labels: IDF1 of the skipped run's
+tracks against the reference tracks, next to wall time and speedup.
+"""
+import argparse
+import itertools
+import sys
+import time
+from pathlib import Path
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[0]  # yolov5 strongsort root directory
+WEIGHTS = ROOT / "weights"
+
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+if str(ROOT / "yolov5") not in sys.path:
+    sys.path.append(str(ROOT / "yolov5"))  # add yolov5 ROOT to PATH
+if str(ROOT / "strong_sort") not in sys.path:
+    sys.path.append(str(ROOT / "strong_sort"))  # add strong_sort ROOT to PATH
+
+from strong_sort.utils.mot_metrics import idf1
+from yolov5 import detect
+
+
+def track(source, yolo_weights, reid_weights, classes, skips, skip_motion):
+    "MOT rows of one detect.run setting and its wall time"
+    t = time.perf_counter()
+    rows, _ = detect.run(
+        source=source,
+        yolo_weights=Path(yolo_weights),
+        strong_sort_weights=Path(reid_weights),
+        classes=classes,
+        project=ROOT / "runs/skip_eval",
+        name=f"skips{skips}_motion{skip_motion:g}",
+        exist_ok=True,
+        skips=skips,
+        skip_motion=skip_motion,
+        ret=True,
+    )
+    return rows, time.perf_counter() - t
+
+
+def run(
+    yolo_weights=WEIGHTS / "best.pt",  # YOLOv5 model.pt path
+    reid_weights=WEIGHTS / "osnet_x0_25_msmt17.pt",  # ReID model.pt path
+    source=ROOT / "../../data/short_new_1.mp4",  # footage to track
+    classes=None,  # filter by class
+    skips=(2, 3, 4),  # detector intervals to evaluate
+    skip_motion=(0.0,),  # motion thresholds to evaluate, 0 disables
+):
+    ref, t_ref = track(source, yolo_weights, reid_weights, classes, 1, 0.0)
+    print(f"\n{'skips':>6}{'motion':>8}{'IDF1':>8}{'time (s)':>10}{'speedup':>9}")
+    print(f"{1:>6}{0:>8g}{1:>8.4f}{t_ref:>10.1f}{1:>8.2f}x")
+    results = []
+    for n, motion in itertools.product(skips, skip_motion):
+        rows, t = track(source, yolo_weights, reid_weights, classes, n, motion)
+        score = idf1(ref, rows)
+        results.append((n, motion, score, t))
+        print(f"{n:>6}{motion:>8g}{score:>8.4f}{t:>10.1f}{t_ref / t:>8.2f}x")
+    return results
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--yolo-weights", type=Path, default=WEIGHTS / "best.pt")
+    parser.add_argument("--reid-weights", type=Path, default=WEIGHTS / "osnet_x0_25_msmt17.pt")
+    parser.add_argument("--source", type=str, default=ROOT / "../../data/short_new_1.mp4")
+    parser.add_argument("--classes", nargs="+", type=int, help="filter by class: --classes 0, or --classes 0 2 3")
+    parser.add_argument("--skips", nargs="+", type=int, default=[2, 3, 4])
+    parser.add_argument("--skip-motion", nargs="+", type=float, default=[0.0])
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run(**vars(parse_opt()))
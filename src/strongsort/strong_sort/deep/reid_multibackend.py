@@ -0,0 +1,138 @@
+"""
+ReID feature extraction on exported OSNet models, a drop-in for FeatureExtractor.
+
+Backend is picked from the weights path, like DetectMultiBackend does for YOLO:
+    PyTorch:      *.pt, *.pth      (eager FeatureExtractor, see build_extractor)
+    ONNX Runtime: *.onnx           (fixed or dynamic batch)
+    OpenVINO:     *.xml or *_openvino_model/
+Exports are produced by reid_export.py.
+"""
+from pathlib import Path
+
+import numpy as np
+import torch
+import torchvision.transforms as T
+
+
+def reid_backend(weights) -> str:
+    "'onnx', 'openvino' or 'pytorch' depending on the suffix of [weights]"
+    w = Path(str(weights))
+    if w.suffix == ".onnx":
+        return "onnx"
+    if w.suffix == ".xml" or w.name.endswith("_openvino_model"):
+        return "openvino"
+    return "pytorch"
+
+
+def build_preprocess(
+    image_size=(256, 128),
+    pixel_mean=[0.485, 0.456, 0.406],
+    pixel_std=[0.229, 0.224, 0.225],
+):
+    "the FeatureExtractor transform, from a (H, W, C) crop to a normalized tensor"
+    to_pil = T.ToPILImage()
+    transform = T.Compose(
+        [
+            T.Resize(image_size),
+            T.ToTensor(),
+            T.Normalize(mean=pixel_mean, std=pixel_std),
+        ]
+    )
+    return lambda im: transform(to_pil(im))
+
+
+def build_extractor(model_name, weights, device):
+    "FeatureExtractor for PyTorch weights, ReIDDetectMultiBackend for exported ones"
+    if reid_backend(weights) == "pytorch":
+        from .reid.torchreid.utils import FeatureExtractor
+
+        return FeatureExtractor(
+            model_name=model_name, model_path=weights, device=str(device)
+        )
+    return ReIDDetectMultiBackend(weights, device=device)
+
+
+class ReIDDetectMultiBackend(object):
+    """
+    Runs an exported ReID model on CPU. Called like FeatureExtractor with a list
+    of (H, W, C) crops and returns a torch tensor of shape (B, D). Preprocessing
+    is the one of FeatureExtractor so features of both paths are comparable.
+    """
+
+    def __init__(
+        self,
+        weights,
+        device="cpu",
+        image_size=(256, 128),
+        pixel_mean=[0.485, 0.456, 0.406],
+        pixel_std=[0.229, 0.224, 0.225],
+        num_threads=None,
+    ):
+        w = Path(str(weights))
+        self.backend = reid_backend(w)
+        self.batch = None  # fixed batch size of the model, None if dynamic
+
+        if self.backend == "onnx":
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            if num_threads:
+                options.intra_op_num_threads = num_threads
+            self.session = onnxruntime.InferenceSession(
+                str(w), options, providers=["CPUExecutionProvider"]
+            )
+            self.input_name = self.session.get_inputs()[0].name
+            batch = self.session.get_inputs()[0].shape[0]
+            self.batch = batch if isinstance(batch, int) else None
+        elif self.backend == "openvino":
+            from openvino.runtime import Core, Layout, get_batch
+
+            if not w.is_file():  # *_openvino_model dir
+                w = next(w.glob("*.xml"))
+            ie = Core()
+            network = ie.read_model(model=w, weights=w.with_suffix(".bin"))
+            if network.get_parameters()[0].get_layout().empty:
+                network.get_parameters()[0].set_layout(Layout("NCHW"))
+            batch = get_batch(network)
+            self.batch = batch.get_length() if batch.is_static else None
+            config = {"INFERENCE_NUM_THREADS": str(num_threads)} if num_threads else {}
+            self.executable_network = ie.compile_model(network, "CPU", config)
+            self.output_layer = next(iter(self.executable_network.outputs))
+        else:
+            raise ValueError(f"{weights} is not an exported ReID model")
+
+        self.preprocess = build_preprocess(image_size, pixel_mean, pixel_std)
+        self.device = torch.device("cpu")
+
+    def _infer(self, images: np.ndarray) -> np.ndarray:
+        if self.backend == "onnx":
+            return self.session.run(None, {self.input_name: images})[0]
+        return self.executable_network([images])[self.output_layer]
+
+    def forward(self, images: np.ndarray) -> np.ndarray:
+        "features of a (B, 3, H, W) float32 batch; fixed-batch models get padded chunks"
+        if self.batch is None:
+            return self._infer(images)
+        out = []
+        for i in range(0, len(images), self.batch):
+            chunk = images[i : i + self.batch]
+            n = len(chunk)
+            if n < self.batch:
+                pad = np.zeros((self.batch - n, *chunk.shape[1:]), dtype=chunk.dtype)
+                chunk = np.concatenate((chunk, pad))
+            out.append(self._infer(chunk)[:n])
+        return np.concatenate(out)
+
+    def __call__(self, input):
+        if isinstance(input, np.ndarray):
+            input = [input]
+        if isinstance(input, list):
+            images = torch.stack(
+                [self.preprocess(im) for im in input], dim=0
+            )
+        elif isinstance(input, torch.Tensor):
+            images = input.unsqueeze(0) if input.dim() == 3 else input
+        else:
+            raise NotImplementedError
+        images = np.ascontiguousarray(images.cpu().numpy(), dtype=np.float32)
+        return torch.from_numpy(self.forward(images))
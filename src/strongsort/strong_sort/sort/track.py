@@ -292,6 +292,19 @@ class Track:
         self.age += 1
         self.time_since_update += 1
 
+    def predict_motion(self, kf):
+        """Propagate the state distribution one frame forward on a frame the
+        detector skipped. Unlike `predict`, the frame is not counted as a time
+        step, so age and time_since_update are left untouched.
+
+        Parameters
+        ----------
+        kf : kalman_filter.KalmanFilter
+            The Kalman filter.
+
+        """
+        self.mean, self.covariance = self.kf.predict(self.mean, self.covariance)
+
     def update(self, detection, class_id, conf):
         """Perform Kalman filter measurement update step and update the feature
         cache.
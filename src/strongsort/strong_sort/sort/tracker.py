@@ -56,6 +56,13 @@ class Tracker:
         for track in self.tracks:
             track.predict(self.kf)
 
+    def predict_motion(self):
+        """Propagate track state distributions one frame forward on a frame the
+        detector skipped, without counting it as a missed time step.
+        """
+        for track in self.tracks:
+            track.predict_motion(self.kf)
+
     def increment_ages(self):
         for track in self.tracks:
             track.increment_age()
@@ -13,7 +13,7 @@ from .deep.reid_model_factory import (
     get_model_name,
 )
 
-from .deep.reid.torchreid.utils import FeatureExtractor
+from .deep.reid_multibackend import build_extractor
 from .deep.reid.torchreid.utils.tools import download_url
 
 __all__ = ["StrongSORT"]
@@ -31,25 +31,27 @@ class StrongSORT(object):
         nn_budget=100,
         mc_lambda=0.995,
         ema_alpha=0.9,
+        extractor=None,
     ):
-        model_name = get_model_name(model_weights)
-        model_url = get_model_url(model_weights)
-
-        if not file_exists(model_weights) and model_url is not None:
-            gdown.download(model_url, str(model_weights), quiet=False)
-        elif file_exists(model_weights):
-            pass
-        elif model_url is None:
-            print("No URL associated to the chosen DeepSort weights. Choose between:")
-            show_downloadeable_models()
-            exit()
-
-        self.extractor = FeatureExtractor(
-            # get rid of dataset information DeepSort model name
-            model_name=model_name,
-            model_path=model_weights,
-            device=str(device),
-        )
+        # model_weights=None builds an association-only tracker fed through
+        # update_features, e.g. when replaying cached features; a loaded
+        # extractor is shared instead of loading model_weights again
+        self.extractor = extractor
+        if model_weights is not None and extractor is None:
+            model_name = get_model_name(model_weights)
+            model_url = get_model_url(model_weights)
+
+            if not file_exists(model_weights) and model_url is not None:
+                gdown.download(model_url, str(model_weights), quiet=False)
+            elif file_exists(model_weights):
+                pass
+            elif model_url is None:
+                print("No URL associated to the chosen DeepSort weights. Choose between:")
+                show_downloadeable_models()
+                exit()
+
+            # .pt runs eager PyTorch, .onnx/.xml/_openvino_model an exported model
+            self.extractor = build_extractor(model_name, model_weights, device)
 
         self.max_dist = max_dist
         metric = NearestNeighborDistanceMetric("cosine", self.max_dist, nn_budget)
@@ -58,9 +60,18 @@ class StrongSORT(object):
         )
 
     def update(self, bbox_xywh, confidences, classes, ori_img):
-        self.height, self.width = ori_img.shape[:2]
         # generate detections
-        features = self._get_features(bbox_xywh, ori_img)
+        features = self.get_features(bbox_xywh, ori_img)
+        return self.update_features(
+            bbox_xywh, confidences, classes, features, ori_img.shape[:2]
+        )
+
+    def update_features(self, bbox_xywh, confidences, classes, features, img_shape):
+        """
+        Runs association given precomputed ReID features, one row per box.
+        img_shape is (height, width) of the frame the boxes come from.
+        """
+        self.height, self.width = img_shape[:2]
         bbox_tlwh = self._xywh_to_tlwh(bbox_xywh)
         detections = [
             Detection(bbox_tlwh[i], conf, features[i])
@@ -74,8 +85,20 @@ class StrongSORT(object):
         # update tracker
         self.tracker.predict()
         self.tracker.update(detections, classes, confidences)
+        return self._outputs()
 
-        # output bbox identities
+    def predict(self, img_shape):
+        """
+        Outputs of a frame the detector skipped: tracks move along their Kalman
+        prediction and keep the identities of the last detected frame.
+        img_shape is (height, width) of the skipped frame.
+        """
+        self.height, self.width = img_shape[:2]
+        self.tracker.predict_motion()
+        return self._outputs()
+
+    def _outputs(self):
+        "(x1, y1, x2, y2, track_id, class_id, conf) of every confirmed, recently matched track"
         outputs = []
         for track in self.tracker.tracks:
             if not track.is_confirmed() or track.time_since_update > 1:
@@ -141,7 +164,9 @@ class StrongSORT(object):
         h = int(y2 - y1)
         return t, l, w, h
 
-    def _get_features(self, bbox_xywh, ori_img):
+    def get_features(self, bbox_xywh, ori_img):
+        "ReID features of every box in bbox_xywh cropped from ori_img"
+        self.height, self.width = ori_img.shape[:2]
         im_crops = []
         for box in bbox_xywh:
             x1, y1, x2, y2 = self._xywh_to_xyxy(box)
@@ -0,0 +1,186 @@
+"""
+On-disk cache of per-frame detections and ReID features.
+
+Rows are the raw non_max_suppression output for every class, so one entry
+serves any class filter. A cache entry is a directory of .npy files that are
+opened memory-mapped, so a replay only pages in the frames it touches:
+
+    meta.json     version, frame count, frame size, feature dimension
+    offsets.npy   int64 (frames + 1,) row offsets of every frame
+    skipped.npy   bool (frames,) frames the detector skipped (see detect.run skips)
+    dets.npy      float32 (N, 6) rows of (x_center, y_center, w, h, conf, cls)
+    features.npy  float32 (N, D) ReID embedding of every row in dets.npy
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+
+CACHE_VERSION = 3
+_CHUNK = 1 << 20  # bytes read per step when hashing files
+_ROWS = 1 << 16  # rows copied per step when finalising a cache
+
+
+def file_digest(path) -> str:
+    """sha256 of a file's content, or of its name if the file does not exist."""
+    path = Path(path)
+    h = hashlib.sha256()
+    if not path.is_file():
+        h.update(path.name.encode())
+        return h.hexdigest()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_key(source, yolo_weights, reid_weights, **params) -> str:
+    """
+    Key of a cache entry: hashes of the video and both model weights plus every
+    parameter that changes which detections reach the tracker.
+    """
+    if isinstance(yolo_weights, (list, tuple)):
+        yolo = [file_digest(w) for w in yolo_weights]
+    else:
+        yolo = [file_digest(yolo_weights)]
+    payload = {
+        "version": CACHE_VERSION,
+        "source": file_digest(source),
+        "yolo": yolo,
+        "reid": file_digest(reid_weights),
+        "params": params,
+    }
+    blob = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(blob).hexdigest()[:32]
+
+
+class FeatureCacheWriter:
+    """
+    Collects detections and features frame by frame and writes a cache entry.
+    Frames may arrive out of order and from several threads; rows are appended
+    to raw files as they come and sorted by frame once in close().
+    """
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        self._tmp.mkdir(parents=True)
+        self._lock = threading.Lock()
+        self._frames = []  # frame index of every appended row
+        self._skipped = []  # frames the detector did not run on
+        self._dets = open(self._tmp / "dets.raw", "wb")
+        self._features = open(self._tmp / "features.raw", "wb")
+        self._nframes = 0
+        self._dim = None
+        self._shape = None
+
+    def add(self, frame_idx: int, img_shape, xywhs=None, confs=None, clss=None, features=None):
+        "record the detections of frame [frame_idx]; pass no rows for an empty frame"
+        with self._lock:
+            self._nframes = max(self._nframes, frame_idx + 1)
+            self._shape = tuple(int(x) for x in img_shape[:2])
+            if xywhs is None or len(xywhs) == 0:
+                return
+            dets = np.column_stack(
+                (
+                    np.asarray(xywhs, dtype=np.float32).reshape(-1, 4),
+                    np.asarray(confs, dtype=np.float32).reshape(-1),
+                    np.asarray(clss, dtype=np.float32).reshape(-1),
+                )
+            )
+            features = np.ascontiguousarray(features, dtype=np.float32)
+            self._dim = features.shape[1]
+            self._dets.write(dets.tobytes())
+            self._features.write(features.tobytes())
+            self._frames.extend([frame_idx] * len(dets))
+
+    def skip(self, frame_idx: int, img_shape):
+        "record that the detector skipped frame [frame_idx]"
+        with self._lock:
+            self._nframes = max(self._nframes, frame_idx + 1)
+            self._shape = tuple(int(x) for x in img_shape[:2])
+            self._skipped.append(frame_idx)
+
+    def close(self) -> None:
+        "sort rows by frame and move the finished entry into place"
+        self._dets.close()
+        self._features.close()
+        frames = np.asarray(self._frames, dtype=np.int64)
+        n, dim = len(frames), self._dim or 0
+        order = np.argsort(frames, kind="stable")
+        offsets = np.zeros(self._nframes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(frames, minlength=self._nframes), out=offsets[1:])
+
+        for name, width in (("dets", 6), ("features", dim)):
+            raw = self._tmp / f"{name}.raw"
+            out = np.lib.format.open_memmap(
+                self._tmp / f"{name}.npy", mode="w+", dtype=np.float32, shape=(n, width)
+            )
+            if n and width:
+                src = np.memmap(raw, dtype=np.float32, mode="r", shape=(n, width))
+                for i in range(0, n, _ROWS):
+                    out[i : i + _ROWS] = src[order[i : i + _ROWS]]
+                del src
+            out.flush()
+            del out
+            os.remove(raw)
+
+        np.save(self._tmp / "offsets.npy", offsets)
+        skipped = np.zeros(self._nframes, dtype=bool)
+        skipped[np.asarray(self._skipped, dtype=np.int64)] = True
+        np.save(self._tmp / "skipped.npy", skipped)
+        with open(self._tmp / "meta.json", "w") as f:
+            json.dump(
+                {
+                    "version": CACHE_VERSION,
+                    "frames": self._nframes,
+                    "shape": self._shape,
+                    "dim": dim,
+                },
+                f,
+            )
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self._tmp, self.path)
+
+
+class FeatureCache:
+    "Read-only, memory-mapped view of a cache entry written by FeatureCacheWriter"
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        with open(self.path / "meta.json", "r") as f:
+            self.meta = json.load(f)
+        self.offsets = np.load(self.path / "offsets.npy")
+        self.dets = np.load(self.path / "dets.npy", mmap_mode="r")
+        self.features = np.load(self.path / "features.npy", mmap_mode="r")
+        self.skipped = np.load(self.path / "skipped.npy")
+        self.shape = tuple(self.meta["shape"] or (0, 0))
+
+    @staticmethod
+    def exists(path) -> bool:
+        "if a complete entry of the current version is stored at [path]"
+        try:
+            with open(Path(path) / "meta.json", "r") as f:
+                return json.load(f).get("version") == CACHE_VERSION
+        except (OSError, ValueError):
+            return False
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def frame(self, frame_idx: int, classes=None):
+        """
+        (xywhs, confs, clss, features) of a frame, empty arrays if nothing was detected
+        classes: if given, only rows of these class ids are returned
+        """
+        lo, hi = self.offsets[frame_idx], self.offsets[frame_idx + 1]
+        dets, features = self.dets[lo:hi], self.features[lo:hi]
+        if classes is not None and len(dets):
+            keep = np.isin(dets[:, 5], classes)
+            dets, features = dets[keep], features[keep]
+        return dets[:, 0:4], dets[:, 4], dets[:, 5], features
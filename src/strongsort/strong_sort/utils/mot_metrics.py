@@ -0,0 +1,36 @@
+"""
+Tracking metrics between two sets of MOT rows (frameid, class, trackid, left, top, w, h),
+e.g. a cheaper pipeline setting against the full one on our own footage.
+"""
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+def _iou(a, b):
+    "IoU matrix of (left, top, w, h) boxes a (N, 4) and b (M, 4)"
+    a1, a2 = a[:, None, :2], a[:, None, :2] + a[:, None, 2:]
+    b1, b2 = b[None, :, :2], b[None, :, :2] + b[None, :, 2:]
+    inter = np.clip(np.minimum(a2, b2) - np.maximum(a1, b1), 0, None).prod(2)
+    union = a[:, None, 2:].prod(2) + b[None, :, 2:].prod(2) - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def idf1(reference, candidate, iou_thres=0.5):
+    """
+    IDF1 of the MOT rows (frameid, class, trackid, left, top, w, h) of [candidate]
+    against the rows of [reference], with ids matched one to one over the video
+    """
+    ref, cand = np.asarray(reference, float), np.asarray(candidate, float)
+    if not len(ref) or not len(cand):
+        return 0.0
+    ref_ids, ref_idx = np.unique(ref[:, 2], return_inverse=True)
+    cand_ids, cand_idx = np.unique(cand[:, 2], return_inverse=True)
+    overlap = np.zeros((len(ref_ids), len(cand_ids)))  # frames each id pair overlaps in
+    for frame in np.intersect1d(ref[:, 0], cand[:, 0]):
+        r, c = np.flatnonzero(ref[:, 0] == frame), np.flatnonzero(cand[:, 0] == frame)
+        iou = _iou(ref[r, 3:7], cand[c, 3:7])
+        iou[ref[r, 1][:, None] != cand[c, 1][None, :]] = 0
+        i, j = np.nonzero(iou >= iou_thres)
+        np.add.at(overlap, (ref_idx[r[i]], cand_idx[c[j]]), 1)
+    rows, cols = linear_sum_assignment(-overlap)
+    return 2 * overlap[rows, cols].sum() / (len(ref) + len(cand))
@@ -51,6 +51,7 @@ import torch
 import torch.backends.cudnn as cudnn
 
 import concurrent.futures
+import threading
 import urllib.request
 
 FILE = Path(__file__).resolve()
@@ -63,6 +64,8 @@ if str(ROOT / "yolov5") not in sys.path:
     sys.path.append(str(ROOT / "yolov5"))  # add yolov5 ROOT to PATH
 if str(ROOT / "strong_sort") not in sys.path:
     sys.path.append(str(ROOT / "strong_sort"))  # add strong_sort ROOT to PATH
+if str(FILE.parents[2]) not in sys.path:
+    sys.path.append(str(FILE.parents[2]))  # add src to PATH for processing
 
 ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
 
@@ -95,12 +98,111 @@ from utils.general import (
 from utils.torch_utils import select_device, time_sync
 from utils.plots import Annotator, colors, save_one_box
 from strong_sort.utils.parser import get_config
+from strong_sort.utils.feature_cache import (
+    FeatureCache,
+    FeatureCacheWriter,
+    cache_key,
+)
 from strong_sort.strong_sort import StrongSORT
+from processing.video_sink import VideoSink
 
 # remove duplicated stream handler to avoid duplicated logging
 logging.getLogger().removeHandler(logging.getLogger().handlers[0])
 
 
+def build_strongsort(cfg, strong_sort_weights, device, extractor=None):
+    "StrongSORT instance configured from cfg.STRONGSORT, sharing extractor if given"
+    return StrongSORT(
+        strong_sort_weights,
+        device,
+        max_dist=cfg.STRONGSORT.MAX_DIST,
+        max_iou_distance=cfg.STRONGSORT.MAX_IOU_DISTANCE,
+        max_age=cfg.STRONGSORT.MAX_AGE,
+        n_init=cfg.STRONGSORT.N_INIT,
+        nn_budget=cfg.STRONGSORT.NN_BUDGET,
+        mc_lambda=cfg.STRONGSORT.MC_LAMBDA,
+        ema_alpha=cfg.STRONGSORT.EMA_ALPHA,
+        extractor=extractor,
+    )
+
+
+def load_detector(yolo_weights, device="", imgsz=(640, 640), dnn=False, half=False):
+    "DetectMultiBackend of yolo_weights after one inference, to pass to run() as models"
+    device = select_device(device)
+    model = DetectMultiBackend(yolo_weights, device=device, dnn=dnn, data=None, fp16=half)
+    imgsz = check_img_size(imgsz, s=model.stride)
+    im = torch.zeros(1, 3, *imgsz, device=device)
+    with torch.no_grad():
+        model(im.half() if model.fp16 else im)  # warmup, also on cpu
+    return model
+
+
+def load_extractor(strong_sort_weights, device=""):
+    "ReID extractor of strong_sort_weights after one inference, to pass to run() as models"
+    extractor = StrongSORT(strong_sort_weights, select_device(device)).extractor
+    extractor([np.zeros((128, 64, 3), dtype=np.uint8)])  # warmup
+    return extractor
+
+
+def mot_row(frame_idx, output):
+    "(frameid, class, trackid, bbox_left, bbox_top, bbox_w, bbox_h) of a StrongSORT output"
+    return (
+        frame_idx + 1,
+        output[5],
+        output[4],
+        output[0],  # MOT format
+        output[1],
+        output[2] - output[0],
+        output[3] - output[1],
+    )
+
+
+def motion_thumbnail(im0):
+    "small grayscale copy of a frame, compared between frames to measure motion"
+    gray = cv2.cvtColor(im0, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (160, 90), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def replay(
+    cache, cfg, write_to=None, ret=True, classes=None, skip_big=False, on_frame=None
+):
+    """
+    Runs only StrongSORT association over a FeatureCache, frame by frame.
+    Writes the same MOT rows as run() to write_to (if given) and returns them
+    as a list of tuples if ret. on_frame(done, total) is called after every frame.
+    """
+    tracker = build_strongsort(cfg, None, "cpu")
+    rows = []
+    for frame_idx in range(len(cache)):
+        if on_frame is not None:
+            on_frame(frame_idx, len(cache))
+        if cache.skipped[frame_idx]:
+            outputs = tracker.predict(cache.shape)
+        else:
+            xywhs, confs, clss, features = cache.frame(frame_idx, classes=classes)
+            if not len(xywhs):
+                tracker.increment_ages()
+                continue
+            outputs = tracker.update_features(
+                torch.from_numpy(np.array(xywhs)),
+                torch.from_numpy(np.array(confs)),
+                torch.from_numpy(np.array(clss)),
+                torch.from_numpy(np.array(features)),
+                cache.shape,
+            )
+        for output in outputs:
+            if skip_big and output[2] - output[0] >= 200:
+                continue
+            rows.append(mot_row(frame_idx, output))
+    if on_frame is not None:
+        on_frame(len(cache), len(cache))
+
+    if write_to is not None:
+        with open(write_to, "w") as f:
+            f.writelines(("%g " * 11 + "\n") % (*row, -1, -1, -1, -1) for row in rows)
+    return rows if ret else []
+
+
 @torch.no_grad()
 def run(
     source="0",
@@ -119,6 +221,7 @@ def run(
     save_conf=False,  # save confidences in --save-txt labels
     save_crop=False,  # save cropped prediction boxes
     save_vid=False,  # save confidences in --save-txt labels
+    encoding=None,  # VideoSink options (preset, crf, threads) of saved videos
     nosave=False,  # do not save images/videos
     classes=None,  # filter by class: --class 0, or --class 0 2 3
     agnostic_nms=False,  # class-agnostic NMS
@@ -137,9 +240,14 @@ def run(
     count=False,  # get counts of every obhects
     draw=False,  # draw object trajectory lines
     ret=True,  # return values as a list of tuples
-    skips=1,  # how many frames to skip (cuts processing time by a factor of skips)
+    skips=1,  # run the detector every skips frames, Kalman predictions fill the rest
+    skip_motion=0.0,  # mean abs gray change since the last detected frame that forces detection, 0 disables
     skip_big=False,  # skip counting an object with large width
+    reid_cache=None,  # dir of cached detections + ReID features; a hit replays association only
+    from_detections=False,  # only replay from reid_cache, never decode or run inference
     verbose=False,  # print results
+    models=None,  # loaded {"detector": load_detector(), "extractor": load_extractor()}, else weights are loaded
+    on_frame=None,  # called with (frames tracked, frames of the video) as frames complete
 ):
     LOGGER = get_logger(logger_name)
     if not verbose:
@@ -170,12 +278,59 @@ def run(
         parents=True, exist_ok=True
     )  # make dir
 
+    # initialize StrongSORT
+    cfg = get_config()
+    cfg.merge_from_file(config_strongsort)
+
+    # Detections + ReID features only depend on the video, the weights and the
+    # detection parameters, so association settings and class filters can be
+    # tuned on a cache hit
+    cache_writer = None
+    if from_detections and reid_cache is None:
+        raise ValueError("from_detections requires reid_cache")
+    if reid_cache is not None and not webcam:
+        cache_dir = Path(reid_cache) / cache_key(
+            source,
+            yolo_weights,
+            strong_sort_weights,
+            imgsz=imgsz,
+            conf_thres=conf_thres,
+            iou_thres=iou_thres,
+            max_det=max_det,
+            agnostic_nms=agnostic_nms,
+            augment=augment,
+            half=half,
+            skips=skips,
+            skip_motion=skip_motion,
+        )
+        if FeatureCache.exists(cache_dir):
+            LOGGER.info(f"Replaying cached detections and features from {cache_dir}")
+            if save_txt and write_to is None:
+                write_to = str(save_dir / "tracks" / Path(source).stem)
+            rows = replay(
+                FeatureCache(cache_dir),
+                cfg,
+                write_to=write_to if save_txt else None,
+                ret=ret,
+                classes=classes,
+                skip_big=skip_big,
+                on_frame=on_frame,
+            )
+            return rows, None
+        if from_detections:
+            raise FileNotFoundError(f"no cached detections for {source} in {reid_cache}")
+        cache_writer = FeatureCacheWriter(cache_dir)
+
     # Load
     # device = '0' # force it to get a gpu
-    device = select_device(device)
-    model = DetectMultiBackend(
-        yolo_weights, device=device, dnn=dnn, data=None, fp16=half
-    )
+    if models is not None:
+        model = models["detector"]
+        device, half = model.device, model.fp16
+    else:
+        device = select_device(device)
+        model = DetectMultiBackend(
+            yolo_weights, device=device, dnn=dnn, data=None, fp16=half
+        )
     stride, names, pt = model.stride, model.names, model.pt
     imgsz = check_img_size(imgsz, s=stride)  # check image size
     trajectory = {}
@@ -195,24 +350,15 @@ def run(
         [None] * nr_sources,
     )
 
-    # initialize StrongSORT
-    cfg = get_config()
-    cfg.merge_from_file(config_strongsort)
-
     # Create as many strong sort instances as there are video sources
     strongsort_list = []
     for i in range(nr_sources):
         strongsort_list.append(
-            StrongSORT(
+            build_strongsort(
+                cfg,
                 strong_sort_weights,
                 device,
-                max_dist=cfg.STRONGSORT.MAX_DIST,
-                max_iou_distance=cfg.STRONGSORT.MAX_IOU_DISTANCE,
-                max_age=cfg.STRONGSORT.MAX_AGE,
-                n_init=cfg.STRONGSORT.N_INIT,
-                nn_budget=cfg.STRONGSORT.NN_BUDGET,
-                mc_lambda=cfg.STRONGSORT.MC_LAMBDA,
-                ema_alpha=cfg.STRONGSORT.EMA_ALPHA,
+                extractor=models["extractor"] if models is not None else None,
             )
         )
     outputs = [None] * nr_sources
@@ -242,6 +388,7 @@ def run(
         agnostic_nms,
         max_det,
         write_to,
+        detect=True,
     ):
         dt, seen = [0.0, 0.0, 0.0, 0.0], 0
         # curr_frames, prev_frames = [None] * nr_sources, [None] * nr_sources
@@ -256,21 +403,29 @@ def run(
         t2 = time_sync()
         dt[0] += t2 - t1
 
-        # Inference
-        visualize = (
-            increment_path(save_dir / Path(path[0]).stem, mkdir=True)
-            if visualize
-            else False
-        )
-        pred = model(im, augment=augment, visualize=visualize)
-        t3 = time_sync()
-        dt[1] += t3 - t2
-
-        # Apply NMS
-        pred = non_max_suppression(
-            pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det
-        )
-        dt[2] += time_sync() - t3
+        if not detect:  # tracker-only frame, see skips
+            pred = [None]
+        else:
+            # Inference
+            visualize = (
+                increment_path(save_dir / Path(path[0]).stem, mkdir=True)
+                if visualize
+                else False
+            )
+            pred = model(im, augment=augment, visualize=visualize)
+            t3 = time_sync()
+            dt[1] += t3 - t2
+
+            # Apply NMS; the cache stores every class and filters afterwards
+            pred = non_max_suppression(
+                pred,
+                conf_thres,
+                iou_thres,
+                None if cache_writer is not None else classes,
+                agnostic_nms,
+                max_det=max_det,
+            )
+            dt[2] += time_sync() - t3
 
         # Process detections
         for i, det in enumerate(pred):  # detections per image
@@ -307,7 +462,17 @@ def run(
             if cfg.STRONGSORT.ECC:  # camera motion compensation
                 strongsort_list[i].tracker.camera_update(prev_frames[i], curr_frames[i])
 
-            if det is not None and len(det):
+            if not detect:  # skipped frame, tracks follow their Kalman prediction
+                t4 = time_sync()
+                outputs[i] = strongsort_list[i].predict(im0.shape[:2])
+                confs = [output[6] for output in outputs[i]]
+                t5 = time_sync()
+                dt[3] += t5 - t4
+                if cache_writer is not None:
+                    cache_writer.skip(frame_idx, im0.shape)
+                LOGGER.info(f"{s}Skipped detection. StrongSORT:({t5 - t4:.3f}s)")
+
+            elif det is not None and len(det):
                 # Rescale boxes from img_size to im0 size
                 det[:, :4] = scale_coords(im.shape[2:], det[:, :4], im0.shape).round()
 
@@ -322,141 +487,131 @@ def run(
 
                 # pass detections to strongsort
                 t4 = time_sync()
-                outputs[i] = strongsort_list[i].update(
-                    xywhs.cpu(), confs.cpu(), clss.cpu(), im0
-                )
+                features = strongsort_list[i].get_features(xywhs.cpu(), im0)
+                if cache_writer is not None:
+                    cache_writer.add(
+                        frame_idx,
+                        im0.shape,
+                        xywhs.cpu().numpy(),
+                        confs.cpu().numpy(),
+                        clss.cpu().numpy(),
+                        features.cpu().numpy(),
+                    )
+                    if classes is not None:
+                        keep = (clss[:, None] == clss.new_tensor(classes)).any(1)
+                        xywhs, confs, clss = xywhs[keep], confs[keep], clss[keep]
+                        features = features[keep.to(features.device)]
+                if len(xywhs):
+                    outputs[i] = strongsort_list[i].update_features(
+                        xywhs.cpu(), confs.cpu(), clss.cpu(), features, im0.shape[:2]
+                    )
+                else:  # only filtered-out classes were detected
+                    strongsort_list[i].increment_ages()
+                    outputs[i] = []
                 t5 = time_sync()
                 dt[3] += t5 - t4
 
-                # draw boxes for visualization
-                if len(outputs[i]) > 0:
-                    for j, (output, conf) in enumerate(zip(outputs[i], confs)):
-                        bbox_w = output[2] - output[0]
-                        bbox_h = output[3] - output[1]
-
-                        if skip_big and bbox_w >= 200:
-                            # print("some object was too big, so ignored")
-                            continue
-
-                        bboxes = output[0:4]
-                        id = output[4]
-                        cls = output[5]
-                        bbox_left, bbox_top, bbox_right, bbox_bottom = bboxes
-
-                        if draw:
-                            # object trajectory
-                            center = (
-                                (int(bboxes[0]) + int(bboxes[2])) // 2,
-                                (int(bboxes[1]) + int(bboxes[3])) // 2,
-                            )
-                            if id not in trajectory:
-                                trajectory[id] = []
-                            trajectory[id].append(center)
-                            for i1 in range(1, len(trajectory[id])):
-                                if (
-                                    trajectory[id][i1 - 1] is None
-                                    or trajectory[id][i1] is None
-                                ):
-                                    continue
-                                # thickness = int(np.sqrt(1000/float(i1+10))*0.3)
-                                thickness = 2
-                                try:
-                                    cv2.line(
-                                        im0,
-                                        trajectory[id][i1 - 1],
-                                        trajectory[id][i1],
-                                        (0, 0, 255),
-                                        thickness,
-                                    )
-                                except:
-                                    pass
-
-                        if save_txt:
-                            # to MOT format
-                            bbox_left = output[0]
-                            bbox_top = output[1]
-                            bbox_w = output[2] - output[0]
-                            bbox_h = output[3] - output[1]
-                            # Write MOT compliant results to file
-                            with open(write_to, "a") as f:
-                                f.write(
-                                    ("%g " * 11 + "\n")
-                                    % (
-                                        frame_idx + 1,
-                                        cls,
-                                        id,
-                                        bbox_left,  # MOT format
-                                        bbox_top,
-                                        bbox_w,
-                                        bbox_h,
-                                        -1,
-                                        -1,
-                                        -1,
-                                        -1,
-                                    )
-                                )
-
-                        if ret:
-                            bbox_left = output[0]
-                            bbox_top = output[1]
-                            bbox_w = output[2] - output[0]
-                            bbox_h = output[3] - output[1]
-                            out_array.append(
-                                (
-                                    frame_idx + 1,
-                                    cls,
-                                    id,
-                                    bbox_left,  # MOT format
-                                    bbox_top,
-                                    bbox_w,
-                                    bbox_h,
-                                )
-                            )
-
-                        if save_vid or save_crop or show_vid:  # Add bbox to image
-                            c = int(cls)  # integer class
-                            id = int(id)  # integer id
-                            label = (
-                                None
-                                if hide_labels
-                                else (
-                                    f"{id} {names[c]}"
-                                    if hide_conf
-                                    else (
-                                        f"{id} {conf:.2f}"
-                                        if hide_class
-                                        else f"{id} {names[c]} {conf:.2f}"
-                                    )
-                                )
-                            )
-                            annotator.box_label(bboxes, label, color=colors(c, True))
-
-                            if save_crop:
-                                txt_file_name = (
-                                    txt_file_name
-                                    if (isinstance(path, list) and len(path) > 1)
-                                    else ""
-                                )
-                                save_one_box(
-                                    bboxes,
-                                    imc,
-                                    file=save_dir
-                                    / "crops"
-                                    / txt_file_name
-                                    / names[c]
-                                    / f"{id}"
-                                    / f"{p.stem}.jpg",
-                                    BGR=True,
-                                )
-
                 LOGGER.info(
                     f"{s}Done. YOLO:({t3 - t2:.3f}s), StrongSORT:({t5 - t4:.3f}s)"
                 )
 
             else:
+                if cache_writer is not None:
+                    cache_writer.add(frame_idx, im0.shape)
                 strongsort_list[i].increment_ages()
+                outputs[i] = []
                 LOGGER.info("No detections")
 
+            # draw boxes for visualization
+            if len(outputs[i]) > 0:
+                for j, (output, conf) in enumerate(zip(outputs[i], confs)):
+                    bbox_w = output[2] - output[0]
+                    bbox_h = output[3] - output[1]
+
+                    if skip_big and bbox_w >= 200:
+                        # print("some object was too big, so ignored")
+                        continue
+
+                    bboxes = output[0:4]
+                    id = output[4]
+                    cls = output[5]
+                    bbox_left, bbox_top, bbox_right, bbox_bottom = bboxes
+
+                    if draw:
+                        # object trajectory
+                        center = (
+                            (int(bboxes[0]) + int(bboxes[2])) // 2,
+                            (int(bboxes[1]) + int(bboxes[3])) // 2,
+                        )
+                        if id not in trajectory:
+                            trajectory[id] = []
+                        trajectory[id].append(center)
+                        for i1 in range(1, len(trajectory[id])):
+                            if (
+                                trajectory[id][i1 - 1] is None
+                                or trajectory[id][i1] is None
+                            ):
+                                continue
+                            # thickness = int(np.sqrt(1000/float(i1+10))*0.3)
+                            thickness = 2
+                            try:
+                                cv2.line(
+                                    im0,
+                                    trajectory[id][i1 - 1],
+                                    trajectory[id][i1],
+                                    (0, 0, 255),
+                                    thickness,
+                                )
+                            except:
+                                pass
+
+                    if save_txt:
+                        # Write MOT compliant results to file
+                        with open(write_to, "a") as f:
+                            f.write(
+                                ("%g " * 11 + "\n")
+                                % (*mot_row(frame_idx, output), -1, -1, -1, -1)
+                            )
+
+                    if ret:
+                        out_array.append(mot_row(frame_idx, output))
+
+                    if save_vid or save_crop or show_vid:  # Add bbox to image
+                        c = int(cls)  # integer class
+                        id = int(id)  # integer id
+                        label = (
+                            None
+                            if hide_labels
+                            else (
+                                f"{id} {names[c]}"
+                                if hide_conf
+                                else (
+                                    f"{id} {conf:.2f}"
+                                    if hide_class
+                                    else f"{id} {names[c]} {conf:.2f}"
+                                )
+                            )
+                        )
+                        annotator.box_label(bboxes, label, color=colors(c, True))
+
+                        if save_crop:
+                            txt_file_name = (
+                                txt_file_name
+                                if (isinstance(path, list) and len(path) > 1)
+                                else ""
+                            )
+                            save_one_box(
+                                bboxes,
+                                imc,
+                                file=save_dir
+                                / "crops"
+                                / txt_file_name
+                                / names[c]
+                                / f"{id}"
+                                / f"{p.stem}.jpg",
+                                BGR=True,
+                            )
+
             if count:
                 itemDict = {}
                 ## NOTE: this works only if save-txt is true
@@ -528,7 +683,7 @@ def run(
             if save_vid:
                 if vid_path[i] != save_path:  # new video
                     vid_path[i] = save_path
-                    if isinstance(vid_writer[i], cv2.VideoWriter):
+                    if vid_writer[i] is not None:
                         vid_writer[i].release()  # release previous video writer
                     if vid_cap:  # video
                         fps = vid_cap.get(cv2.CAP_PROP_FPS)
@@ -539,9 +694,7 @@ def run(
                     save_path = str(
                         Path(save_path).with_suffix(".mp4")
                     )  # force *.mp4 suffix on results videos
-                    vid_writer[i] = cv2.VideoWriter(
-                        save_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h)
-                    )
+                    vid_writer[i] = VideoSink(save_path, fps, (w, h), **(encoding or {}))
                 vid_writer[i].write(im0)
 
             prev_frames[i] = curr_frames[i]
@@ -557,32 +710,64 @@ def run(
     # all = {executor.submit(runEverything, url, 60): url for url in URLS}
     all = {}
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+    # frames complete out of order, on_frame gets the running count
+    total_frames = 0 if webcam else getattr(dataset, "frames", 0)
+    tracked, tracked_lock = [0], threading.Lock()
+
+    def frame_done(_):
+        with tracked_lock:
+            tracked[0] += 1
+            done = tracked[0]
+        on_frame(done, max(total_frames, done))
+
+    # skipped frames need tracker updates in frame order, and so does a cache a
+    # replay has to reproduce the tracks from, so frames then run one at a time
+    skips = skips if not webcam else 1
+    in_order = skips > 1 or cache_writer is not None
+    last_detected, last_thumb = None, None  # last frame the detector ran on
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=1 if in_order else 5
+    ) as executor:
         for frame_idx, (path, im, im0s, vid_cap, s) in enumerate(dataset):
-            all[
-                executor.submit(
-                    runEverything,
-                    frame_idx,
-                    path,
-                    im,
-                    im0s,
-                    vid_cap,
-                    outputs,
-                    s,
-                    device,
-                    half,
-                    save_dir,
-                    visualize,
-                    augment,
-                    model,
-                    conf_thres,
-                    iou_thres,
-                    classes,
-                    agnostic_nms,
-                    max_det,
-                    write_to,
+            detect = True
+            if skips > 1:
+                thumb = motion_thumbnail(im0s) if skip_motion > 0 else None
+                detect = (
+                    last_detected is None
+                    or frame_idx - last_detected >= skips
+                    or (
+                        thumb is not None
+                        and np.abs(thumb - last_thumb).mean() > skip_motion
+                    )
                 )
-            ] = [frame_idx, path, im, im0s, vid_cap, s]
+                if detect:
+                    last_detected, last_thumb = frame_idx, thumb
+            future = executor.submit(
+                runEverything,
+                frame_idx,
+                path,
+                im,
+                im0s,
+                vid_cap,
+                outputs,
+                s,
+                device,
+                half,
+                save_dir,
+                visualize,
+                augment,
+                model,
+                conf_thres,
+                iou_thres,
+                classes,
+                agnostic_nms,
+                max_det,
+                write_to,
+                detect,
+            )
+            if on_frame is not None:
+                future.add_done_callback(frame_done)
+            all[future] = [frame_idx, path, im, im0s, vid_cap, s]
 
         dt, seen = [0.0, 0.0, 0.0, 0.0], 0
         for future in concurrent.futures.as_completed(all):
@@ -591,6 +776,14 @@ def run(
             dt += per_frame_dt
             seen += per_frame_seen
 
+    for writer in vid_writer:
+        if writer is not None:
+            writer.release()  # finish encoding of saved videos
+
+    if cache_writer is not None:
+        cache_writer.close()
+        LOGGER.info(f"Cached detections and features to {cache_writer.path}")
+
     # Print results
     t = tuple(x / seen * 1e3 for x in dt)  # speeds per image
     LOGGER.info(
@@ -624,6 +817,17 @@ def parse_opt():
     parser.add_argument(
         "--config-strongsort", type=str, default="strong_sort/configs/strong_sort.yaml"
     )
+    parser.add_argument(
+        "--reid-cache",
+        type=str,
+        default=None,
+        help="dir of cached detections + ReID features, replays association on a hit",
+    )
+    parser.add_argument(
+        "--from-detections",
+        action="store_true",
+        help="only re-run StrongSORT from --reid-cache, fail instead of running inference",
+    )
     parser.add_argument(
         "--source", type=str, default="0", help="file/dir/URL/glob, 0 for webcam"
     )
@@ -710,6 +914,15 @@ def parse_opt():
     parser.add_argument(
         "--dnn", action="store_true", help="use OpenCV DNN for ONNX inference"
     )
+    parser.add_argument(
+        "--skips", type=int, default=1, help="run the detector every N frames"
+    )
+    parser.add_argument(
+        "--skip-motion",
+        type=float,
+        default=0.0,
+        help="frame change (0-255) since the last detection that forces detection",
+    )
     opt = parser.parse_args()
     opt.imgsz *= 2 if len(opt.imgsz) == 1 else 1  # expand
     print_args(vars(opt))
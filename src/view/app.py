@@ -1,13 +1,10 @@
 import sys
 import os
-import io
-import ast
+import json
 import streamlit as st
 import hydralit_components as hc
 import pandas as pd
 import requests
-import zipfile
-import shutil
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from main import main
@@ -22,10 +19,8 @@ st.set_page_config(page_title="HoopTracker", page_icon=":basketball:")
 if "state" not in st.session_state:
     st.session_state.state = 0
     st.session_state.logo = "src/view/static/basketball.png"
-    with open("data/short_new_1.mp4", "rb") as file:
-        st.session_state.video_file = io.BytesIO(file.read())
-    st.session_state.processed_video = None
-    st.session_state.result_string = None
+    st.session_state.video_file = "data/short_new_1.mp4"
+    st.session_state.outputs = {}
     st.session_state.upload_name = None
     st.session_state.user_file = "tmp/user_upload.mp4"
 
@@ -33,23 +28,52 @@ if "state" not in st.session_state:
 SERVER_URL = "http://3.95.210.247:8000/"
 
 
-def process_video(video_file):
+@st.cache_resource
+def http():
+    "Session shared by all reruns, reusing connections to the backend"
+    return requests.Session()
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def fetch_results(upload_name, player=None, start=None, end=None):
     """
-    Takes in a mp4 file at video_file and uploads it to the backend, then stores
-    the processed video name into session state
-    Temporarily: stores the processed video into tmp/user_upload.mp4
+    Stats of upload_name from the backend, filtered by player and time in
+    seconds; fetched once per filter, raises requests.HTTPError
     """
+    params = {"player": player, "start": start, "end": end}
+    r = http().get(f"{SERVER_URL}results/{upload_name}", params=params, timeout=30)
+    r.raise_for_status()
+    return r.json()
+
+
+@st.cache_data(show_spinner=False)
+def read_video(path):
+    "Bytes of a local video, read once for all sessions"
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def video_url(upload_name, kind="processed"):
+    "URL the browser streams the processed or minimap video of upload_name from"
+    return f"{SERVER_URL}video/{upload_name}?kind={kind}"
 
-    # delete any unzipped files
-    shutil.rmtree("unzipped_files", ignore_errors=True)
 
+def process_video(video_file):
+    """
+    Takes in a mp4 file, or the path of one, at video_file and uploads it to the
+    backend, then stores the upload name and its outputs into session state
+    """
     user_video: str = st.session_state.user_file
     # UPLOAD VIDEO
     if video_file is None:
         return False
-    r = requests.post(
-        SERVER_URL + "upload", files={"video_file": video_file}, timeout=60
-    )
+    if isinstance(video_file, str):
+        with open(video_file, "rb") as file:
+            r = http().post(SERVER_URL + "upload", files={"video_file": file}, timeout=60)
+    else:
+        r = http().post(
+            SERVER_URL + "upload", files={"video_file": video_file}, timeout=60
+        )
     if r.status_code == 200:
         print("Successfully uploaded file")
         data = r.json()
@@ -66,19 +90,27 @@ def process_video(video_file):
     print("Upload Name", st.session_state.upload_name)
 
     # ASSUME process updates results locally for now TODO
-    r = requests.post(
+    r = http().post(
         SERVER_URL + "process", params={"file_name": st.session_state.upload_name}
     )
-    if r.status_code == 200:
+    if r.status_code in (200, 202):
         print(r.json().get("message"))
-        # with open("tmp/results.txt", "r") as file:
-        #     st.session_state.result_string = file.read()
-        # st.session_state.processed_video = "tmp/court_video_reenc.mp4"
-    else:
-        print(f"Error processing file: {r.text}")
-        return False
+        bar = st.progress(0.0, text="Queued")
+        partial = st.empty()
+        shown = set()
 
-    return download_results(st.session_state.upload_name)
+        def show(job):
+            st.session_state.outputs = job["outputs"]
+            stage = job["stage"] or job["status"]
+            bar.progress(min(job["progress"], 1.0), text=f"{stage.capitalize()}...")
+            # stats are stored before the videos render, show them meanwhile
+            if "stats" in job["outputs"] and "stats" not in shown:
+                shown.add("stats")
+                show_partial_stats(partial, st.session_state.upload_name)
+
+        return follow_job(r.json().get("job_id"), show)
+    print(f"Error processing file: {r.text}")
+    return False
 
 
 def upload(video_file):
@@ -114,39 +146,42 @@ def health_check():
     st.session_state.is_downloaded = False
 
 
-def download_results(upload_name):
-    r = requests.get(f"{SERVER_URL}download/{upload_name}")
-    if r.status_code == 200:
-        zip_file_path = "downloaded_files.zip"
-        with open(zip_file_path, "wb") as file:
-            file.write(r.content)
-
-        # unzip the files
-        unzip_dir = "unzipped_files"
-        os.makedirs(unzip_dir, exist_ok=True)
-
-        # unzip the files
-        with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
-            zip_ref.extractall(unzip_dir)
-
-        processed_video_path = os.path.join(
-            unzip_dir, f"court_video_reenc-{upload_name}.mp4"
-        )
-        result_string_path = os.path.join(unzip_dir, f"results-{upload_name}.txt")
-        st.session_state.result_string_path = result_string_path
-        with open(result_string_path, "r") as file:
-            st.session_state.result_string = file.read()
-        print(st.session_state.result_string)
-        st.session_state.processed_video = processed_video_path
-
-        # clean up temporary directory
-        if os.path.exists(zip_file_path):
-            os.remove(zip_file_path)
-
-        return True
-    else:
-        print(f"Error downloading file: {r.text}")
-        return False
+def follow_job(job_id, on_update=None):
+    """
+    Follows the progress events of a backend job until it ends, passing the
+    job to on_update on every change; returns whether it succeeded
+    """
+    # the server sends a heartbeat every 15 seconds, so reads never time out
+    with http().get(
+        f"{SERVER_URL}jobs/{job_id}/events", stream=True, timeout=(30, 60)
+    ) as r:
+        if r.status_code != 200:
+            print(f"Error following job: {r.text}")
+            return False
+        for line in r.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            job = json.loads(line[len("data:") :])
+            if on_update is not None:
+                on_update(job)
+            if job["status"] == "done":
+                return True
+            if job["status"] == "failed":
+                print(f"Error processing file: {job['error']}")
+                return False
+    print("Error following job: event stream closed")
+    return False
+
+
+def show_partial_stats(container, upload_name):
+    "Shows the team stats of upload_name in container while its videos render"
+    try:
+        results = fetch_results(upload_name)
+    except requests.RequestException:
+        return
+    with container.container():
+        st.markdown("#### Team stats so far")
+        st.dataframe(pd.DataFrame(results["team_stats"]))
 
 
 # Pages
@@ -204,116 +239,39 @@ def results_page():
         These are the results. Here's the processed video and a minimap of the player positions.
         """
     )
-    # st.video(open(st.session_state.processed_video, "rb").read())
-    # here we need to add the call for the videos
+    upload_name = st.session_state.upload_name
 
     st.markdown("## Statistics")
+    try:
+        results = fetch_results(upload_name)
+    except requests.RequestException as e:
+        st.error(f"Results not found: {e}")
+        results = None
+    if results is not None:
+        # filters are answered by the backend, every filter is fetched once
+        everyone = "All players"
+        col1, col2 = st.columns(2)
+        player = col1.selectbox("Player", [everyone] + list(results["player_stats"]))
+        duration = max(results["general_stats"]["duration"], 0.1)
+        start, end = col2.slider("Seconds", 0.0, duration, (0.0, duration))
+        if player != everyone or start > 0 or end < duration:
+            results = fetch_results(
+                upload_name, None if player == everyone else player, start, end
+            )
+        process_results(results)
+        st.download_button(
+            label="Download Results",
+            use_container_width=True,
+            data=json.dumps(results, indent=2),
+            file_name=f"results-{upload_name}.json",
+        )
 
-    # Adjusting the function to start parsing from the specific marker and display a sample output
-    def parse_file_for_correct_section(file_path, start_marker):
-        data = ""
-        recording = False
-        with open(file_path, "r") as file:
-            for line in file:
-                # Start recording when the start marker is found
-                if start_marker in line:
-                    recording = True
-                    data += line[
-                        line.find(start_marker) :
-                    ]  # Append from the start marker
-                    continue
-                # Continue recording after the start marker is found
-                if recording:
-                    data += line
-                    # Stop recording at the first closing brace '}' after recording starts
-                    if "}" in line and not "{" in line:
-                        break
-        return data
-
-    # Define the specific start marker
-    start_marker = "{'player_1': {'frames':"
-
-    # Parse the file for the specific section starting at the defined marker
-    parsed_correct_section = parse_file_for_correct_section(
-        st.session_state.result_string_path, start_marker
-    )
-
-    def extract_player_team_stats(data_str):
-        formatted_players = ""
-        formatted_team1 = ""
-        formatted_team2 = ""
-        current_team = None
-
-        lines = data_str.split(",")
-
-        for line in lines:
-            if "'team1'" in line:
-                current_team = "team1"
-            elif "'team2'" in line:
-                current_team = "team2"
-            if any(key in line for key in ["frames"]):
-                line = line.replace("{", "").replace("}", "").replace("'", "")
-                formatted_players += "\n" + line.strip() + "\n"
-            if any(
-                key in line
-                for key in [
-                    "field_goals_attempted",
-                    "field_goals",
-                    "points",
-                    "field_goal_percentage",
-                ]
-            ):
-                line = line.replace("{", "").replace("}", "").replace("'", "")
-                formatted_players += line.strip() + "\n"
-
-            elif any(
-                key in line
-                for key in [
-                    "shots_attempted",
-                    "shots_made",
-                    "points",
-                    "field_goal_percentage",
-                ]
-            ):
-                line = line.replace("{", "").replace("}", "").replace("'", "").strip()
-                if current_team == "team1":
-                    formatted_team1 += line + "\n"
-                elif current_team == "team2":
-                    formatted_team2 += line + "\n"
-        if "ball:" in formatted_players:
-            formatted_players = formatted_players.split("ball:")[0]
-
-        return formatted_players, formatted_team1, formatted_team2
-
-    formatted_players, formatted_team1, formatted_team2 = extract_player_team_stats(
-        parsed_correct_section
-    )
-
-    def display_stats():
-        st.markdown("### Player Statistics")
-        st.text(formatted_players)
-
-        st.markdown("### Team 1 Statistics")
-        st.text(formatted_team1)
-
-        st.markdown("### Team 2 Statistics")
-        st.text(formatted_team2)
-
-    # Call the function in your Streamlit app
-
-    # Call the function in your Streamlit app
-    display_stats()
+    # the browser streams the videos from the backend, with seeking
     st.markdown("## Processed Video")
-    try:
-        st.video(st.session_state.processed_video)
-    except Exception as e:
-        st.error("Processed video not found.")
-    st.download_button(
-        label="Download Results",
-        use_container_width=True,
-        data=st.session_state.result_string,
-        file_name=st.session_state.result_string_path,
-    )
+    st.video(video_url(upload_name))
+    if "minimap" in st.session_state.outputs:
+        st.markdown("## Minimap")
+        st.video(video_url(upload_name, "minimap"))
 
     st.button(label="Back to Home", on_click=change_state, args=(0,), type="primary")
 
@@ -347,22 +305,6 @@ def tips_page():
     st.button(label="Back to Home", on_click=change_state, args=(0,))
 
 
-# Get the results from tmp/results.txt
-def get_res():
-    file_path = "tmp/results.txt"
-    try:
-        with open(file_path, "r") as file:
-            result_string = file.read()
-        result_dict = ast.literal_eval(result_string)
-        return result_dict
-    except FileNotFoundError:
-        st.error(f"File not found: {file_path}")
-        return None
-    except Exception as e:
-        st.error(f"Error reading the file: {e}")
-        return None
-
-
 def results_api(video_file):
     if video_file is not None:
         r = requests.post(
@@ -402,7 +344,10 @@ def setup_sidebar():
 
     # Display video they uploaded
     st.sidebar.markdown("# Your video")
-    st.sidebar.video(data=st.session_state.video_file)
+    video_file = st.session_state.video_file
+    st.sidebar.video(
+        data=read_video(video_file) if isinstance(video_file, str) else video_file
+    )
 
     # Process options to move to next state
     col1, col2 = st.sidebar.columns([1, 17])
@@ -441,84 +386,22 @@ def update_video(video_file):
     st.session_state.video_file = video_file
 
 
-def process_results():
+def process_results(results):
     """
-    Processes st.session_state.result_string to display results
+    Shows stats of results, as returned by the backend /results
     """
-    # TODO revamp results processing
-    # # Parse the result string into a dictionary
-    # result_dict = ast.literal_eval(st.session_state.result_string)
-
-    # # Create dataframes for each category
-    # general_df = pd.DataFrame(
-    #     {
-    #         "Number of frames": [result_dict["Number of frames"]],
-    #         "Number of players": [result_dict["Number of players"]],
-    #         "Number of passes": [result_dict["Number of passes"]],
-    #     }
-    # )
-
-    # team_df = pd.DataFrame(
-    #     {
-    #         "Team 1": [
-    #             result_dict["Team 1"],
-    #             result_dict["Team 1 Score"],
-    #             result_dict["Team 1 Possession"],
-    #         ],
-    #         "Team 2": [
-    #             result_dict["Team 2"],
-    #             result_dict["Team 2 Score"],
-    #             result_dict["Team 2 Possession"],
-    #         ],
-    #     },
-    #     index=["Players", "Score", "Possession"],
-    # )
-
-    # coordinates_df = pd.DataFrame(
-    #     {
-    #         "Rim coordinates": [result_dict["Rim coordinates"]],
-    #         "Backboard coordinates": [result_dict["Backboard coordinates"]],
-    #         "Court lines coordinates": [result_dict["Court lines coordinates"]],
-    #     }
-    # )
-
-    # # Create a dictionary for players data
-    # players_dict = {
-    #     key: value
-    #     for key, value in result_dict.items()
-    #     if key not in general_df.columns
-    #     and key not in team_df.columns
-    #     and key not in coordinates_df.columns
-    # }
-    # # Remove team score and possession details from players dictionary
-    # team_keys = [
-    #     "Team 1 Score",
-    #     "Team 2 Score",
-    #     "Team 1 Possession",
-    #     "Team 2 Possession",
-    # ]
-    # players_dict = {
-    #     key: value for key, value in players_dict.items() if key not in team_keys
-    # }
-
-    # # Convert player statistics from string to dictionary
-    # for player, stats in players_dict.items():
-    #     players_dict[player] = ast.literal_eval(stats)
-
-    # players_df = pd.DataFrame(players_dict).T
-
-    # # Display dataframes
-    # st.write("### General")
-    # st.dataframe(general_df)
-
-    # st.write("### Team")
-    # st.dataframe(team_df)
-
-    # st.write("### Players")
-    # st.dataframe(players_df)
-
-    # st.write("### Coordinates")
-    # st.dataframe(coordinates_df)
+    st.write("### General")
+    st.dataframe(pd.DataFrame([results["general_stats"]]))
+
+    st.write("### Team")
+    st.dataframe(pd.DataFrame(results["team_stats"]))
+
+    st.write("### Players")
+    st.dataframe(pd.DataFrame(results["player_stats"]).T)
+
+    if results["shots"]:
+        st.write("### Shots")
+        st.dataframe(pd.DataFrame(results["shots"]))
 
 
 # Entry Point
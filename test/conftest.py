@@ -0,0 +1,12 @@
+"""
+Runs tests from the project root, where config.yaml is, with src importable
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+os.chdir(ROOT)
@@ -0,0 +1,79 @@
+"""
+Endpoints of the backend serving outputs of processed files from storage
+"""
+import importlib
+import io
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("torch")  # state imports pose_estimation
+
+from fastapi.testclient import TestClient
+
+from state import Trajectories
+
+
+@pytest.fixture(scope="module")
+def backend(tmp_path_factory):
+    "backend module on a local storage directory"
+    root = tmp_path_factory.mktemp("storage")
+    previous = os.environ.get("HOOPTRACKER_STORAGE")
+    os.environ["HOOPTRACKER_STORAGE"] = str(root)
+    module = importlib.import_module("api.backend")
+    module.DARGS["api_job_dir"] = str(tmp_path_factory.mktemp("jobs"))
+    yield module
+    module.jobs.shutdown()
+    if previous is None:
+        os.environ.pop("HOOPTRACKER_STORAGE")
+    else:
+        os.environ["HOOPTRACKER_STORAGE"] = previous
+
+
+def test_trajectories(backend, tmp_path):
+    positions = np.full((3, 2, 2), np.nan, dtype=np.float32)
+    positions[0, 0] = (1.0, 2.5)
+    positions[2, 1] = (-3.25, 4.0)
+    ball = np.array([[0.5, 0.5], [np.nan, np.nan], [1.0, 7.0]], dtype=np.float32)
+    trajectories = Trajectories(
+        np.arange(3), ["player_1", "player_2"], positions, positions[..., 0], ball, 0.75
+    )
+    path = str(tmp_path / "trajectories.npz")
+    trajectories.save(path)
+    backend.store.upload_file(path, "cache/result/x/trajectories.npz")
+    backend.cache.link("game", {"trajectories": "cache/result/x/trajectories.npz"})
+
+    client = TestClient(backend.app)
+    response = client.get("/trajectories/game")
+    assert response.status_code == 200
+    assert response.json() == trajectories.todict()
+    assert response.json()["players"]["player_2"] == [[2, -3.25, 4.0]]
+    assert client.get("/trajectories/unknown").status_code == 404
+
+
+def test_video_ranges(backend):
+    video = bytes(range(256)) * 4
+    backend.store.upload_fileobj(io.BytesIO(video), "cache/result/y/processed.mp4")
+    backend.cache.link("clip", {"video": "cache/result/y/processed.mp4"})
+    client = TestClient(backend.app)
+
+    whole = client.get("/video/clip")
+    assert whole.status_code == 200 and whole.content == video
+    part = client.get("/video/clip", headers={"Range": "bytes=10-19"})
+    assert part.status_code == 206 and part.content == video[10:20]
+    assert part.headers["content-range"] == f"bytes 10-19/{len(video)}"
+    tail = client.get("/video/clip", headers={"Range": "bytes=-24"})
+    assert tail.status_code == 206 and tail.content == video[-24:]
+    outside = client.get("/video/clip", headers={"Range": f"bytes={len(video)}-"})
+    assert outside.status_code == 416
+    assert outside.headers["content-range"] == f"bytes */{len(video)}"
+
+
+def test_file_names_stay_in_storage(backend):
+    client = TestClient(backend.app)
+    for file_name in ("../secret", "a/../../b", "..", "a.b"):
+        assert client.post("/process", params={"file_name": file_name}).status_code == 400
+    assert client.get("/download/..%2Fsecret").status_code in (400, 404)
+    assert client.get("/results/a.b").status_code == 400
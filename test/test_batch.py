@@ -0,0 +1,167 @@
+"""
+Checkpoints and resumes of batch processing, with a stub pipeline
+"""
+import copy
+import json
+import os
+import sys
+import types
+
+import pytest
+
+import batch
+from args import DARGS
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """
+    stub main finishing the model and stats stages, with the args of every
+    call; set interrupt to raise after the model stage
+    """
+    calls = []
+    stub = types.SimpleNamespace(interrupt=False)
+
+    def main(args, progress=None, models=None):
+        calls.append(dict(args))
+        for stage in ("model", "stats"):
+            progress.start(stage)
+            progress.finish(stage)
+            if stub.interrupt:
+                raise RuntimeError("interrupted")
+
+    stub.main = main
+    monkeypatch.setitem(sys.modules, "main", stub)
+    monkeypatch.setattr(batch, "_WORKER", {"job_cpus": 1, "models": None})
+    return calls, stub
+
+
+@pytest.fixture
+def args():
+    return copy.deepcopy(DARGS)
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "videos" / "game.mp4"
+    path.parent.mkdir()
+    path.write_bytes(b"not really a video")
+    return str(path)
+
+
+def _checkpoint(output: str) -> dict:
+    with open(os.path.join(output, batch.CHECKPOINT)) as f:
+        return json.load(f)
+
+
+def test_done_video_is_skipped(pipeline, args, video, tmp_path):
+    calls, _ = pipeline
+    output = str(tmp_path / "out")
+    report = batch._process(video, output, args)
+    assert report["status"] == "done" and set(report["stages"]) == {"model", "stats"}
+    assert _checkpoint(output)["done"]
+    assert _checkpoint(output)["stages"] == ["model", "stats"]
+
+    assert batch._process(video, output, args)["status"] == "skipped"
+    assert len(calls) == 1
+
+
+def test_interrupted_video_resumes(pipeline, args, video, tmp_path):
+    calls, stub = pipeline
+    output = str(tmp_path / "out")
+    stub.interrupt = True
+    with pytest.raises(RuntimeError):
+        batch._process(video, output, args)
+    checkpoint = _checkpoint(output)
+    assert checkpoint["stages"] == ["model"] and not checkpoint["done"]
+
+    stub.interrupt = False
+    assert batch._process(video, output, args)["status"] == "resumed"
+    assert calls[-1]["skip_model"] is True
+    assert _checkpoint(output)["done"]
+
+
+def test_process_settings_change_resumes(pipeline, args, video, tmp_path):
+    calls, _ = pipeline
+    output = str(tmp_path / "out")
+    batch._process(video, output, args)
+    args["shot_window"] += 1
+    # the model outputs still hold, only processing is redone
+    assert batch._process(video, output, args)["status"] == "resumed"
+    assert calls[-1]["skip_model"] is True
+
+
+def test_model_settings_change_redoes(pipeline, args, video, tmp_path):
+    calls, _ = pipeline
+    output = str(tmp_path / "out")
+    batch._process(video, output, args)
+    args["frame_reduction_factor"] += 1
+    assert batch._process(video, output, args)["status"] == "done"
+    assert calls[-1]["skip_model"] is False
+
+
+def test_changed_video_is_redone(pipeline, args, video, tmp_path):
+    calls, _ = pipeline
+    output = str(tmp_path / "out")
+    batch._process(video, output, args)
+    with open(video, "ab") as f:
+        f.write(b" with more frames")
+    assert batch._process(video, output, args)["status"] == "done"
+
+    stat = os.stat(video)
+    os.utime(video, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert batch._process(video, output, args)["status"] == "done"
+    assert [call["skip_model"] for call in calls] == [False, False, False]
+    assert batch._process(video, output, args)["status"] == "skipped"
+
+
+def test_output_dirs(tmp_path):
+    root = str(tmp_path / "out")
+    assert batch.output_dirs([], root) == []
+    assert batch.output_dirs(["a/game.mp4"], root) == [os.path.join(root, "game.mp4")]
+    videos = ["s/a/b_c.mp4", "s/a_b/c.mp4", "s/a/game.mp4", "s/a/game.mov"]
+    names = [os.path.basename(d) for d in batch.output_dirs(videos, root)]
+    assert names == ["a_b_c.mp4", "a_b_c.mp4_2", "a_game.mp4", "a_game.mov"]
+    # a listed name never takes the place of a renamed one
+    names = batch.output_dirs(["s/a/b_c.mp4", "s/a_b/c.mp4", "s/a_b_c.mp4_2"], root)
+    assert len(set(names)) == 3
+
+
+def test_find_videos(tmp_path):
+    for name in ("b.mp4", "a.MOV", "notes.txt", "sub/c.avi"):
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).write_bytes(b"")
+    found = batch.find_videos(str(tmp_path))
+    assert found == [str(tmp_path / n) for n in ("a.MOV", "b.mp4", "sub/c.avi")]
+
+    manifest = tmp_path / "lists" / "season.txt"
+    manifest.parent.mkdir()
+    manifest.write_text(
+        "# home games\n"
+        "game1.mp4\n"
+        "\n"
+        "  ../b.mp4  # relative to the manifest\n"
+        f"{tmp_path / 'sub' / 'c.avi'}\n"
+    )
+    assert batch.find_videos(str(manifest)) == [
+        str(tmp_path / "lists" / "game1.mp4"),
+        str(tmp_path / "lists" / ".." / "b.mp4"),
+        str(tmp_path / "sub" / "c.avi"),
+    ]
+
+
+def test_run_batch(pipeline, args, video, tmp_path):
+    output = str(tmp_path / "out")
+    missing = str(tmp_path / "videos" / "missing.mp4")
+    videos = [video, missing]
+    batch._process(video, batch.output_dirs(videos, output)[0], args)
+
+    # spawned workers skip the finished video and fail on the missing one
+    report = batch.run_batch(videos, output, args, workers=2, job_cpus=1, warm=False)
+    assert (report["videos"], report["skipped"], report["failed"]) == (2, 1, 1)
+    assert report["done"] == report["resumed"] == 0
+    failed = [r for r in report["reports"] if r["status"] == "failed"]
+    assert failed[0]["video"] == missing
+    assert failed[0]["error"].startswith("FileNotFoundError")
+    with open(os.path.join(output, batch.REPORT)) as f:
+        assert json.load(f)["skipped"] == 1
@@ -0,0 +1,109 @@
+"""
+Color binning and the staged homography search of court detection, on data/ frames
+"""
+import cv2 as cv
+import numpy as np
+import pytest
+
+from processing.court import Render
+
+VIDEOS = ["data/benson.mp4", "data/short_new_1.mp4"]
+
+
+def _first_frame(video: str) -> np.ndarray:
+    cap = cv.VideoCapture(video)
+    ok, frame = cap.read()
+    cap.release()
+    assert ok, f"could not read {video}"
+    return frame
+
+
+def _loop_bins(render: Render, img: np.ndarray, one_bins: int, two_bins: int):
+    "(one, two) -> value of every bin, binned pixel by pixel as before vectorizing"
+    weights = np.zeros((img.shape[0], img.shape[1]))
+    for row in range(weights.shape[0]):
+        weights[row] = np.full(weights.shape[1], row)
+    for col in range(weights.shape[1]):
+        col_weight = np.full(weights.shape[0], min(col + 1, weights.shape[1] - col))
+        weights[:, col] = np.minimum(weights[:, col], col_weight)
+    weights = weights / np.sum(weights)
+
+    bins = np.zeros((one_bins, two_bins))
+    one_step = render._one_max / one_bins
+    two_step = render._two_max / two_bins
+    for row in range(img.shape[0]):
+        for col in range(img.shape[1]):
+            pix = img[row, col]
+            bins[
+                int(pix[render._index[0]] / one_step),
+                int(pix[render._index[1]] / two_step),
+            ] += weights[row, col]
+    return bins
+
+
+def _bounds(bin) -> tuple:
+    return bin.one_lower, bin.one_upper, bin.two_lower, bin.two_upper
+
+
+@pytest.mark.parametrize("video", VIDEOS)
+def test_bin_pixels_matches_loop(video):
+    # a sixth of the size keeps the pixel loop fast
+    frame = cv.resize(_first_frame(video), (320, 180), interpolation=cv.INTER_AREA)
+    render = Render(video, frame=frame, detect=False)
+    bins = render._bin_pixels(render._COURT_IMG, one_bins=18, two_bins=10)
+
+    expected = _loop_bins(render, render._COURT_IMG, 18, 10)
+    kept = expected[expected > render._BINNING_THRESHOLD]
+    assert len(bins) == len(kept)
+    np.testing.assert_allclose([b.value for b in bins], sorted(kept, reverse=True))
+    top = np.unravel_index(np.argmax(expected), expected.shape)
+    one_step, two_step = render._one_max / 18, render._two_max / 10
+    assert _bounds(bins[0]) == (
+        int(round(one_step * top[0])),
+        int(round(one_step * (top[0] + 1))),
+        int(round(two_step * top[1])),
+        int(round(two_step * (top[1] + 1))),
+    )
+
+
+def test_bin_pixels_downscale():
+    frame = _first_frame(VIDEOS[0])
+    render = Render(VIDEOS[0], frame=frame, detect=False)
+    full = render._bin_pixels(render._COURT_IMG, one_bins=18, two_bins=10)
+    strided = render._bin_pixels(render._COURT_IMG, 18, 10, downscale=4)
+    assert _bounds(strided[0]) == _bounds(full[0])
+    assert abs(strided[0].value - full[0].value) < 0.005
+
+
+def _candidates(render: Render, lines_per_side: int):
+    "candidate boxes of the strongest hough lines of each side of the court"
+    render._COURT_BIN = render.get_court_bin()
+    masked, thick = render._court_edges(
+        render._BGR_COURT, render._COURT_IMG, render._COURT_BIN
+    )
+    render._set_court_edges(thick)
+    lines = render._get_hough(masked, threshold=180)  # strongest first
+    hor = lines[lines[:, 0, 1] <= np.pi / 2][:lines_per_side]
+    ver = lines[lines[:, 0, 1] > np.pi / 2][:lines_per_side]
+    hor = np.array(sorted(hor, key=lambda x: x[0][0]))
+    ver = np.array(sorted(ver, key=lambda x: x[0][0]))
+    pts = render._line_intersections(hor[:, 0], ver[:, 0])
+    boxes, _ = render._candidate_boxes(pts, 0)
+    return boxes
+
+
+@pytest.mark.parametrize("video, lines_per_side", [(VIDEOS[0], 40), (VIDEOS[1], 60)])
+def test_staged_search_finds_best_box(video, lines_per_side):
+    render = Render(video, frame=_first_frame(video), detect=False, workers=1)
+    boxes = _candidates(render, lines_per_side)
+    # enough candidates for every stage to prune
+    assert len(boxes) > render._SEARCH_STAGES[0][1]
+
+    staged = render._best_candidate(boxes)
+    render._SEARCH_STAGES = ()
+    exhaustive = render._best_candidate(boxes)
+    assert staged is not None and exhaustive is not None
+    goodness = render._evaluate_homography(staged, render._BOX_BOUNDS)
+    best = render._evaluate_homography(exhaustive, render._BOX_BOUNDS)
+    assert goodness >= 0.95 * best
+    assert np.abs(np.array(staged) - np.array(exhaustive)).max() < 20
@@ -0,0 +1,122 @@
+"""
+Round trips of the detection and ReID feature cache of StrongSORT replays
+"""
+import importlib.util
+import json
+import os
+import random
+import threading
+
+import numpy as np
+import pytest
+
+from conftest import SRC
+
+# loaded from its file, the strong_sort package imports torch and the tracker
+_SPEC = importlib.util.spec_from_file_location(
+    "feature_cache",
+    os.path.join(SRC, "strongsort", "strong_sort", "utils", "feature_cache.py"),
+)
+feature_cache = importlib.util.module_from_spec(_SPEC)
+_SPEC.loader.exec_module(feature_cache)
+
+SHAPE = (720, 1280, 3)
+DIM = 8
+
+
+def _frame_rows(frame_idx: int):
+    "detections of a frame: none on every 4th frame, else frame_idx % 3 + 1 rows"
+    n = 0 if frame_idx % 4 == 0 else frame_idx % 3 + 1
+    rng = np.random.default_rng(frame_idx)
+    xywhs = rng.uniform(0, 500, (n, 4)).astype(np.float32)
+    confs = rng.uniform(0.3, 1, n).astype(np.float32)
+    clss = (np.arange(n) % 3).astype(np.float32)
+    features = rng.normal(size=(n, DIM)).astype(np.float32)
+    return xywhs, confs, clss, features
+
+
+@pytest.fixture
+def written(tmp_path):
+    "cache of 20 frames added out of order from 4 threads, frame 6 and 7 skipped"
+    path = tmp_path / "entry"
+    writer = feature_cache.FeatureCacheWriter(path)
+    frames = [i for i in range(20) if i not in (6, 7)]
+    random.Random(0).shuffle(frames)
+
+    def add(part):
+        for i in part:
+            rows = _frame_rows(i)
+            if len(rows[0]):
+                writer.add(i, SHAPE, *rows)
+            else:
+                writer.add(i, SHAPE)
+
+    threads = [threading.Thread(target=add, args=(frames[k::4],)) for k in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.skip(6, SHAPE)
+    writer.skip(7, SHAPE)
+    writer.close()
+    return path
+
+
+def test_round_trip(written):
+    assert feature_cache.FeatureCache.exists(written)
+    cache = feature_cache.FeatureCache(written)
+    assert len(cache) == 20 and cache.shape == SHAPE[:2]
+    assert cache.skipped.tolist() == [i in (6, 7) for i in range(20)]
+    for i in range(20):
+        xywhs, confs, clss, features = cache.frame(i)
+        expected = _frame_rows(i) if i not in (6, 7) else _frame_rows(0)
+        for got, want in zip((xywhs, confs, clss, features), expected):
+            np.testing.assert_array_equal(got, want)
+
+
+def test_class_filter(written):
+    cache = feature_cache.FeatureCache(written)
+    xywhs, confs, clss, features = cache.frame(5, classes=[1])
+    all_rows = _frame_rows(5)
+    keep = all_rows[2] == 1
+    assert len(clss) == keep.sum() and (clss == 1).all()
+    np.testing.assert_array_equal(features, all_rows[3][keep])
+
+
+def test_version_mismatch(written, monkeypatch):
+    monkeypatch.setattr(feature_cache, "CACHE_VERSION", feature_cache.CACHE_VERSION + 1)
+    assert not feature_cache.FeatureCache.exists(written)
+
+
+def test_incomplete_entries(written, tmp_path):
+    assert not feature_cache.FeatureCache.exists(tmp_path / "missing")
+    # an entry being written is in a .tmp directory until close
+    writer = feature_cache.FeatureCacheWriter(tmp_path / "other")
+    writer.add(0, SHAPE, *_frame_rows(1))
+    assert not feature_cache.FeatureCache.exists(tmp_path / "other")
+    with open(written / "meta.json", "w") as f:
+        f.write("{")
+    assert not feature_cache.FeatureCache.exists(written)
+
+
+def test_empty_cache(tmp_path):
+    writer = feature_cache.FeatureCacheWriter(tmp_path / "entry")
+    writer.add(0, SHAPE)
+    writer.add(1, SHAPE)
+    writer.close()
+    cache = feature_cache.FeatureCache(tmp_path / "entry")
+    assert len(cache) == 2
+    assert all(len(part) == 0 for part in cache.frame(1))
+    with open(tmp_path / "entry" / "meta.json") as f:
+        assert json.load(f)["dim"] == 0
+
+
+def test_cache_key(tmp_path):
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"video")
+    key = feature_cache.cache_key(video, "best.pt", "osnet.pt", conf_thres=0.25)
+    assert key == feature_cache.cache_key(video, "best.pt", "osnet.pt", conf_thres=0.25)
+    assert key != feature_cache.cache_key(video, "best.pt", "osnet.pt", conf_thres=0.5)
+    assert key != feature_cache.cache_key(video, "other.pt", "osnet.pt", conf_thres=0.25)
+    video.write_bytes(b"another video")
+    assert key != feature_cache.cache_key(video, "best.pt", "osnet.pt", conf_thres=0.25)
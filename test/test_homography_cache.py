@@ -0,0 +1,165 @@
+"""
+Hits, rejected hits and misses of the court homography cache, on synthetic courts
+"""
+import json
+import threading
+import types
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+from processing import homography_cache
+from processing.homography_cache import HomographyCache
+
+TO_FRAME = np.array([[0.45, 0.05, 60], [0.0, 0.4, 40], [0, 0, 1.0]])
+"maps the truth map onto the court of the clips"
+HOMOGRAPHY = np.linalg.inv(TO_FRAME)
+MOVED = np.linalg.inv(np.array([[1, 0, 25], [0, 1, 15], [0, 0, 1.0]]) @ TO_FRAME)
+"homography of the camera moved 25 pixels right and 15 down"
+
+
+def _court_clip(path, size=(640, 480), frames: int = 21) -> str:
+    "MJPG clip of the truth map lines on a wooden court, with a player walking by"
+    truth = cv.imread("data/true_map.png", cv.IMREAD_GRAYSCALE)
+    lines = np.where(truth < 128, 255, 0).astype(np.uint8)
+    lines = cv.warpPerspective(lines, TO_FRAME, size)
+    court = np.zeros((size[1], size[0], 3), np.uint8)
+    court[:] = (60, 120, 200)
+    court[lines > 0] = (235, 235, 235)
+    rng = np.random.default_rng(0)
+    writer = cv.VideoWriter(str(path), cv.VideoWriter_fourcc(*"MJPG"), 10, size)
+    for i in range(frames):
+        frame = court + rng.integers(-6, 7, court.shape)
+        frame = np.clip(frame, 0, 255).astype(np.uint8)
+        cv.rectangle(frame, (100 + 20 * i, 200), (140 + 20 * i, 300), (40, 40, 40), -1)
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+
+@pytest.fixture
+def clip(tmp_path):
+    return _court_clip(tmp_path / "game.avi")
+
+
+def _entries(cache: HomographyCache) -> list:
+    with open(cache.path / "homographies.json") as f:
+        return json.load(f)["entries"]
+
+
+def test_miss_then_hit(clip, tmp_path):
+    cache = HomographyCache(tmp_path / "cache")
+    assert cache.get(clip) is None
+    cache.put(clip, HOMOGRAPHY)
+    assert _entries(cache)[0]["goodness"] > 0.9
+    np.testing.assert_allclose(cache.get(clip), HOMOGRAPHY)
+    # another game of the same camera
+    other = _court_clip(tmp_path / "other.avi", frames=30)
+    np.testing.assert_allclose(cache.get(other), HOMOGRAPHY)
+
+
+def test_other_resolution_misses(clip, tmp_path):
+    cache = HomographyCache(tmp_path / "cache")
+    cache.put(clip, HOMOGRAPHY)
+    assert cache.get(_court_clip(tmp_path / "small.avi", size=(480, 360))) is None
+
+
+def test_moved_camera_is_rejected(clip, tmp_path):
+    cache = HomographyCache(tmp_path / "cache")
+    cache.put(clip, HOMOGRAPHY)
+    entries = _entries(cache)
+    entries[0]["homography"] = MOVED.tolist()
+    cache._write(entries)
+    key = homography_cache.fingerprint(homography_cache.first_frames(clip))
+    assert cache.lookup(key) is not None
+    assert cache.get(clip) is None
+
+
+def test_put_replaces_same_camera(clip, tmp_path):
+    cache = HomographyCache(tmp_path / "cache")
+    cache.put(clip, MOVED)
+    cache.put(clip, HOMOGRAPHY)
+    assert len(_entries(cache)) == 1
+    np.testing.assert_allclose(cache.get(clip), HOMOGRAPHY)
+
+
+def test_puts_of_other_runs_are_kept(clip, tmp_path, monkeypatch):
+    cache = HomographyCache(tmp_path / "cache")
+    small = _court_clip(tmp_path / "small.avi", size=(480, 360))
+    Render = homography_cache.Render
+
+    class Interleaved(Render):
+        "another run puts its camera while this one scores its homography"
+
+        def get_court_bin(self):
+            if self._VIDEO_PATH == clip:
+                HomographyCache(tmp_path / "cache").put(small, HOMOGRAPHY)
+            return super().get_court_bin()
+
+    monkeypatch.setattr(homography_cache, "Render", Interleaved)
+    cache.put(clip, HOMOGRAPHY)
+    assert sorted(e["video"] for e in _entries(cache)) == ["game.avi", "small.avi"]
+
+
+def test_concurrent_puts(clip, tmp_path):
+    small = _court_clip(tmp_path / "small.avi", size=(480, 360))
+    threads = [
+        threading.Thread(
+            target=HomographyCache(tmp_path / "cache").put, args=(video, HOMOGRAPHY)
+        )
+        for video in (clip, small) * 3
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(_entries(HomographyCache(tmp_path / "cache"))) == 2
+
+
+def test_miss_falls_back_to_detection(clip, tmp_path, monkeypatch):
+    pytest.importorskip("torch")  # state imports pose_estimation
+    pytest.importorskip("sklearn")  # processing.team clusters players
+    import processrunner
+    from processing import court
+
+    detected = []
+
+    class Detection:
+        "court.Render detecting the homography of the clips"
+
+        def __init__(self, video_path, **kwargs):
+            detected.append(video_path)
+
+        def get_homography(self):
+            return HOMOGRAPHY
+
+    monkeypatch.setattr(court, "Render", Detection)
+    trajectories = types.SimpleNamespace(save=lambda path: None, reliable=lambda: True)
+    monkeypatch.setattr(processrunner.trajectory, "compute", lambda *a: trajectories)
+    args = {
+        "skip_court": False,
+        "court_cache": str(tmp_path / "cache"),
+        "court_check_interval": 0,
+        "video_file": clip,
+        "video_workers": 1,
+        "trajectory_file": str(tmp_path / "trajectories.npz"),
+    }
+
+    def run():
+        runner = processrunner.ProcessRunner(args)
+        runner.run_courtline_detect()
+        return runner.homography
+
+    np.testing.assert_allclose(run(), HOMOGRAPHY)
+    assert detected == [clip]
+    np.testing.assert_allclose(run(), HOMOGRAPHY)
+    assert detected == [clip]  # a verified hit skips detection
+
+    cache = HomographyCache(args["court_cache"])
+    entries = _entries(cache)
+    entries[0]["homography"] = MOVED.tolist()
+    cache._write(entries)
+    np.testing.assert_allclose(run(), HOMOGRAPHY)
+    assert detected == [clip, clip]
+    np.testing.assert_allclose(cache.get(clip), HOMOGRAPHY)  # detection replaced it
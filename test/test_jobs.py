@@ -0,0 +1,183 @@
+"""
+Job queue of the backend on a local storage directory, with a stub pipeline
+"""
+import asyncio
+import io
+import os
+import queue
+import sys
+import time
+import types
+
+import pytest
+
+from api import jobs, storage
+from api.result_cache import ResultCache, fingerprints
+from args import DARGS
+
+VIDEO = b"not really a video"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    "LocalStorage of HOOPTRACKER_STORAGE, which job workers open too"
+    monkeypatch.setenv("HOOPTRACKER_STORAGE", str(tmp_path / "storage"))
+    return storage.get_storage()
+
+
+def _upload(store, file_name: str) -> str:
+    sha256 = store.upload_fileobj(io.BytesIO(VIDEO), file_name + ".mp4")
+    ResultCache(store).set_input(file_name, sha256)
+    return sha256
+
+
+def _wait(manager, job, timeout: float = 60):
+    "job once it is done or failed"
+    deadline = time.time() + timeout
+    while job.status not in (jobs.DONE, jobs.FAILED):
+        assert time.time() < deadline, f"job still {job.status}"
+        time.sleep(0.05)
+    return job
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    "stub main writing every output of a run, with the args of every call"
+    calls = []
+
+    def main(args, progress=None, models=None):
+        calls.append(dict(args))
+        for key in ("people_file", "ball_file", "pose_file"):
+            if not args["skip_model"]:
+                with open(args[key], "w") as f:
+                    f.write(key)
+        with open(args["stats_file"], "w") as f:
+            f.write("stats")
+        progress.finish("stats")
+        for key in ("results_file", "snapshot_file", "processed_file"):
+            with open(args[key], "w") as f:
+                f.write(key)
+
+    monkeypatch.setitem(sys.modules, "main", types.SimpleNamespace(main=main))
+    events = queue.Queue()
+    monkeypatch.setattr(jobs, "_WORKER", {"events": events, "job_cpus": 1, "models": None})
+    return calls, events
+
+
+def _drain(events: queue.Queue) -> list:
+    items = []
+    while not events.empty():
+        items.append(events.get())
+    return items
+
+
+def test_run_job_caches_outputs(store, pipeline, tmp_path, monkeypatch):
+    calls, events = pipeline
+    sha256 = _upload(store, "first")
+    job_dir = str(tmp_path / "jobs" / "a")
+    outputs = jobs._run_job("a", "first", job_dir)
+
+    assert len(calls) == 1 and calls[0]["skip_model"] is False
+    assert set(outputs) == {"results", "video", "stats", "snapshot"}
+    assert all(store.exists(key) for key in outputs.values())
+    cache = ResultCache(store)
+    assert cache.outputs("first") == outputs
+    assert cache.lookup_result(sha256, fingerprints(DARGS)[1]) == outputs
+    assert not os.path.exists(job_dir)
+    kinds = [(kind, payload) for _, kind, payload in _drain(events)]
+    assert kinds[0] == (jobs.RUNNING, None)
+    assert ("outputs", {"stats": "jobs/a/stats.db"}) in kinds
+
+    # the same video uploaded again is answered from the cache
+    _upload(store, "second")
+    assert jobs._run_job("b", "second", str(tmp_path / "jobs" / "b")) == outputs
+    assert len(calls) == 1
+
+    # new processing settings rerun processing on the cached model outputs
+    monkeypatch.setitem(DARGS, "shot_window", DARGS["shot_window"] + 1)
+    changed = jobs._run_job("c", "second", str(tmp_path / "jobs" / "c"))
+    assert len(calls) == 2 and calls[1]["skip_model"] is True
+    assert changed != outputs
+    assert ResultCache(store).outputs("second") == changed
+
+
+def test_run_job_missing_video(store, pipeline, tmp_path):
+    job_dir = str(tmp_path / "jobs" / "a")
+    with pytest.raises(FileNotFoundError):
+        jobs._run_job("a", "missing", job_dir)
+    assert not os.path.exists(job_dir)
+    assert pipeline[0] == []
+
+
+@pytest.fixture
+def manager(store, tmp_path):
+    manager = jobs.JobManager(workers=1, job_root=str(tmp_path / "jobs"), warm=False)
+    yield manager
+    manager.shutdown()
+
+
+def test_failed_job(manager):
+    job = _wait(manager, manager.submit("missing"))
+    assert job.status == jobs.FAILED
+    assert job.error.startswith("FileNotFoundError")
+    assert job.finished is not None
+
+
+def test_job_answered_by_worker_from_cache(manager, store, tmp_path):
+    sha256 = _upload(store, "video")
+    outputs = {"results": "cache/result/x/results.txt"}
+    ResultCache(store)._write_json(
+        f"cache/result/{sha256}-{fingerprints(DARGS)[1]}/manifest.json", outputs
+    )
+    job = _wait(manager, manager.submit("video"))
+    assert job.status == jobs.DONE, job.error
+    assert job.outputs == outputs and job.progress == 1.0
+    assert job.started is not None
+    assert ResultCache(store).outputs("video") == outputs
+    assert not os.path.exists(os.path.join(tmp_path, "jobs", job.id))
+
+
+def test_submit_dedup_and_queue_full(manager):
+    first = manager.submit("video", cache_key="key")
+    # a retried /process of the same video and settings gets the same job
+    assert manager.submit("video", cache_key="key") is first
+    assert manager.submit("video") is not first
+    manager.max_queued = 0
+    with pytest.raises(jobs.JobQueueFull):
+        manager.submit("other")
+    done = manager.complete("cached", {"results": "key"})
+    assert done.status == jobs.DONE and manager.get(done.id) is done
+
+
+def test_listen_progress(manager):
+    job = jobs.Job("video")
+    manager._jobs[job.id] = job
+
+    async def watch():
+        changes = manager.watch(job.id)
+        assert (await changes.get())["status"] == jobs.QUEUED
+        manager._events.put((job.id, jobs.RUNNING, None))
+        manager._events.put((job.id, "stage", ("model", 1, 2)))
+        manager._events.put((job.id, "stage", ("model", 0, 2)))
+        manager._events.put((job.id, "outputs", {"stats": "jobs/x/stats.db"}))
+        seen = [await asyncio.wait_for(changes.get(), 10) for _ in range(4)]
+        manager.unwatch(job.id, changes)
+        return seen
+
+    running, half, back, outputs = asyncio.run(watch())
+    assert running["status"] == jobs.RUNNING and running["started"] is not None
+    assert half["stage"] == "model" and half["progress"] > 0
+    # progress never goes back
+    assert back["progress"] == half["progress"]
+    assert outputs["outputs"] == {"stats": "jobs/x/stats.db"}
+    assert asyncio.run(_no_watch(manager)) is None
+
+
+async def _no_watch(manager):
+    return manager.watch("unknown")
+
+
+def test_memory_storage_refused(monkeypatch):
+    monkeypatch.setenv("HOOPTRACKER_STORAGE", "memory://")
+    with pytest.raises(ValueError):
+        jobs.JobManager(warm=False)
@@ -0,0 +1,139 @@
+"""
+Fingerprints and hits and misses of the result cache, on LocalStorage
+"""
+import copy
+import os
+
+import pytest
+
+from api import result_cache
+from api.result_cache import MODEL_FILES, RESULT_FILES, ResultCache, fingerprints
+from api.storage import LocalStorage
+from args import DARGS
+
+
+@pytest.fixture
+def args():
+    return copy.deepcopy(DARGS)
+
+
+@pytest.mark.parametrize(
+    "key, value",
+    [("frame_reduction_factor", 3), ("quantize", "dynamic"), ("skip_big", False)],
+)
+def test_model_settings_change_both(args, key, value):
+    before = fingerprints(args)
+    args[key] = value
+    model, process = fingerprints(args)
+    # processed results come from the model outputs, so they change too
+    assert model != before[0] and process != before[1]
+
+
+@pytest.mark.parametrize(
+    "key, value", [("shot_window", 11), ("skip_court", True), ("filter_threshold", 5)]
+)
+def test_process_settings_change_process_only(args, key, value):
+    before = fingerprints(args)
+    assert args[key] != value
+    args[key] = value
+    model, process = fingerprints(args)
+    assert model == before[0] and process != before[1]
+
+
+@pytest.mark.parametrize(
+    "key, value",
+    [
+        ("video_file", "other.mp4"),
+        ("output", "elsewhere"),
+        ("video_workers", 3),
+        ("api_job_cpus", 1),
+        ("storage_threads", 2),
+        ("batch_workers", 4),
+        ("verbose", True),
+    ],
+)
+def test_paths_and_speed_change_nothing(args, key, value):
+    before = fingerprints(args)
+    args[key] = value
+    assert fingerprints(args) == before
+
+
+def test_weights_by_content(args, tmp_path):
+    weights = tmp_path / "best.pt"
+    weights.write_bytes(b"weights")
+    args["player_weights"] = str(weights)
+    before = fingerprints(args)
+    moved = tmp_path / "moved.pt"
+    moved.write_bytes(b"weights")
+    args["player_weights"] = str(moved)
+    assert fingerprints(args) == before
+    moved.write_bytes(b"retrained")
+    os.utime(moved, ns=(1, 1))  # a new mtime rehashes the file
+    assert fingerprints(args)[0] != before[0]
+
+
+def test_version_changes_both(args, monkeypatch):
+    before = fingerprints(args)
+    monkeypatch.setattr(result_cache, "CACHE_VERSION", result_cache.CACHE_VERSION + 1)
+    model, process = fingerprints(args)
+    assert model != before[0] and process != before[1]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(LocalStorage(str(tmp_path / "storage"), threads=1))
+
+
+def _outputs(tmp_path, kinds) -> dict:
+    "args with a file at the path of every output of kinds"
+    args = {}
+    for kind, arg in kinds.items():
+        args[arg] = str(tmp_path / f"{kind}.out")
+        with open(args[arg], "w") as f:
+            f.write(kind)
+    return args
+
+
+def test_results_hit_and_miss(cache, tmp_path):
+    assert cache.lookup_result("video", "fp") is None
+    args = _outputs(tmp_path, {k: arg for k, (arg, _) in RESULT_FILES.items()})
+    os.remove(args["processed_file"])  # e.g. skip_video
+    outputs = cache.store_result("video", "fp", args)
+
+    assert set(outputs) == set(RESULT_FILES) - {"video"}
+    assert cache.lookup_result("video", "fp") == outputs
+    assert cache.lookup_result("video", "other") is None
+    assert cache.lookup_result("other", "fp") is None
+    body = cache.store.open(outputs["stats"])
+    assert body.read() == b"stats"
+    body.close()
+
+
+def test_incomplete_entry_is_a_miss(cache, tmp_path):
+    args = _outputs(tmp_path, {k: arg for k, (arg, _) in RESULT_FILES.items()})
+    cache.store.upload_file(args["results_file"], "cache/result/video-fp/results.txt")
+    # manifest.json is written last, without it nothing was cached
+    assert cache.lookup_result("video", "fp") is None
+
+
+def test_model_hit_and_miss(cache, tmp_path):
+    args = _outputs(tmp_path, MODEL_FILES)
+    assert not cache.fetch_model("video", "fp", args)
+    cache.store_model("video", "fp", args)
+    fetched = {arg: str(tmp_path / f"fetched_{arg}") for arg in MODEL_FILES.values()}
+    assert cache.fetch_model("video", "fp", fetched)
+    for kind, arg in MODEL_FILES.items():
+        with open(fetched[arg]) as f:
+            assert f.read() == kind
+    assert not cache.fetch_model("video", "other", fetched)
+
+
+def test_inputs_and_links(cache):
+    assert cache.input_sha256("upload") is None
+    cache.set_input("upload", "abc")
+    assert cache.input_sha256("upload") == "abc"
+    assert cache.outputs("upload") is None
+    cache.link("upload", {"results": "cache/result/abc-fp/results.txt"})
+    assert cache.outputs("upload") == {"results": "cache/result/abc-fp/results.txt"}
+    cache.link("upload", {})
+    assert cache.outputs("upload") == {}
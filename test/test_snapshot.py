@@ -0,0 +1,103 @@
+"""
+Round trip of GameState frames through snapshot.write and snapshot.Snapshot
+"""
+import math
+
+import pytest
+
+pytest.importorskip("torch")  # state imports pose_estimation
+
+import snapshot
+from state import (
+    ActionType,
+    BallFrame,
+    Box,
+    Frame,
+    GameState,
+    Keypoint,
+    PlayerFrame,
+    todict,
+)
+
+
+def _frame(frameno: int) -> Frame:
+    "frame with players, ball candidates and possessions, some of them missing"
+    frame = Frame(frameno)
+    if frameno % 3:
+        frame.rim = Box(600, 100, 660, 140)
+    for i in range(frameno % 3):
+        pf = PlayerFrame(10 * i, 20, 10 * i + 50.5, 220)
+        pf.type = ActionType.DRIBBLE if i == 0 else None
+        pf.ballid = "ball_1" if i == 0 else -1
+        if frameno % 2:
+            pf.keypoints["nose"] = Keypoint(12.7, 30.2, 0.9)
+            pf.angles["left_elbow"] = 95
+        frame.players[f"player_{i}"] = pf
+    if frameno % 4:
+        candidate = BallFrame(300, 200, 320, 220.25, id="ball_1")
+        candidate.box.predicted = frameno % 4 == 3
+        if frameno % 4 != 1:  # no velocity on the first frame of a ball
+            candidate.vx, candidate.vy = 1.5, -2.0
+        frame.ball_candidates["ball_1"] = candidate
+        frame.ball = candidate
+        frame.possessions.append("player_0")
+    if frameno == 5:
+        # a ball that is not one of the candidates
+        frame.ball = BallFrame(1, 2, 3, 4, id=None)
+    return frame
+
+
+@pytest.fixture
+def written(tmp_path, monkeypatch):
+    "state of 10 frames written in blocks of 4, so reads cross block boundaries"
+    monkeypatch.setattr(snapshot, "BLOCK_FRAMES", 4)
+    state = GameState()
+    state.frames = [_frame(i) for i in range(10)]
+    path = str(tmp_path / "state.snap")
+    snapshot.write(state, path)
+    return state, path
+
+
+def test_frames_round_trip(written):
+    state, path = written
+    with snapshot.Snapshot(path) as snap:
+        assert len(snap) == 10
+        frames = snap.frames()
+    assert [todict(f) for f in frames] == [todict(f) for f in state.frames]
+
+
+def test_frames_across_blocks(written):
+    state, path = written
+    with snapshot.Snapshot(path, cached_blocks=1) as snap:
+        frames = snap.frames(3, 9)
+        assert [todict(f) for f in frames] == [todict(f) for f in state.frames[3:9]]
+        assert snap.frames(9, 20)[0].frameno == 9
+        assert snap.frames(10) == []
+
+
+def test_missing_values(written):
+    _, path = written
+    with snapshot.Snapshot(path) as snap:
+        frames = snap.frames()
+        arrays = snap.arrays(0, 2)
+        json_ready = snap.todict(0, 2)
+    assert frames[0].ball is None and frames[0].rim is None
+    assert frames[1].ball.vx is None and frames[1].ball.box.predicted is False
+    assert frames[3].ball.box.predicted is True
+    assert frames[2].players["player_1"].ballid == -1
+    assert frames[2].players["player_1"].type is None
+    assert frames[2].players["player_0"].keypoints == {}
+    assert frames[5].ball.ballid is None
+    # the ball stays the same object as its candidate
+    assert frames[2].ball is frames[2].ball_candidates["ball_1"]
+    assert math.isnan(arrays["frames"]["ball_velocity"][1][0])
+    assert arrays["frames"]["ball"][0] == -1
+    assert json_ready["frames"]["ball"] == [None, "ball_1"]
+    assert json_ready["frames"]["rim_box"][0] == [None] * 4
+
+
+def test_not_a_snapshot(tmp_path):
+    path = tmp_path / "state.snap"
+    path.write_bytes(b"\x00" * 64)
+    with pytest.raises(ValueError):
+        snapshot.Snapshot(str(path))
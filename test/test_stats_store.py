@@ -0,0 +1,134 @@
+"""
+Queries of a stats_store written from a small GameState
+"""
+import pytest
+
+pytest.importorskip("torch")  # state imports pose_estimation
+
+import stats_store
+from state import GameState, Interval, PlayerState, ShotAttempt, ShotType
+
+FPS = 10.0
+
+
+def _shot(player: str, start: int, end: int, type: ShotType) -> ShotAttempt:
+    shot = ShotAttempt(player, start, end)
+    shot.type, shot.made = type, type != ShotType.MISS
+    shot.frame = end if shot.made else None
+    return shot
+
+
+@pytest.fixture
+def store(tmp_path):
+    """
+    store of 100 frames: player_1 scores two and misses, player_3 takes the
+    rebound and assists the three of player_2
+    """
+    state = GameState()
+    state.frames = [None] * 100
+    for id in ("player_1", "player_2", "player_3"):
+        state.players[id] = PlayerState()
+        state.players[id].frames = 30
+    state.team1.players = {"player_1"}
+    state.team2.players = {"player_2", "player_3"}
+    state.shot_attempts = [
+        _shot("player_1", 10, 15, ShotType.TWO),
+        _shot("player_1", 50, 55, ShotType.MISS),
+        _shot("player_2", 80, 85, ShotType.THREE),
+    ]
+    state.possessions = [
+        Interval("player_1", 0, 15),
+        Interval("player_2", 20, 45),
+        Interval("player_1", 46, 55),
+        Interval("player_3", 58, 65),
+        Interval("player_2", 66, 85),
+        Interval("player_1", 86, 99),
+    ]
+    state.recompute_pass_from_possession()
+    state.populate_shot_stats()
+    state.populate_players_stats()
+    path = str(tmp_path / "stats.db")
+    stats_store.write(state, path, FPS)
+    return path
+
+
+def _passes(result) -> dict:
+    return {(p["from_player"], p["to_player"]): p["count"] for p in result["passes"]}
+
+
+def test_query_all(store):
+    result = stats_store.query(store)
+    assert result["general_stats"] == {"frames": 100, "fps": FPS, "duration": 10.0}
+    assert result["player_stats"]["player_1"]["points"] == 2
+    assert result["player_stats"]["player_2"]["team"] == 2
+    assert result["player_stats"]["player_3"]["assists"] == 1
+    assert result["player_stats"]["player_3"]["rebounds"] == 1
+    assert result["team_stats"]["Team 2"]["players"] == ["player_2", "player_3"]
+    assert result["team_stats"]["Team 2"]["points"] == 3
+    assert _passes(result) == {
+        ("player_1", "player_2"): 1,
+        ("player_2", "player_1"): 2,
+        ("player_1", "player_3"): 1,
+        ("player_3", "player_2"): 1,
+    }
+    assert [s["start"] for s in result["shots"]] == [10, 50, 80]
+    assert [s["time"] for s in result["shots"]] == [1.0, 5.0, 8.0]
+    assert [s["assist"] for s in result["shots"]] == [None, None, "player_3"]
+    assert [s["rebound"] for s in result["shots"]] == [None, "player_3", None]
+    assert len(result["possessions"]) == 6
+
+
+def test_query_player(store):
+    result = stats_store.query(store, player="player_2")
+    assert list(result["player_stats"]) == ["player_2"]
+    assert result["player_stats"]["player_2"]["field_goals"] == 1
+    assert [s["player_id"] for s in result["shots"]] == ["player_2"]
+    assert [p["start"] for p in result["possessions"]] == [20, 66]
+    assert len(result["passes"]) == 3
+
+
+def test_query_time(store):
+    # seconds 0 to 5.2 hold the made two and the miss of player_1
+    result = stats_store.query(store, start=0, end=5.2)
+    assert [s["start"] for s in result["shots"]] == [10, 50]
+    assert [p["start"] for p in result["possessions"]] == [0, 20, 46]
+    player_1 = result["player_stats"]["player_1"]
+    assert player_1["field_goals_attempted"] == 2
+    assert player_1["field_goals"] == 1
+    assert player_1["points"] == 2
+    assert player_1["field_goal_percentage"] == 0.5
+    # totals are recounted over the range, player_2 has no shot inside it
+    player_2 = result["player_stats"]["player_2"]
+    assert player_2["field_goals_attempted"] == 0
+    assert player_2["points"] == 0
+    assert player_2["field_goal_percentage"] == 0.0
+    # the rebound of the miss is inside the range, the assist of the three is not
+    assert result["player_stats"]["player_3"]["rebounds"] == 1
+    assert result["player_stats"]["player_3"]["assists"] == 0
+    assert result["team_stats"]["Team 1"]["shots_attempted"] == 2
+    assert result["team_stats"]["Team 1"]["points"] == 2
+    assert result["team_stats"]["Team 2"]["shots_attempted"] == 0
+    # passes received by possessions starting in the range
+    assert _passes(result) == {("player_1", "player_2"): 1, ("player_2", "player_1"): 1}
+
+
+def test_filtered_schema_matches(store):
+    whole = stats_store.query(store)
+    for result in (
+        stats_store.query(store, start=0, end=5.2),
+        stats_store.query(store, player="player_3", start=4.0, end=10.0),
+    ):
+        for key in ("player_stats", "team_stats"):
+            expected = list(next(iter(whole[key].values())))
+            assert all(list(row) == expected for row in result[key].values())
+        assert all(list(p) == list(whole["passes"][0]) for p in result["passes"])
+        assert result["passes"]
+
+
+def test_query_player_and_time(store):
+    result = stats_store.query(store, player="player_1", start=4.0, end=10.0)
+    assert list(result["player_stats"]) == ["player_1"]
+    assert result["player_stats"]["player_1"]["field_goals_attempted"] == 1
+    assert result["player_stats"]["player_1"]["points"] == 0
+    assert [s["start"] for s in result["shots"]] == [50]
+    assert [p["start"] for p in result["possessions"]] == [46, 86]
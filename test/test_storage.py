@@ -0,0 +1,122 @@
+"""
+Local, in-memory and S3 object stores
+"""
+import hashlib
+import io
+import os
+
+import pytest
+
+from api import storage
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture(params=["local", "memory"])
+def store(request, tmp_path):
+    if request.param == "local":
+        return storage.LocalStorage(str(tmp_path / "storage"), threads=2)
+    return storage.MemoryStorage(threads=2)
+
+
+def test_round_trip(store, tmp_path):
+    digest = store.upload_fileobj(io.BytesIO(DATA), "videos/a.mp4")
+    assert digest == hashlib.sha256(DATA).hexdigest()
+    assert store.size("videos/a.mp4") == len(DATA)
+    assert store.exists("videos/a.mp4") and not store.exists("videos/b.mp4")
+    path = str(tmp_path / "a.mp4")
+    store.download_file("videos/a.mp4", path)
+    assert storage.file_sha256(path) == digest
+    with pytest.raises(FileNotFoundError):
+        store.download_file("videos/b.mp4", path)
+
+
+def test_open_ranges(store):
+    store.upload_fileobj(io.BytesIO(DATA), "a")
+    body = store.open("a", 10, 19)
+    assert body.read() == DATA[10:20]
+    body.close()
+    body = store.open("a", len(DATA) - 5)
+    assert body.read(3) == DATA[-5:-2] and body.read() == DATA[-2:]
+    body.close()
+    # ends past the object are cut at its last byte
+    assert store.open("a", 0, len(DATA) + 100).read() == DATA
+    assert store.open("a", 5, 4).read() == b""
+    with pytest.raises(FileNotFoundError):
+        store.open("b")
+
+
+def test_async_transfers(store, tmp_path):
+    import asyncio
+
+    async def transfer():
+        digest = await store.aupload_fileobj(io.BytesIO(DATA), "a")
+        await store.adownload_file("a", str(tmp_path / "a"))
+        return digest, await store.asize("a")
+
+    digest, size = asyncio.run(transfer())
+    assert digest == hashlib.sha256(DATA).hexdigest() and size == len(DATA)
+
+
+def test_local_checksum_mismatch(tmp_path):
+    store = storage.LocalStorage(str(tmp_path / "storage"), threads=1)
+    store.upload_fileobj(io.BytesIO(DATA), "a")
+    with open(os.path.join(store.root, "a"), "r+b") as f:
+        f.write(b"corrupt")
+    with pytest.raises(storage.ChecksumMismatch):
+        store.download_file("a", str(tmp_path / "a"))
+
+
+def test_local_keys_stay_in_root(tmp_path):
+    store = storage.LocalStorage(str(tmp_path / "storage"), threads=1)
+    (tmp_path / "secret.mp4").write_bytes(b"secret")
+    for key in ("../secret.mp4", "a/../../secret.mp4", str(tmp_path / "secret.mp4"), "."):
+        with pytest.raises(ValueError):
+            store.download_file(key, str(tmp_path / "copy"))
+    with pytest.raises(ValueError):
+        store.upload_fileobj(io.BytesIO(DATA), "../escaped")
+    assert not (tmp_path / "escaped").exists()
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    "S3Storage whose client answers from a botocore Stubber"
+    pytest.importorskip("boto3")
+    from botocore.stub import Stubber
+
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    store = storage.S3Storage("bucket", threads=1)
+    with Stubber(store._client) as stubber:
+        yield store, stubber
+        stubber.assert_no_pending_responses()
+
+
+def _body(data: bytes):
+    from botocore.response import StreamingBody
+
+    return StreamingBody(io.BytesIO(data), len(data))
+
+
+def test_s3_open_ranges(s3):
+    store, stubber = s3
+    for start, end, byte_range in ((2, 9, "bytes=2-9"), (5, None, "bytes=5-")):
+        data = DATA[start : None if end is None else end + 1]
+        stubber.add_response(
+            "get_object",
+            {"Body": _body(data)},
+            {"Bucket": "bucket", "Key": "a", "Range": byte_range},
+        )
+        assert store.open("a", start, end).read() == data
+
+
+def test_s3_missing(s3):
+    store, stubber = s3
+    stubber.add_client_error("get_object", "NoSuchKey", http_status_code=404)
+    with pytest.raises(FileNotFoundError):
+        store.open("a")
+    stubber.add_client_error("head_object", "404", http_status_code=404)
+    assert not store.exists("a")
+    stubber.add_response("head_object", {"ContentLength": 7}, {"Bucket": "bucket", "Key": "a"})
+    assert store.size("a") == 7
@@ -0,0 +1,77 @@
+"""
+Range parsing and streamed zips and files of the backend
+"""
+import io
+import zipfile
+
+import pytest
+
+from api import streaming
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("", None),
+        ("bytes=0-99", (0, 99)),
+        ("bytes=500-", (500, 999)),  # open range, to the end
+        ("bytes=900-5000", (900, 999)),  # end cut at the last byte
+        ("bytes=-100", (900, 999)),  # suffix range, the last 100 bytes
+        ("bytes=-5000", (0, 999)),
+        ("bytes=0-1, 5-6", (0, 1)),  # only the first range is served
+        (" bytes=999-999 ", (999, 999)),
+    ],
+)
+def test_parse_range(header, expected):
+    assert streaming.parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize(
+    "header",
+    ["bytes=1000-", "bytes=5-2", "bytes=-", "items=0-1", "bytes=a-b", "bytes=-0"],
+)
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        streaming.parse_range(header, 1000)
+
+
+class _Body(io.BytesIO):
+    "BytesIO remembering it was closed"
+
+    def close(self) -> None:
+        self.was_closed = True
+        super().close()
+
+
+def test_read_chunks():
+    body = _Body(b"x" * 10)
+    assert list(streaming.read_chunks(body, chunk_size=4)) == [b"xxxx", b"xxxx", b"xx"]
+    assert body.was_closed
+
+
+def test_zip_stream():
+    video, results = bytes(range(256)) * 100, b"player_1 scored\n" * 100
+    entries = [
+        ("video.mp4", (video[i : i + 1000] for i in range(0, len(video), 1000)), False),
+        ("results.txt", [results], True),
+        ("empty.txt", [], True),
+    ]
+    chunks = list(streaming.zip_stream(entries))
+    assert len(chunks) > 2  # sent while it is built, not at once
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.read("video.mp4") == video
+        assert zf.read("results.txt") == results
+        assert zf.read("empty.txt") == b""
+        assert zf.getinfo("video.mp4").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("results.txt").compress_type == zipfile.ZIP_DEFLATED
+        assert zf.testzip() is None
+
+
+def test_file_range(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(bytes(range(100)))
+    chunks = list(streaming.file_range(str(path), 10, 29, chunk_size=8))
+    assert [len(c) for c in chunks] == [8, 8, 4]
+    assert b"".join(chunks) == bytes(range(10, 30))
+    assert b"".join(streaming.file_range(str(path), 90, 200)) == bytes(range(90, 100))
@@ -0,0 +1,139 @@
+"""
+Rendering of processed videos, serially and in segments
+"""
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")  # state imports pose_estimation
+pytest.importorskip("ffmpy")
+cv2 = pytest.importorskip("cv2")
+
+from processing import video
+from state import (
+    BallFrame,
+    Frame,
+    GameState,
+    Interval,
+    Keypoint,
+    PlayerFrame,
+    ShotAttempt,
+)
+
+FRAMES, SIZE = 40, (160, 120)
+
+
+@pytest.fixture
+def clip(tmp_path):
+    "MJPG clip of FRAMES frames, different in every frame, exactly seekable"
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, SIZE)
+    for i in range(FRAMES):
+        frame = np.full((SIZE[1], SIZE[0], 3), i * 6, dtype=np.uint8)
+        frame[:, : i * 4, 2] = 255
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+@pytest.fixture
+def state():
+    "players, ball and rim in every other frame, a shot and possessions across segments"
+    state = GameState()
+    for f in range(1, FRAMES + 1, 2):
+        frame = Frame(f)
+        for i, id in enumerate(("player_1", "player_2")):
+            player = PlayerFrame(10 + 60 * i, 20 + f, 50 + 60 * i, 90)
+            player.keypoints = {"nose": Keypoint(30 + 60 * i, 25 + f, 0.9)}
+            frame.players[id] = player
+        frame.ball = BallFrame(f * 3, 10, f * 3 + 8, 18)
+        frame.rim = PlayerFrame(120, 5, 150, 15).box
+        state.frames.append(frame)
+    state.team1.players, state.team2.players = {"player_1"}, {"player_2"}
+    state.shot_attempts = [ShotAttempt("player_1", 10, 18)]
+    state.possessions = [Interval("player_1", 1, 18), Interval("player_2", 25, 36)]
+    return state
+
+
+class _Recording:
+    "VideoSink keeping the frames written to every path, and the paths released"
+    frames, released = {}, set()
+
+    def __init__(self, filename, fps, size, **encoding):
+        self.filename = filename
+        _Recording.frames[filename] = []
+
+    def write(self, frame):
+        _Recording.frames[self.filename].append(frame.copy())
+
+    def release(self):
+        _Recording.released.add(self.filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def test_segments_draw_like_serial(clip, state, monkeypatch):
+    monkeypatch.setattr(video, "VideoSink", _Recording)
+    creator = video.VideoCreator(state, clip, "out.mp4")
+    assert creator.render_range(cv2.VideoCapture(clip), 0, None, "serial") == FRAMES
+    bounds = [0, 13, 27, None]
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        creator = video.VideoCreator(state, clip, "out.mp4")
+        creator.render_range(cv2.VideoCapture(clip), start, end, f"segment{start}")
+    segmented = sum((_Recording.frames[f"segment{s}"] for s in bounds[:-1]), [])
+    serial = _Recording.frames["serial"]
+    assert len(segmented) == len(serial) == FRAMES
+    for i, (a, b) in enumerate(zip(serial, segmented)):
+        assert np.array_equal(a, b), f"frame {i + 1} differs"
+
+
+def test_sink_released_when_drawing_fails(clip, state, monkeypatch):
+    monkeypatch.setattr(video, "VideoSink", _Recording)
+    creator = video.VideoCreator(state, clip, "out.mp4")
+
+    def draw_boxes(*args, **kwargs):
+        raise RuntimeError("drawing failed")
+
+    monkeypatch.setattr(creator, "draw_boxes", draw_boxes)
+    with pytest.raises(RuntimeError):
+        creator.render_range(cv2.VideoCapture(clip), 0, None, "failing")
+    assert "failing" in _Recording.released
+
+
+def _read(path: str) -> list:
+    cap = cv2.VideoCapture(path)
+    frames = []
+    ret, frame = cap.read()
+    while ret:
+        frames.append(frame)
+        ret, frame = cap.read()
+    cap.release()
+    return frames
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_segmented_video_matches_serial(clip, state, tmp_path, monkeypatch):
+    # headless OpenCV builds have no windows to destroy
+    monkeypatch.setattr(video.cv2, "destroyAllWindows", lambda: None)
+    lossless = {"crf": 0}
+    serial = video.VideoCreator(state, clip, str(tmp_path / "serial.mp4"), lossless, 1)
+    serial.run()
+    segmented = video.VideoCreator(
+        state, clip, str(tmp_path / "segmented.mp4"), lossless, 3
+    )
+    segmented.MIN_SEGMENT_FRAMES = 10
+    progress = []
+    segmented.run(on_frame=lambda done, total: progress.append(done))
+    assert len(progress) == 3 and progress[-1] == FRAMES  # one call per segment
+
+    a, b = _read(serial.output_path), _read(segmented.output_path)
+    assert len(a) == len(b) == FRAMES
+    for i, (x, y) in enumerate(zip(a, b)):
+        assert np.array_equal(x, y), f"frame {i + 1} differs"
+    assert not [p for p in os.listdir(tmp_path) if p.startswith("tmp")]
@@ -0,0 +1,49 @@
+"""
+H.264 video sink streaming frames into ffmpeg
+"""
+import shutil
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from processing.video_sink import VideoSink
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None, reason="ffmpeg not installed"
+)
+SIZE = (64, 48)
+
+
+def _frames(n: int) -> list:
+    return [np.full((SIZE[1], SIZE[0], 3), 20 * i, dtype=np.uint8) for i in range(n)]
+
+
+@pytest.mark.parametrize(
+    "name",
+    ["clip.mp4", "a dir/my clip.mp4", "it's.mp4", "it's \"a\" clip.mp4", "a\\b.mp4"],
+)
+def test_write_and_read_back(tmp_path, name):
+    path = tmp_path / name
+    path.parent.mkdir(exist_ok=True)
+    with VideoSink(str(path), 10, SIZE, crf=0) as sink:
+        for frame in _frames(5):
+            sink.write(frame)
+    cap = cv2.VideoCapture(str(path))
+    read = []
+    ret, frame = cap.read()
+    while ret:
+        read.append(frame)
+        ret, frame = cap.read()
+    cap.release()
+    assert len(read) == 5 and read[0].shape == (SIZE[1], SIZE[0], 3)
+    assert abs(read[4].mean() - 80) < 5  # yuv420p rounds colors
+
+
+def test_wrong_size(tmp_path):
+    sink = VideoSink(str(tmp_path / "clip.mp4"), 10, SIZE)
+    with pytest.raises(ValueError):
+        sink.write(np.zeros((SIZE[0], SIZE[1], 3), dtype=np.uint8))
+    sink.release()
+    sink.release()  # releasing twice is harmless